@@ -0,0 +1,258 @@
+import os
+import sys
+import time
+import asyncio
+import logging
+
+import aiohttp
+
+from irrigation_controller import MANUAL_CHECK_INTERVAL, AUTO_CHECK_INTERVAL, SensorDataUnavailable
+
+ASYNC_CONCURRENCY = int(os.getenv("ASYNC_CONCURRENCY", "64"))
+REQUEST_TIMEOUT = 10
+
+
+class AsyncThingSpeakInterface:
+    """Asyncio twin of ThingSpeakInterface; reuses its URLs and parsing."""
+
+    def __init__(self, thingspeak, session):
+        self.thingspeak = thingspeak
+        self.session = session
+
+    async def _get_json(self, url):
+        async with self.session.get(url) as response:
+            response.raise_for_status()
+            return await response.json(content_type=None)
+
+    async def read_latest_feed(self):
+        try:
+            data = await self._get_json(self.thingspeak.feed_url)
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            logging.error(f"Error reading feed from ThingSpeak channel {self.thingspeak.channel_id}: {e}")
+            return None
+        return self.thingspeak.merge_feeds(data)
+
+    async def read_sensor_data(self, feed=None):
+        """Read latest sensor data from ThingSpeak channel."""
+        if feed is not None:
+            return self.thingspeak.parse_sensor_fields(feed)
+        try:
+            data = await self._get_json(self.thingspeak.read_url)
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            logging.error(f"Error reading from ThingSpeak channel {self.thingspeak.channel_id}: {e}")
+            return None
+        if not data or not data.get('feeds'):
+            logging.warning("No data available from ThingSpeak")
+            return None
+        return self.thingspeak.parse_sensor_fields(data['feeds'][-1])
+
+    async def check_manual_irrigation(self, feed=None):
+        """Check if manual irrigation is requested via ThingSpeak."""
+        if feed is None and self.thingspeak.single_request:
+            feed = await self.read_latest_feed()
+            if feed is None:
+                return False, 0
+        if feed is not None:
+            return self.thingspeak.parse_manual_fields(feed)
+        try:
+            control_data = await self._get_json(self.thingspeak.manual_control_url)
+            if int(float(control_data.get('field5', '0') or 0)) != 1:
+                return False, 0
+            value_data = await self._get_json(self.thingspeak.manual_value_url)
+            return True, float(value_data.get('field6', '0') or 0)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logging.error(f"Error checking manual irrigation: {e}")
+            return False, 0
+
+    async def write_irrigation_command(self, water_amount, is_manual=False):
+        """Write irrigation command to ThingSpeak channel."""
+        payload = self.thingspeak.command_payload(water_amount, is_manual)
+        try:
+            async with self.session.post(self.thingspeak.write_url, data=payload) as response:
+                if response.status == 200:
+                    mode = "Manual" if is_manual else "Automatic"
+                    logging.info(f"Sent {mode} irrigation command: {water_amount:.2f} liters")
+                    return True
+                logging.error(f"ThingSpeak write error: Status code {response.status}")
+                return False
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logging.error(f"Error writing to ThingSpeak: {e}")
+            return False
+
+
+class AsyncWeatherService:
+    """Asyncio front end for a WeatherService; shares its cache and persistence."""
+
+    def __init__(self, weather, session):
+        self.weather = weather
+        self.session = session
+        self._lock = asyncio.Lock()
+        self._refresh_task = None
+
+    async def _fetch_forecast(self):
+        try:
+            async with self.session.get(self.weather.api_url) as response:
+                if response.status != 200:
+                    raise Exception(f"API returned status code {response.status}")
+                data = await response.json(content_type=None)
+            return self.weather.parse_forecast(data)
+        except Exception as e:
+            logging.error(f"Weather API error: {e}")
+            return {"rainfall_1d": 0, "rainfall_3d": 0, "success": False}
+
+    async def refresh(self, force=True):
+        """Fetch a new forecast, with the same reuse and failure TTL as WeatherService.refresh."""
+        requested = time.monotonic()
+        async with self._lock:
+            reused = self.weather.reusable_result(requested, force)
+            if reused is not None:
+                return reused
+            forecast = await self._fetch_forecast()
+            self.weather.record_attempt(forecast)
+        return dict(forecast)
+
+    async def get_forecast(self):
+        """Return the cached forecast, refreshing it in the background when stale."""
+        age = self.weather.cache_age()
+        if age is not None and age < self.weather.ttl:
+            return self.weather.cached_forecast()
+        if age is not None and age < self.weather.max_stale:
+            if not self.weather.recently_failed() and (self._refresh_task is None or self._refresh_task.done()):
+                self._refresh_task = asyncio.ensure_future(self.refresh())
+            return self.weather.cached_forecast()
+        return await self.refresh(force=False)
+
+
+class AsyncFleetController:
+    """Polls every zone of a FleetController from one event loop.
+
+    The zones' controllers, model, forecast caches and log files are reused;
+    only network I/O moves onto aiohttp, with at most ``concurrency``
+    channels in flight at once.
+    """
+
+    def __init__(self, fleet, concurrency=ASYNC_CONCURRENCY):
+        self.fleet = fleet
+        self.concurrency = concurrency
+        self.session = None
+        self.zones = {}
+        self._semaphore = None
+        self._stopped = None
+
+    async def _open(self):
+        connector = aiohttp.TCPConnector(limit=self.concurrency, keepalive_timeout=60)
+        timeout = aiohttp.ClientTimeout(total=REQUEST_TIMEOUT)
+        self.session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._stopped = asyncio.Event()
+        weather_services = {}
+        for zone_id, controller in self.fleet.controllers.items():
+            key = id(controller.weather)
+            if key not in weather_services:
+                weather_services[key] = AsyncWeatherService(controller.weather, self.session)
+            self.zones[zone_id] = (controller, AsyncThingSpeakInterface(controller.thingspeak, self.session),
+                                   weather_services[key])
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def _in_executor(self, func, *args):
+        # Model inference, log, rollup and event writes and alert queueing can block; keep them off the loop
+        return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+    async def _alert(self, controller, message):
+        await self._in_executor(controller.alert, message)
+
+    async def run_cycle(self, zone_id):
+        controller, thingspeak, weather = self.zones[zone_id]
+        sensor_data = await thingspeak.read_sensor_data()
+        if not sensor_data:
+            raise SensorDataUnavailable("Sensor data not received from ThingSpeak!")
+        # Publishes the reading to /stream if it changed
+        await self._in_executor(controller.sensor_cache.store, sensor_data)
+        weather_data = await weather.get_forecast()
+        final_water, log_data = await self._in_executor(controller.decide, sensor_data, weather_data)
+        if final_water > 0:
+            await thingspeak.write_irrigation_command(final_water, is_manual=False)
+        await self._in_executor(controller.log_data, log_data)
+        await self._in_executor(controller.publish_decision, log_data)
+
+    async def handle_manual_request(self, zone_id):
+        controller, thingspeak, _ = self.zones[zone_id]
+        feed = await thingspeak.read_latest_feed() if thingspeak.thingspeak.single_request else None
+        if thingspeak.thingspeak.single_request and feed is None:
+            return False
+        manual_mode, water_amount = await thingspeak.check_manual_irrigation(feed=feed)
+        if not (manual_mode and water_amount > 0):
+            return False
+        logging.info(f"[{zone_id}] Manual irrigation requested: {water_amount:.2f} liters")
+        success = await thingspeak.write_irrigation_command(water_amount, is_manual=True)
+        await self._in_executor(controller.publish_manual, water_amount, success)
+        if success:
+            sensor_data = await thingspeak.read_sensor_data(feed=feed) or {}
+            await self._in_executor(controller.log_data, controller.manual_log_entry(water_amount, sensor_data))
+            await self._alert(controller, f"Manual irrigation completed: {water_amount:.2f} liters")
+        return True
+
+    async def _guarded(self, zone_id, job):
+        async with self._semaphore:
+            try:
+                await job(zone_id)
+                return True
+            except SensorDataUnavailable as e:
+                await self._alert(self.zones[zone_id][0], str(e))
+            except Exception as e:
+                logging.error(f"[{zone_id}] {job.__name__} failed: {e}")
+                await self._alert(self.zones[zone_id][0], f"System error: {str(e)}")
+            return False
+
+    async def poll_all(self, job):
+        """Run ``job`` for every zone concurrently; returns (succeeded, failed)."""
+        results = await asyncio.gather(*(self._guarded(zone_id, job) for zone_id in self.zones))
+        succeeded = sum(results)
+        return succeeded, len(results) - succeeded
+
+    async def _every(self, interval, job):
+        next_run = time.monotonic()
+        while not self._stopped.is_set():
+            started = time.monotonic()
+            succeeded, failed = await self.poll_all(job)
+            logging.info(f"{job.__name__}: {succeeded} zones ok, {failed} failed "
+                         f"in {time.monotonic() - started:.2f}s")
+            next_run += interval
+            if next_run <= time.monotonic():
+                # Overran the interval; skip missed rounds instead of bunching them
+                next_run = time.monotonic() + interval
+            try:
+                await asyncio.wait_for(self._stopped.wait(), timeout=next_run - time.monotonic())
+            except asyncio.TimeoutError:
+                pass
+
+    async def run(self):
+        await self._open()
+        logging.info(f"GreenGuard async fleet polling {len(self.zones)} zones, "
+                     f"concurrency {self.concurrency}")
+        try:
+            await asyncio.gather(
+                self._every(MANUAL_CHECK_INTERVAL, self.handle_manual_request),
+                self._every(AUTO_CHECK_INTERVAL, self.run_cycle),
+            )
+        finally:
+            await self.close()
+
+    def stop(self):
+        if self._stopped is not None:
+            self._stopped.set()
+
+
+if __name__ == "__main__":
+    from fleet import ZONES_FILE, ZoneRegistry, FleetController
+
+    zones_file = sys.argv[1] if len(sys.argv) > 1 else ZONES_FILE
+    registry = ZoneRegistry(zones_file) if os.path.exists(zones_file) else ZoneRegistry.default()
+    try:
+        asyncio.run(AsyncFleetController(FleetController(registry)).run())
+    except KeyboardInterrupt:
+        logging.info("Async fleet stopped by user")
@@ -0,0 +1,260 @@
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+import platform
+import tempfile
+import importlib.util
+from datetime import datetime
+
+import numpy as np
+
+# Offline micro-benchmarks for the controller's hot paths. Upstreams are
+# replaced by canned ThingSpeak/OpenWeather payloads and the Flask handlers
+# run through the test client, so results depend only on this machine.
+#   python benchmarks.py [--iterations N] [--only predict] [--save] [--compare]
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT_MAIN = os.path.join(os.path.dirname(HERE), "main.py")
+BENCHMARK_BASELINE = os.getenv("BENCHMARK_BASELINE", os.path.join(HERE, "benchmark_baseline.json"))
+DEFAULT_ITERATIONS = 2000
+# A benchmark whose p50 grows by more than this fraction over the baseline is a regression
+REGRESSION_THRESHOLD = 0.20
+# ...and by at least this much, so timer noise on sub-microsecond calls is not flagged
+MIN_REGRESSION_US = 1.0
+
+THINGSPEAK_FEED = {
+    "channel": {"id": 2300946, "name": "GreenGuard", "last_entry_id": 1042},
+    "feeds": [
+        {"created_at": "2025-02-25T06:40:12Z", "entry_id": 1041, "field1": "41.0", "field2": "29.3",
+         "field3": "58", "field4": "840", "field5": "0", "field6": "0"},
+        {"created_at": "2025-02-25T06:40:42Z", "entry_id": 1042, "field1": "40.6", "field2": "29.4",
+         "field3": "57", "field4": "836", "field5": "0", "field6": "0"},
+    ],
+}
+MANUAL_FIELD = {"created_at": "2025-02-25T06:40:42Z", "entry_id": 1042, "field5": "0", "field6": "0"}
+# Five days of 3-hourly entries, rain in a few of them, like OpenWeather's /forecast
+FORECAST = {
+    "cod": "200",
+    "cnt": 40,
+    "list": [
+        dict({"dt": 1740466800 + i * 10800, "main": {"temp": 24.0 + i % 8, "humidity": 60}},
+             **({"rain": {"3h": round(0.3 * (i % 5), 2)}} if i % 3 == 0 else {}))
+        for i in range(40)
+    ],
+}
+READING = {"soil_moisture": 41.0, "temperature": 29.3, "humidity": 58, "raindrop": 17.9}
+
+
+class CannedResponse:
+    def __init__(self, payload, status_code=200):
+        self.payload = payload
+        self.status_code = status_code
+        # Parsing is part of what is measured, so keep the body as text
+        self.text = json.dumps(payload)
+
+    def json(self):
+        return json.loads(self.text)
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise RuntimeError(f"HTTP {self.status_code}")
+
+
+class CannedTransport:
+    """Stands in for HttpTransport, answering every URL from the canned payloads."""
+
+    def __init__(self):
+        self.requests = 0
+
+    def get(self, url, **kwargs):
+        self.requests += 1
+        if "forecast" in url:
+            return CannedResponse(FORECAST)
+        if "last.json" in url:
+            return CannedResponse(MANUAL_FIELD)
+        return CannedResponse(THINGSPEAK_FEED)
+
+    def post(self, url, **kwargs):
+        self.requests += 1
+        return CannedResponse(1043)
+
+
+def summarize(samples_ns, wall_seconds):
+    samples = np.asarray(samples_ns, dtype=np.float64) / 1000.0
+    return {
+        "iterations": len(samples),
+        "mean_us": round(float(samples.mean()), 3),
+        "p50_us": round(float(np.percentile(samples, 50)), 3),
+        "p95_us": round(float(np.percentile(samples, 95)), 3),
+        "p99_us": round(float(np.percentile(samples, 99)), 3),
+        "max_us": round(float(samples.max()), 3),
+        "ops_per_sec": round(len(samples) / wall_seconds, 1) if wall_seconds else None,
+    }
+
+
+def measure(fn, iterations, warmup=None):
+    """Time each call of ``fn`` separately; returns the latency/throughput summary."""
+    for _ in range(warmup if warmup is not None else max(1, iterations // 10)):
+        fn()
+    samples = np.empty(iterations, dtype=np.int64)
+    clock = time.perf_counter_ns
+    started = clock()
+    for i in range(iterations):
+        t0 = clock()
+        fn()
+        samples[i] = clock() - t0
+    return summarize(samples, (clock() - started) / 1e9)
+
+
+def _load_root_app():
+    """Import the dashboard API in ../main.py, which serves /history."""
+    sys.path.insert(0, os.path.dirname(ROOT_MAIN))
+    spec = importlib.util.spec_from_file_location("dashboard_main", ROOT_MAIN)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def build_cases(workdir):
+    """Set up the controller against canned upstreams and return {name: (fn, iterations scale)}."""
+    import irrigation_controller as ic
+
+    transport = CannedTransport()
+    model = ic.IrrigationModel(compiled_path=os.path.join(workdir, "bench.forest"))
+    thingspeak = ic.ThingSpeakInterface(ic.THINGSPEAK_READ_URL, ic.THINGSPEAK_WRITE_URL, "bench",
+                                        transport=transport)
+    weather = ic.WeatherService(ic.WEATHER_URL, cache_file=None, transport=transport)
+    notifier = ic.NotificationService("bench@example.com", "", "")
+    controller = ic.IrrigationController(crop_type="wheat", model=model, thingspeak=thingspeak, weather=weather,
+                                         notifier=notifier, log_file=os.path.join(workdir, "bench_log.csv"))
+    # The API builds its controller lazily; hand it the benchmark one instead
+    ic._controller = controller
+    client = ic.create_app().test_client()
+
+    features = [[READING["soil_moisture"], READING["temperature"], READING["humidity"], 2.1, 5.4,
+                 READING["raindrop"]]]
+    rows = np.random.default_rng(0).uniform(0, 80, (100, 6)).tolist()
+    feed = thingspeak.merge_feeds(THINGSPEAK_FEED)
+    _, log_row = controller.decide(thingspeak.parse_sensor_fields(feed), weather.get_forecast())
+    batch = {"readings": [dict(READING, soil_moisture=20 + i % 60) for i in range(50)]}
+
+    cases = {
+        "model.predict": (lambda: model.predict(features), 1),
+        "model.predict_batch[100]": (lambda: model.predict_batch(rows), 0.1),
+        "controller.offline_prediction": (lambda: controller.offline_prediction(41.0, 29.3, 58, 17.9), 10),
+        "controller.adjust_for_rainfall": (lambda: controller.adjust_for_rainfall(12.5, 2.1, 5.4), 10),
+        "controller.decide": (lambda: controller.decide(READING, weather.get_forecast()), 1),
+        "controller.log_data": (lambda: controller.log_data(log_row), 1),
+        "thingspeak.read_sensor_data": (thingspeak.read_sensor_data, 1),
+        "thingspeak.merge_feeds": (lambda: thingspeak.merge_feeds(THINGSPEAK_FEED), 10),
+        "weather.parse_forecast": (lambda: weather.parse_forecast(FORECAST), 10),
+        "flask POST /predict": (lambda: client.post("/predict", json=READING), 0.5),
+        "flask POST /predict-batch[50]": (lambda: client.post("/predict-batch", json=batch), 0.1),
+    }
+
+    try:
+        dashboard = _load_root_app()
+        for day in range(500):
+            dashboard.history.add({"date": f"2024-{1 + day // 28 % 12:02d}-{1 + day % 28:02d}",
+                                   "actual_water": 40 + day % 15, "predicted_water": 38 + day % 13})
+        dashboard.history.flush()
+        history_client = dashboard.app.test_client()
+        cases["flask GET /history"] = (lambda: history_client.get("/history?limit=100"), 0.5)
+    except Exception as e:
+        logging.warning(f"Skipping /history benchmark, could not load {ROOT_MAIN}: {e}")
+    return cases
+
+
+def run(iterations=DEFAULT_ITERATIONS, only=None):
+    workdir = tempfile.mkdtemp(prefix="greenguard-bench-")
+    cwd = os.getcwd()
+    # Model registry, rollups, history and logs all default to relative paths; keep them out of the tree
+    os.environ.setdefault("HISTORY_DB", os.path.join(workdir, "history.db"))
+    os.chdir(workdir)
+    sys.path.insert(0, HERE)
+    try:
+        cases = build_cases(workdir)
+        results = {}
+        for name, (fn, scale) in cases.items():
+            if only and not any(part in name for part in only):
+                continue
+            results[name] = measure(fn, max(10, int(iterations * scale)))
+            print(f"{name:<34}{results[name]['p50_us']:>10.1f}{results[name]['p95_us']:>10.1f}"
+                  f"{results[name]['p99_us']:>10.1f}{results[name]['ops_per_sec']:>12.0f}")
+        return results
+    finally:
+        # Flush and close the stores while their files still exist, not from atexit after the rmtree
+        for name in ("log_writer", "rollups", "history_store"):
+            if name in sys.modules:
+                sys.modules[name].close_all()
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def environment():
+    import sklearn
+    import flask
+    return {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "cpus": os.cpu_count(),
+        "numpy": np.__version__,
+        "sklearn": sklearn.__version__,
+        "flask": flask.__version__ if hasattr(flask, "__version__") else None,
+    }
+
+
+def compare(results, baseline, threshold=REGRESSION_THRESHOLD):
+    """Print p50/p99 changes against a saved baseline; returns the names that regressed."""
+    regressions = []
+    print(f"\n{'benchmark':<34}{'p50 base':>10}{'p50 now':>10}{'change':>9}{'p99 change':>12}")
+    for name, now in results.items():
+        base = baseline.get("results", {}).get(name)
+        if base is None:
+            print(f"{name:<34}{'-':>10}{now['p50_us']:>10.1f}{'new':>9}")
+            continue
+        change = now["p50_us"] / base["p50_us"] - 1 if base["p50_us"] else 0.0
+        tail = now["p99_us"] / base["p99_us"] - 1 if base["p99_us"] else 0.0
+        flag = "  REGRESSION" if change > threshold and now["p50_us"] - base["p50_us"] > MIN_REGRESSION_US else ""
+        print(f"{name:<34}{base['p50_us']:>10.1f}{now['p50_us']:>10.1f}{change:>+9.0%}{tail:>+12.0%}{flag}")
+        if flag:
+            regressions.append(name)
+    return regressions
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s - %(levelname)s - %(message)s")
+    parser = argparse.ArgumentParser(description="Micro-benchmarks for the irrigation controller hot paths")
+    parser.add_argument("--iterations", type=int, default=DEFAULT_ITERATIONS)
+    parser.add_argument("--only", nargs="*", help="run benchmarks whose name contains any of these")
+    parser.add_argument("--baseline", default=BENCHMARK_BASELINE)
+    parser.add_argument("--save", action="store_true", help="write the results as the new baseline")
+    parser.add_argument("--compare", action="store_true", help="compare against the baseline; exit 1 on regression")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD)
+    args = parser.parse_args()
+
+    print(f"{'benchmark':<34}{'p50 us':>10}{'p95 us':>10}{'p99 us':>10}{'ops/s':>12}")
+    results = run(args.iterations, args.only)
+    report = {"environment": environment(), "iterations": args.iterations, "results": results}
+    regressions = []
+    if args.compare:
+        if not os.path.exists(args.baseline):
+            print(f"No baseline at {args.baseline}; run with --save first")
+            sys.exit(1)
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+    if args.save:
+        tmp_path = f"{args.baseline}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(report, f, indent=2)
+        os.replace(tmp_path, args.baseline)
+        print(f"\nBaseline saved to {args.baseline}")
+    if regressions:
+        print(f"\n{len(regressions)} benchmark(s) regressed more than {args.threshold:.0%}")
+        sys.exit(1)
@@ -0,0 +1,256 @@
+import os
+import sys
+import json
+import struct
+import calendar
+import logging
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from log_index import log_segments, normalize_timestamp, read_range_frame
+from log_writer import LOG_COLUMNS, LogWriter
+
+# One fixed-width little-endian record per decision, in LOG_COLUMNS order
+COLUMNAR_DTYPE = np.dtype([
+    ("timestamp", "<i8"),
+    ("soil_moisture", "<f4"),
+    ("temperature", "<f4"),
+    ("humidity", "<f4"),
+    ("raindrop", "<f4"),
+    ("rainfall_1d", "<f4"),
+    ("rainfall_3d", "<f4"),
+    ("water_amount", "<f4"),
+    ("mode", "u1"),
+    ("crop_type", "u1"),
+    ("is_manual", "u1"),
+    ("water_needed", "<f4"),
+])
+RECORD = struct.Struct("<q7fBBBf")
+# First line of every .bin file; bump the version whenever COLUMNAR_DTYPE changes so
+# files in another layout are refused instead of misread
+COLUMNAR_VERSION = 2
+COLUMNAR_HEADER = f"GGCOLUMNAR {COLUMNAR_VERSION} {COLUMNAR_DTYPE.itemsize}\n".encode()
+DICTIONARY_COLUMNS = ("mode", "crop_type")
+CONVERT_CHUNK_ROWS = 500_000
+
+
+def columnar_path_for(log_path):
+    return f"{os.path.splitext(log_path)[0]}.bin"
+
+
+def dictionary_path_for(path):
+    return f"{os.path.splitext(path)[0]}.dict.json"
+
+
+def to_epoch(value):
+    """Encode a naive local datetime as seconds, keeping its wall-clock value."""
+    return calendar.timegm(value.timetuple())
+
+
+def epoch_bound(value, end_of_day=False):
+    """Encode a range bound; a bare date means the start (or end) of that day."""
+    value = normalize_timestamp(value)
+    if value is None:
+        return None
+    if len(value) == 10:
+        value += " 23:59:59" if end_of_day else " 00:00:00"
+    return to_epoch(datetime.strptime(value, "%Y-%m-%d %H:%M:%S"))
+
+
+class ColumnDictionary:
+    """Append-only string <-> code tables for the dictionary-encoded columns.
+
+    One table file is shared by all segments of a log; codes are never
+    reassigned, so old segments stay decodable.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.values = {name: [] for name in DICTIONARY_COLUMNS}
+        if os.path.exists(path):
+            with open(path) as f:
+                self.values.update(json.load(f))
+        self.codes = {name: {value: code for code, value in enumerate(values)}
+                      for name, values in self.values.items()}
+
+    def encode(self, name, value):
+        value = str(value)
+        code = self.codes[name].get(value)
+        if code is None:
+            if len(self.values[name]) >= 255:
+                raise ValueError(f"Too many distinct values for {name}")
+            code = len(self.values[name])
+            self.values[name].append(value)
+            self.codes[name][value] = code
+            # Persist before any record using the new code reaches disk
+            self.save()
+        return code
+
+    def save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.values, f)
+        os.replace(tmp_path, self.path)
+
+    def categorical(self, name, codes):
+        return pd.Categorical.from_codes(codes, categories=self.values[name])
+
+
+class ColumnarLogWriter(LogWriter):
+    """LogWriter that appends fixed-width binary records instead of CSV lines.
+
+    Buffering, fsync policy and segment rotation are inherited; segments are
+    ``<base>.<stamp>.bin`` and are sorted by timestamp, so range reads
+    binary-search the timestamp column and need no sidecar index.
+    """
+
+    def __init__(self, path, **kwargs):
+        kwargs.update(header=COLUMNAR_HEADER.decode(), index=False)
+        self.dictionary = ColumnDictionary(dictionary_path_for(path))
+        super().__init__(path, **kwargs)
+
+    def _open(self):
+        # Drop a partial trailing record left by a crash so appends stay aligned; a file in
+        # another layout is never touched, the base class moves it to a segment instead
+        if os.path.exists(self.path) and not self._header_changed():
+            size = os.path.getsize(self.path)
+            partial = max(0, size - len(COLUMNAR_HEADER)) % COLUMNAR_DTYPE.itemsize
+            if partial:
+                with open(self.path, "r+b") as f:
+                    f.truncate(size - partial)
+        super()._open()
+
+    def encode(self, data, logged_at):
+        return RECORD.pack(
+            to_epoch(logged_at), data['soil_moisture'], data['temperature'], data['humidity'],
+            data.get('raindrop', 0), data.get('rainfall_1d', 0), data.get('rainfall_3d', 0),
+            data['water_amount'], self.dictionary.encode("mode", data['mode']),
+            self.dictionary.encode("crop_type", data['crop_type']), int(data.get('is_manual', 0)),
+            data.get('water_needed', data['water_amount']),
+        )
+
+
+def open_segment(path):
+    """Memory-map one segment as a read-only structured array.
+
+    Raises ValueError for a file without the current COLUMNAR_HEADER; convert
+    the CSV log again to rewrite it.
+    """
+    with open(path, "rb") as f:
+        header = f.readline(len(COLUMNAR_HEADER))
+    if not header:
+        return np.empty(0, dtype=COLUMNAR_DTYPE)
+    if header != COLUMNAR_HEADER:
+        raise ValueError(f"{path} is not a version {COLUMNAR_VERSION} columnar log")
+    count = (os.path.getsize(path) - len(header)) // COLUMNAR_DTYPE.itemsize
+    if count == 0:
+        return np.empty(0, dtype=COLUMNAR_DTYPE)
+    return np.memmap(path, dtype=COLUMNAR_DTYPE, mode="r", offset=len(header), shape=(count,))
+
+
+class ColumnarLog:
+    """Read side of a columnar log: every segment memory-mapped, columns as views."""
+
+    def __init__(self, path):
+        self.path = columnar_path_for(path)
+        self.dictionary = ColumnDictionary(dictionary_path_for(self.path))
+
+    def segments(self):
+        return log_segments(self.path)
+
+    def exists(self):
+        return bool(self.segments())
+
+    def records(self, start=None, end=None):
+        """Yield the memory-mapped record slice of each segment inside [start, end]."""
+        start = epoch_bound(start)
+        end = epoch_bound(end, end_of_day=True)
+        for segment in self.segments():
+            records = open_segment(segment)
+            if len(records) == 0:
+                continue
+            timestamps = records["timestamp"]
+            lo = np.searchsorted(timestamps, start, "left") if start is not None else 0
+            hi = np.searchsorted(timestamps, end, "right") if end is not None else len(records)
+            if lo < hi:
+                yield records[lo:hi]
+
+    def columns(self, names=None, start=None, end=None):
+        """Return {column: ndarray}; a single segment is returned as zero-copy views."""
+        names = names or list(COLUMNAR_DTYPE.names)
+        parts = list(self.records(start, end))
+        if not parts:
+            return {name: np.empty(0, dtype=COLUMNAR_DTYPE[name]) for name in names}
+        if len(parts) == 1:
+            return {name: parts[0][name] for name in names}
+        return {name: np.concatenate([part[name] for part in parts]) for name in names}
+
+    def frame(self, start=None, end=None):
+        """Decode the window into a DataFrame shaped like the CSV log."""
+        columns = self.columns(start=start, end=end)
+        frame = pd.DataFrame({name: columns[name] for name in LOG_COLUMNS
+                              if name not in DICTIONARY_COLUMNS and name != "timestamp"})
+        frame.insert(0, "timestamp", pd.to_datetime(columns["timestamp"], unit="s"))
+        for name in DICTIONARY_COLUMNS:
+            frame[name] = self.dictionary.categorical(name, columns[name])
+        return frame[LOG_COLUMNS]
+
+    def to_csv(self, out_path, start=None, end=None):
+        """Export the window in the irrigation_log.csv schema."""
+        frame = self.frame(start, end)
+        frame.to_csv(out_path, index=False, float_format="%.2f", date_format="%Y-%m-%d %H:%M:%S")
+        return len(frame)
+
+
+def convert_csv(log_path, chunk_rows=CONVERT_CHUNK_ROWS):
+    """Write a columnar copy of a CSV log, one .bin segment per CSV segment."""
+    dictionary = ColumnDictionary(dictionary_path_for(columnar_path_for(log_path)))
+    total = 0
+    for segment in log_segments(log_path):
+        out_path = columnar_path_for(segment)
+        tmp_path = f"{out_path}.tmp"
+        with open(tmp_path, "wb") as out:
+            out.write(COLUMNAR_HEADER)
+            for chunk in pd.read_csv(segment, chunksize=chunk_rows):
+                records = np.empty(len(chunk), dtype=COLUMNAR_DTYPE)
+                timestamps = pd.to_datetime(chunk["timestamp"])
+                records["timestamp"] = (timestamps - pd.Timestamp(0)) // pd.Timedelta(seconds=1)
+                for name in LOG_COLUMNS[1:8]:
+                    records[name] = chunk[name].fillna(0).to_numpy()
+                for name in DICTIONARY_COLUMNS:
+                    values = chunk[name].astype(str)
+                    lookup = {value: dictionary.encode(name, value) for value in values.unique()}
+                    records[name] = values.map(lookup).to_numpy()
+                records["is_manual"] = chunk["is_manual"].fillna(0).astype(int).to_numpy()
+                # NaN for rows logged before water_needed was
+                records["water_needed"] = (chunk["water_needed"].to_numpy() if "water_needed" in chunk
+                                           else np.nan)
+                records.tofile(out)
+                total += len(records)
+        os.replace(tmp_path, out_path)
+        logging.info(f"Converted {segment} -> {out_path}")
+    return total
+
+
+def read_columns(log_path, start=None, end=None):
+    """Load a log window as a DataFrame from whichever backend holds it."""
+    columnar = ColumnarLog(log_path)
+    if columnar.exists():
+        return columnar.frame(start, end)
+    return read_range_frame(log_path, start, end)
+
+
+if __name__ == "__main__":
+    # python columnar_log.py convert <log.csv>
+    # python columnar_log.py export <log.csv|log.bin> <out.csv> [start] [end]
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    if len(sys.argv) < 3 or sys.argv[1] not in ("convert", "export"):
+        print("usage: columnar_log.py convert <log.csv> | export <log> <out.csv> [start] [end]")
+        sys.exit(1)
+    if sys.argv[1] == "convert":
+        print(f"Converted {convert_csv(sys.argv[2])} rows")
+    else:
+        window = sys.argv[4:6] + [None] * (2 - len(sys.argv[4:6]))
+        print(f"Exported {ColumnarLog(sys.argv[2]).to_csv(sys.argv[3], *window)} rows")
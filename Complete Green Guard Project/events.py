@@ -0,0 +1,291 @@
+import os
+import json
+import time
+import asyncio
+import sqlite3
+import logging
+import threading
+from collections import deque
+
+from metrics import counter, gauge
+
+# Events buffered per client; a client that falls further behind loses the oldest
+STREAM_QUEUE_SIZE = int(os.getenv("STREAM_QUEUE_SIZE", "100"))
+# Idle streams get a comment line this often, which also detects closed connections
+STREAM_HEARTBEAT = float(os.getenv("STREAM_HEARTBEAT", "15"))
+# Clients past this get a 503. stream_server.py holds them on one event loop; a threaded
+# Flask server needs at least this many threads or later clients hang instead
+STREAM_MAX_CLIENTS = int(os.getenv("STREAM_MAX_CLIENTS", "1000"))
+# Events go through this SQLite file, so whichever process publishes an event,
+# every process serving /stream sees it, under the same id
+STREAM_DB = os.getenv("STREAM_DB", "events.db")
+# How often each process serving /stream looks for events published elsewhere (seconds)
+STREAM_POLL_INTERVAL = float(os.getenv("STREAM_POLL_INTERVAL", "0.25"))
+# Recent events kept so a reconnecting client can resume from Last-Event-ID
+STREAM_REPLAY = 200
+# Events are only recorded while some process had a subscriber within this many seconds,
+# long enough for a dropped browser to reconnect and resume from Last-Event-ID
+STREAM_RESUME_GRACE = float(os.getenv("STREAM_RESUME_GRACE", "60"))
+# How often a process with subscribers renews its entry in stream_listeners
+STREAM_PRESENCE_INTERVAL = 5.0
+# Milliseconds the browser waits before reconnecting
+STREAM_RETRY_MS = 5000
+
+STREAM_CLIENTS = gauge("greenguard_stream_clients", "Connected /stream subscribers")
+STREAM_EVENTS = counter("greenguard_stream_events_total", "Events published to /stream", ("event",))
+STREAM_DROPPED = counter("greenguard_stream_dropped_total", "Events dropped for slow /stream subscribers")
+
+
+class BrokerFull(Exception):
+    """Raised when a subscription would exceed STREAM_MAX_CLIENTS."""
+
+
+class Subscription:
+    """One client's bounded event queue.
+
+    The publisher appends and never blocks: when the queue is full the oldest
+    event is discarded and counted, and the client is told how many it missed.
+    """
+
+    def __init__(self, kinds=None, maxsize=STREAM_QUEUE_SIZE, loop=None):
+        self.kinds = frozenset(kinds) if kinds else None
+        self.queue = deque(maxlen=maxsize)
+        self.dropped = 0
+        self.reported = 0
+        # Newest event id queued, so replayed and relayed events are never queued twice
+        self.last_id = 0
+        self._wakeup = threading.Event()
+        # Subscribers served from an event loop (stream_server) are woken on it instead
+        self._loop = loop
+        self._async_wakeup = asyncio.Event() if loop is not None else None
+
+    def wants(self, kind):
+        return self.kinds is None or kind in self.kinds
+
+    def push(self, event):
+        if event[0] <= self.last_id:
+            return
+        self.last_id = event[0]
+        if len(self.queue) == self.queue.maxlen:
+            self.dropped += 1
+            STREAM_DROPPED.inc()
+        self.queue.append(event)
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._async_wakeup.set)
+        else:
+            self._wakeup.set()
+
+    def wait(self, timeout):
+        """Return every queued event, waiting up to ``timeout`` seconds for the first."""
+        if not self.queue:
+            self._wakeup.wait(timeout)
+        self._wakeup.clear()
+        return self._drain()
+
+    async def wait_async(self, timeout):
+        """wait() for subscriptions made with a ``loop``; only a coroutine waits, not a thread."""
+        if not self.queue:
+            try:
+                await asyncio.wait_for(self._async_wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        self._async_wakeup.clear()
+        return self._drain()
+
+    def _drain(self):
+        events = []
+        while self.queue:
+            events.append(self.queue.popleft())
+        return events
+
+    def render(self, events):
+        """The SSE text for events taken from the queue: a notice of any dropped, then the frames or a keepalive."""
+        text = ""
+        if self.dropped > self.reported:
+            text += f"event: dropped\ndata: {json.dumps({'missed': self.dropped - self.reported})}\n\n"
+            self.reported = self.dropped
+        if events:
+            return text + "".join(frame for _, _, frame in events)
+        return text + f": keepalive {int(time.time())}\n\n"
+
+
+class EventBroker:
+    """Publishes events through a shared SQLite table and fans them out to this process's subscribers.
+
+    publish() appends a row, whose rowid is the event id, from any process:
+    the control loop, an API worker or the process serving /stream. In each
+    process with subscribers one relay thread reads new rows, renders each
+    event once as its finished SSE frame and queues it for every interested
+    subscriber. Ids are therefore the same in every process, so a client can
+    resume from Last-Event-ID on whichever one it reconnects to. The table
+    keeps the last ``replay`` events.
+
+    Processes with subscribers keep a row in stream_listeners fresh, and
+    publish() skips the INSERT while no process has had a subscriber for
+    STREAM_RESUME_GRACE seconds, so a control loop with nobody watching
+    writes nothing.
+
+    Under Flask a subscriber holds the thread serving its response, blocked
+    on the subscription's queue; stream_server subscribes with its event
+    loop and holds none.
+    """
+
+    def __init__(self, path=STREAM_DB, replay=STREAM_REPLAY, max_clients=STREAM_MAX_CLIENTS,
+                 poll_interval=STREAM_POLL_INTERVAL):
+        self.path = path
+        self.replay = replay
+        self.max_clients = max_clients
+        self.poll_interval = poll_interval
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._wakeup = threading.Event()
+        self._relay = None
+        self._relayed_id = 0
+        self._presence_at = 0.0
+        self._schema_ready = False
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            if not self._schema_ready:
+                conn.execute("CREATE TABLE IF NOT EXISTS stream_events ("
+                             "id INTEGER PRIMARY KEY AUTOINCREMENT, kind TEXT NOT NULL, payload TEXT NOT NULL)")
+                conn.execute("CREATE TABLE IF NOT EXISTS stream_listeners ("
+                             "pid INTEGER PRIMARY KEY, seen REAL NOT NULL)")
+                conn.commit()
+                self._schema_ready = True
+            self._local.conn = conn
+        return conn
+
+    def _events_after(self, event_id, limit):
+        rows = self._connect().execute(
+            "SELECT id, kind, payload FROM stream_events WHERE id > ? ORDER BY id LIMIT ?",
+            (event_id, limit)).fetchall()
+        return [(row_id, kind, f"id: {row_id}\nevent: {kind}\ndata: {payload}\n\n") for row_id, kind, payload in rows]
+
+    def subscriber_count(self):
+        return len(self._subscribers)
+
+    def subscribe(self, kinds=None, last_event_id=None, maxsize=STREAM_QUEUE_SIZE, loop=None):
+        """Add a subscriber; with an asyncio ``loop`` its wait_async() is woken on that loop."""
+        subscription = Subscription(kinds, maxsize, loop)
+        with self._lock:
+            if len(self._subscribers) >= self.max_clients:
+                raise BrokerFull(f"Too many stream clients (max {self.max_clients})")
+            # Before anything else, so publishers start recording right away
+            self._mark_present()
+            self._start_relay()
+            # New clients start from what the relay has delivered so far
+            subscription.last_id = self._relayed_id
+            if last_event_id is not None and last_event_id < self._relayed_id:
+                # Queue what the client missed while reconnecting, if it is still kept
+                subscription.last_id = last_event_id
+                for event in self._events_after(last_event_id, self.replay):
+                    if event[0] > self._relayed_id:
+                        break
+                    if subscription.wants(event[1]):
+                        subscription.push(event)
+                subscription.last_id = self._relayed_id
+            self._subscribers.add(subscription)
+        STREAM_CLIENTS.set(len(self._subscribers))
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+        STREAM_CLIENTS.set(len(self._subscribers))
+
+    def _mark_present(self):
+        try:
+            conn = self._connect()
+            with conn:
+                conn.execute("INSERT OR REPLACE INTO stream_listeners (pid, seen) VALUES (?, ?)",
+                             (os.getpid(), time.time()))
+                # Rows of processes that have exited
+                conn.execute("DELETE FROM stream_listeners WHERE seen < ?", (time.time() - 86400,))
+            self._presence_at = time.monotonic()
+        except sqlite3.Error as e:
+            logging.error(f"Could not record stream listener: {e}")
+
+    def has_listeners(self):
+        """True if some process had a subscriber within STREAM_RESUME_GRACE seconds."""
+        if self._subscribers:
+            return True
+        row = self._connect().execute("SELECT 1 FROM stream_listeners WHERE seen >= ? LIMIT 1",
+                                      (time.time() - STREAM_RESUME_GRACE,)).fetchone()
+        return row is not None
+
+    def publish(self, kind, data):
+        """Record an event for every process's subscribers; never blocks on slow clients.
+
+        Returns the event id, or None if it was not recorded: nobody is
+        listening, or it could not be written. A lost event must not fail the
+        control cycle that published it.
+        """
+        try:
+            if not self.has_listeners():
+                return None
+            payload = json.dumps(data, default=str, separators=(",", ":"))
+            conn = self._connect()
+            with conn:
+                event_id = conn.execute("INSERT INTO stream_events (kind, payload) VALUES (?, ?)",
+                                        (kind, payload)).lastrowid
+                if event_id % 100 == 0:
+                    conn.execute("DELETE FROM stream_events WHERE id <= ?", (event_id - self.replay,))
+        except sqlite3.Error as e:
+            logging.error(f"Could not publish {kind} event: {e}")
+            return None
+        STREAM_EVENTS.labels(kind).inc()
+        # Subscribers in this process need not wait for the next poll
+        self._wakeup.set()
+        return event_id
+
+    def _start_relay(self):
+        if self._relay is None or not self._relay.is_alive():
+            row = self._connect().execute("SELECT MAX(id) FROM stream_events").fetchone()
+            self._relayed_id = max(self._relayed_id, row[0] or 0)
+            self._relay = threading.Thread(target=self._relay_loop, name="stream-relay", daemon=True)
+            self._relay.start()
+
+    def _relay_loop(self):
+        while True:
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+            try:
+                if self._subscribers and time.monotonic() - self._presence_at >= STREAM_PRESENCE_INTERVAL:
+                    self._mark_present()
+                self.relay()
+            except Exception as e:
+                logging.error(f"Stream relay failed: {e}")
+
+    def relay(self):
+        """Queue the events published since the last call for this process's subscribers."""
+        events = self._events_after(self._relayed_id, 1000)
+        if not events:
+            return 0
+        with self._lock:
+            for event in events:
+                for subscription in self._subscribers:
+                    if subscription.wants(event[1]):
+                        subscription.push(event)
+            self._relayed_id = max(self._relayed_id, events[-1][0])
+        return len(events)
+
+    def stream(self, subscription, heartbeat=STREAM_HEARTBEAT):
+        """SSE frames for one subscription, until the client disconnects."""
+        try:
+            yield f"retry: {STREAM_RETRY_MS}\n\n"
+            while True:
+                yield subscription.render(subscription.wait(heartbeat))
+        finally:
+            # Runs when the server closes the generator after the client went away
+            self.unsubscribe(subscription)
+            logging.debug("Stream client disconnected")
+
+
+# One broker per process, shared by the control loop and the API; processes share STREAM_DB
+event_broker = EventBroker()
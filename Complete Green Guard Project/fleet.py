@@ -0,0 +1,241 @@
+import os
+import sys
+import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from http_transport import HttpTransport
+from scheduler import Scheduler
+from irrigation_controller import (
+    CROP_PROFILES, LAT, LON, THINGSPEAK_CHANNEL_ID, THINGSPEAK_READ_API_KEY, THINGSPEAK_WRITE_API_KEY,
+    EMAIL_USER, EMAIL_PASSWORD, FARMER_PHONE, ERROR_RETRY_DELAY, AUTO_CHECK_INTERVAL,
+    IrrigationController, IrrigationModel, ThingSpeakInterface, WeatherService, NotificationService,
+    weather_url,
+)
+from model_refresh import DRIFT_CHECK_INTERVAL, ModelRefresher
+
+ZONES_FILE = os.getenv("ZONES_FILE", "zones.json")
+ZONE_LOG_DIR = os.getenv("ZONE_LOG_DIR", "logs")
+FORECAST_CACHE_DIR = os.getenv("FORECAST_CACHE_DIR", "forecast_cache")
+FLEET_WORKERS = int(os.getenv("FLEET_WORKERS", "32"))
+
+
+class Zone:
+    """One irrigated field: its ThingSpeak channel, keys, crop and location."""
+
+    def __init__(self, zone_id, channel_id, read_api_key, write_api_key, crop_type="wheat",
+                 lat=LAT, lon=LON, log_file=None):
+        if crop_type not in CROP_PROFILES:
+            raise ValueError(f"Invalid crop type for zone {zone_id}: {crop_type}")
+        self.zone_id = str(zone_id)
+        self.channel_id = str(channel_id)
+        self.read_api_key = read_api_key
+        self.write_api_key = write_api_key
+        self.crop_type = crop_type
+        self.lat = float(lat)
+        self.lon = float(lon)
+        self.log_file = log_file or os.path.join(ZONE_LOG_DIR, f"{self.zone_id}.csv")
+
+    @property
+    def location_key(self):
+        # Zones within ~1 km share a forecast
+        return f"{self.lat:.2f},{self.lon:.2f}"
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            zone_id=data["zone_id"],
+            channel_id=data["channel_id"],
+            read_api_key=data["read_api_key"],
+            write_api_key=data["write_api_key"],
+            crop_type=data.get("crop_type", "wheat"),
+            lat=data.get("lat", LAT),
+            lon=data.get("lon", LON),
+            log_file=data.get("log_file"),
+        )
+
+    def to_dict(self):
+        return {
+            "zone_id": self.zone_id,
+            "channel_id": self.channel_id,
+            "read_api_key": self.read_api_key,
+            "write_api_key": self.write_api_key,
+            "crop_type": self.crop_type,
+            "lat": self.lat,
+            "lon": self.lon,
+            "log_file": self.log_file,
+        }
+
+
+class ZoneRegistry:
+    """Zones keyed by id, persisted as a JSON list."""
+
+    def __init__(self, path=ZONES_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._zones = {}
+        if path and os.path.exists(path):
+            self.load()
+
+    def load(self):
+        with open(self.path) as f:
+            entries = json.load(f)
+        zones = {}
+        for entry in entries:
+            zone = Zone.from_dict(entry)
+            if zone.zone_id in zones:
+                raise ValueError(f"Duplicate zone id: {zone.zone_id}")
+            zones[zone.zone_id] = zone
+        with self._lock:
+            self._zones = zones
+        logging.info(f"Loaded {len(zones)} zones from {self.path}")
+
+    def save(self):
+        with self._lock:
+            entries = [zone.to_dict() for zone in self._zones.values()]
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(entries, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def add(self, zone):
+        with self._lock:
+            self._zones[zone.zone_id] = zone
+        return zone
+
+    def remove(self, zone_id):
+        with self._lock:
+            return self._zones.pop(zone_id, None)
+
+    def get(self, zone_id):
+        return self._zones.get(zone_id)
+
+    def zones(self):
+        with self._lock:
+            return list(self._zones.values())
+
+    def __len__(self):
+        return len(self._zones)
+
+    @classmethod
+    def default(cls):
+        """Registry holding just the single channel configured in the environment."""
+        registry = cls(path=None)
+        registry.add(Zone("default", THINGSPEAK_CHANNEL_ID, THINGSPEAK_READ_API_KEY,
+                          THINGSPEAK_WRITE_API_KEY, log_file="irrigation_log.csv"))
+        return registry
+
+
+class FleetController:
+    """Drives every zone in a registry from one process.
+
+    All zones share one model, one HTTP connection pool, one notifier and one
+    forecast cache per location; their cycles run as jobs on a shared
+    scheduler whose worker pool bounds how many zones talk to ThingSpeak at once.
+    """
+
+    def __init__(self, registry, model=None, transport=None, notifier=None, max_workers=FLEET_WORKERS):
+        self.registry = registry
+        self.model = model or IrrigationModel()
+        self.transport = transport or HttpTransport(pool_maxsize=max_workers)
+        self.notifier = notifier or NotificationService(EMAIL_USER, EMAIL_PASSWORD, FARMER_PHONE)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="zone")
+        self.scheduler = Scheduler(executor=self.executor)
+        self.weather_services = {}
+        self.controllers = {}
+        # One refresher for the shared model, trained on every zone's log
+        self.refresher = ModelRefresher(self.model, lambda: [c.log_file for c in list(self.controllers.values())],
+                                        CROP_PROFILES)
+        for zone in registry.zones():
+            self.add_zone(zone, schedule=False)
+
+    def weather_for(self, zone):
+        """Return the shared forecast cache for the zone's location."""
+        key = zone.location_key
+        weather = self.weather_services.get(key)
+        if weather is None:
+            os.makedirs(FORECAST_CACHE_DIR, exist_ok=True)
+            cache_file = os.path.join(FORECAST_CACHE_DIR, f"{key.replace(',', '_')}.json")
+            weather = WeatherService(weather_url(zone.lat, zone.lon), cache_file=cache_file,
+                                     transport=self.transport)
+            self.weather_services[key] = weather
+        return weather
+
+    def add_zone(self, zone, schedule=True):
+        controller = IrrigationController(
+            crop_type=zone.crop_type,
+            model=self.model,
+            thingspeak=ThingSpeakInterface.for_channel(zone.channel_id, zone.read_api_key,
+                                                       zone.write_api_key, transport=self.transport),
+            weather=self.weather_for(zone),
+            notifier=self.notifier,
+            log_file=zone.log_file,
+            zone_id=zone.zone_id,
+        )
+        self.controllers[zone.zone_id] = controller
+        if schedule:
+            self._schedule_zone(controller, len(self.controllers) - 1)
+        return controller
+
+    def remove_zone(self, zone_id):
+        controller = self.controllers.pop(zone_id, None)
+        if controller is not None:
+            for job in self.scheduler.jobs():
+                if job.name.startswith(f"{zone_id}:"):
+                    self.scheduler.remove_job(job.name)
+        return controller
+
+    def _schedule_zone(self, controller, index):
+        # Spread first runs evenly over the cycle so zones don't fire in a burst
+        offset = AUTO_CHECK_INTERVAL * index / max(1, len(self.registry))
+        controller.schedule_jobs(self.scheduler, prefix=f"{controller.zone_id}:", offset=offset,
+                                 refresh_forecast=False)
+
+    def schedule(self):
+        for index, controller in enumerate(self.controllers.values()):
+            self._schedule_zone(controller, index)
+        for key, weather in self.weather_services.items():
+            refresh_interval = max(ERROR_RETRY_DELAY, weather.ttl * 0.9)
+            self.scheduler.add_job(f"forecast:{key}", self._refresh_job(weather),
+                                   interval=refresh_interval, jitter=ERROR_RETRY_DELAY,
+                                   initial_delay=refresh_interval,
+                                   retry_base=ERROR_RETRY_DELAY, retry_max=refresh_interval)
+        if DRIFT_CHECK_INTERVAL:
+            self.refresher.schedule(self.scheduler)
+        return self.scheduler
+
+    def _refresh_job(self, weather):
+        def refresh():
+            if not weather.refresh()["success"]:
+                raise RuntimeError("Forecast refresh failed")
+        return refresh
+
+    def run(self):
+        logging.info(f"GreenGuard fleet running {len(self.controllers)} zones "
+                     f"across {len(self.weather_services)} forecast locations")
+        self.schedule()
+        try:
+            self.scheduler.run()
+        except KeyboardInterrupt:
+            logging.info("Fleet stopped by user")
+        finally:
+            self.executor.shutdown(wait=False)
+
+    def stop(self):
+        self.scheduler.stop()
+
+    def stats(self):
+        return {
+            "zones": len(self.controllers),
+            "forecast_locations": len(self.weather_services),
+            "jobs": self.scheduler.stats(),
+            "transport": self.transport.stats(),
+            "model_refresh": self.refresher.stats(),
+        }
+
+
+if __name__ == "__main__":
+    zones_file = sys.argv[1] if len(sys.argv) > 1 else ZONES_FILE
+    registry = ZoneRegistry(zones_file) if os.path.exists(zones_file) else ZoneRegistry.default()
+    FleetController(registry).run()
@@ -0,0 +1,264 @@
+import os
+import sys
+import json
+import time
+import struct
+import logging
+
+import numpy as np
+
+# Flat, uncompressed artifact that workers memory-map instead of unpickling
+COMPILED_MODEL_PATH = os.getenv("COMPILED_MODEL_PATH", "water_model.forest")
+ARTIFACT_MAGIC = b"GGFOREST"
+ARTIFACT_VERSION = 1
+ARTIFACT_ALIGN = 64
+ARRAY_NAMES = ("feature", "threshold", "left", "right", "value", "roots")
+
+
+def _align(n):
+    return (n + ARTIFACT_ALIGN - 1) // ARTIFACT_ALIGN * ARTIFACT_ALIGN
+
+
+class CompiledForest:
+    """Tree ensemble flattened into contiguous NumPy node arrays.
+
+    All trees share one set of arrays; ``roots`` holds the index of each
+    tree's first node. Leaves point back at themselves, so all trees can be
+    walked in lockstep for up to ``max_depth`` steps without branching.
+    """
+
+    def __init__(self, feature, threshold, left, right, value, roots, max_depth, n_features, feature_names=None,
+                 model_version=None):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.value = value
+        self.roots = roots
+        self.max_depth = int(max_depth)
+        self.n_features = int(n_features)
+        self.feature_names = list(feature_names) if feature_names is not None else None
+        # Registry version the forest was compiled from, so a stale artifact can be detected
+        self.model_version = model_version
+
+    @classmethod
+    def from_model(cls, model):
+        """Flatten a fitted RandomForestRegressor (or any sklearn tree ensemble)."""
+        features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+        offset = 0
+        max_depth = 0
+        for estimator in model.estimators_:
+            tree = estimator.tree_
+            n = tree.node_count
+            is_leaf = tree.children_left == -1
+            own = np.arange(offset, offset + n, dtype=np.int64)
+
+            features.append(np.where(is_leaf, 0, tree.feature).astype(np.int64))
+            thresholds.append(np.where(is_leaf, 0.0, tree.threshold).astype(np.float64))
+            lefts.append(np.where(is_leaf, own, tree.children_left + offset).astype(np.int64))
+            rights.append(np.where(is_leaf, own, tree.children_right + offset).astype(np.int64))
+            values.append(tree.value[:, 0, 0].astype(np.float64))
+            roots.append(offset)
+
+            max_depth = max(max_depth, tree.max_depth)
+            offset += n
+
+        return cls(
+            feature=np.concatenate(features),
+            threshold=np.concatenate(thresholds),
+            left=np.concatenate(lefts),
+            right=np.concatenate(rights),
+            value=np.concatenate(values),
+            roots=np.asarray(roots, dtype=np.int64),
+            max_depth=max_depth,
+            n_features=model.n_features_in_,
+            feature_names=getattr(model, "feature_names_in_", None),
+        )
+
+    @property
+    def n_trees(self):
+        return len(self.roots)
+
+    @property
+    def node_count(self):
+        return len(self.feature)
+
+    def _as_matrix(self, X):
+        # sklearn compares float32 inputs against float64 thresholds; match it exactly
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        if X.shape[1] != self.n_features:
+            raise ValueError(f"Expected {self.n_features} features, got {X.shape[1]}")
+        # NaN compares False and would silently go right at every split; sklearn rejects it, so do we
+        if not np.isfinite(X).all():
+            raise ValueError("Input contains NaN or infinity")
+        return X
+
+    def predict_one(self, row):
+        """Score a single row; returns the forest mean as a float."""
+        x = self._as_matrix(row)[0]
+        nodes = self.roots.copy()
+        for _ in range(self.max_depth):
+            go_left = x[self.feature[nodes]] <= self.threshold[nodes]
+            nodes = np.where(go_left, self.left[nodes], self.right[nodes])
+        return float(self.value[nodes].mean())
+
+    def predict(self, X):
+        """Score a batch of rows; returns a 1-D array with one value per row."""
+        X = self._as_matrix(X)
+        flat_x = X.ravel()
+        row_base = (np.arange(X.shape[0], dtype=np.int64) * self.n_features)[:, None]
+        nodes = np.broadcast_to(self.roots, (X.shape[0], self.n_trees)).ravel().copy()
+        row_base = np.broadcast_to(row_base, (X.shape[0], self.n_trees)).ravel()
+        active = np.arange(nodes.size)
+        for _ in range(self.max_depth):
+            # Only walk paths that have not reached a leaf yet
+            current = nodes[active]
+            go_left = flat_x.take(row_base[active] + self.feature.take(current)) <= self.threshold.take(current)
+            nxt = np.where(go_left, self.left.take(current), self.right.take(current))
+            nodes[active] = nxt
+            active = active[nxt != current]
+            if active.size == 0:
+                break
+        return self.value.take(nodes).reshape(X.shape[0], self.n_trees).mean(axis=1)
+
+    def save_artifact(self, path):
+        """Write a single uncompressed file whose arrays can be memory-mapped in place.
+
+        Layout: magic, header length, JSON header, then each array at a
+        64-byte aligned offset. The file is replaced atomically, so workers
+        still mapping the previous version are unaffected.
+        """
+        arrays = {}
+        offset = 0
+        for name in ARRAY_NAMES:
+            array = np.ascontiguousarray(getattr(self, name))
+            arrays[name] = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": offset}
+            offset = _align(offset + array.nbytes)
+        header = json.dumps({
+            "version": ARTIFACT_VERSION,
+            "max_depth": self.max_depth,
+            "n_features": self.n_features,
+            "feature_names": self.feature_names,
+            "model_version": self.model_version,
+            "arrays": arrays,
+        }).encode()
+        data_start = _align(len(ARTIFACT_MAGIC) + 8 + len(header))
+
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(ARTIFACT_MAGIC + struct.pack("<Q", len(header)) + header)
+            for name in ARRAY_NAMES:
+                f.seek(data_start + arrays[name]["offset"])
+                f.write(np.ascontiguousarray(getattr(self, name)).tobytes())
+            f.truncate(data_start + offset)
+        os.replace(tmp_path, path)
+        logging.info(f"Compiled forest artifact written to {path} ({self.n_trees} trees, {self.node_count} nodes)")
+
+    @classmethod
+    def load_artifact(cls, path):
+        """Memory-map an artifact; the node arrays are read-only views of the page cache."""
+        with open(path, "rb") as f:
+            if f.read(len(ARTIFACT_MAGIC)) != ARTIFACT_MAGIC:
+                raise ValueError(f"{path} is not a compiled forest artifact")
+            header_len = struct.unpack("<Q", f.read(8))[0]
+            header = json.loads(f.read(header_len))
+        if header["version"] != ARTIFACT_VERSION:
+            raise ValueError(f"Unsupported artifact version {header['version']} in {path}")
+        data_start = _align(len(ARTIFACT_MAGIC) + 8 + header_len)
+        buffer = np.memmap(path, dtype=np.uint8, mode="r")
+        arrays = {}
+        for name, spec in header["arrays"].items():
+            dtype = np.dtype(spec["dtype"])
+            count = int(np.prod(spec["shape"]))
+            start = data_start + spec["offset"]
+            arrays[name] = buffer[start:start + count * dtype.itemsize].view(dtype).reshape(spec["shape"])
+        return cls(max_depth=header["max_depth"], n_features=header["n_features"],
+                   feature_names=header["feature_names"], model_version=header.get("model_version"), **arrays)
+
+
+def load_compiled(path, n_features=None):
+    """Map a compiled artifact, or return None if it is missing, corrupt or the wrong shape."""
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        forest = CompiledForest.load_artifact(path)
+    except Exception as e:
+        logging.error(f"Could not load compiled forest {path}: {e}")
+        return None
+    if n_features is not None and forest.n_features != n_features:
+        logging.error(f"Compiled forest {path} expects {forest.n_features} features, not {n_features}")
+        return None
+    return forest
+
+
+def export_artifact(model, path=COMPILED_MODEL_PATH, model_version=None):
+    """Compile a fitted forest and write it as a mappable artifact; returns the forest or None."""
+    forest = compile_model(model)
+    if forest is not None:
+        forest.model_version = model_version
+        try:
+            forest.save_artifact(path)
+        except OSError as e:
+            logging.error(f"Could not write compiled forest {path}: {e}")
+    return forest
+
+
+def compile_model(model):
+    """Compile a fitted forest, or return None if it cannot be flattened."""
+    if model is None:
+        return None
+    try:
+        return CompiledForest.from_model(model)
+    except Exception as e:
+        logging.error(f"Could not compile model, using sklearn predict: {e}")
+        return None
+
+
+def _time_per_call(fn, repeats):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fn()
+    return (time.perf_counter() - start) / repeats
+
+
+if __name__ == "__main__":
+    # Export a pickled forest and check it against sklearn
+    import joblib
+    import pandas as pd
+
+    model_path = sys.argv[1] if len(sys.argv) > 1 else "water_model.pkl"
+    out_path = sys.argv[2] if len(sys.argv) > 2 else COMPILED_MODEL_PATH
+    model = joblib.load(model_path)
+    forest = CompiledForest.from_model(model)
+    forest.save_artifact(out_path)
+    print(f"✅ Exported {forest.n_trees} trees / {forest.node_count} nodes to {out_path}")
+
+    columns = forest.feature_names or [f"f{i}" for i in range(forest.n_features)]
+    rng = np.random.default_rng(42)
+    X = pd.DataFrame(rng.uniform(0, 100, (10000, forest.n_features)), columns=columns)
+    if not hasattr(model, "feature_names_in_"):
+        X = X.to_numpy()
+
+    # Equivalence against sklearn
+    expected = model.predict(X)
+    actual = forest.predict(X)
+    max_diff = float(np.max(np.abs(expected - actual)))
+    print(f"Max abs difference vs sklearn over {len(actual)} rows: {max_diff:.3e}")
+    if not np.allclose(expected, actual, rtol=0, atol=1e-9):
+        print("❌ Compiled forest does not match sklearn output")
+        sys.exit(1)
+    print("✅ Compiled forest matches sklearn output")
+
+    # Latency comparison
+    one_row = X.iloc[[0]] if hasattr(X, "iloc") else X[:1]
+    one_array = np.asarray(one_row, dtype=float)[0]
+    sk_single = _time_per_call(lambda: model.predict(one_row), 100)
+    cf_single = _time_per_call(lambda: forest.predict_one(one_array), 100)
+    sk_batch = _time_per_call(lambda: model.predict(X[:1000]), 5)
+    cf_batch = _time_per_call(lambda: forest.predict(np.asarray(X[:1000], dtype=float)), 5)
+    print(f"Single row: sklearn {sk_single * 1e3:.3f} ms, compiled {cf_single * 1e3:.3f} ms "
+          f"({sk_single / cf_single:.1f}x)")
+    print(f"1000 rows:  sklearn {sk_batch * 1e3:.3f} ms, compiled {cf_batch * 1e3:.3f} ms "
+          f"({sk_batch / cf_batch:.1f}x)")
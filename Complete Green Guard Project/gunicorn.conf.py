@@ -0,0 +1,40 @@
+import os
+import logging
+
+# Threads, not greenlets: model training and inference are CPU-bound and would stall
+# every other request on a gevent worker. /stream is served by stream_server.py, whose
+# event loop holds every client connection without a thread each (see Procfile).
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gthread")
+threads = int(os.getenv("GUNICORN_THREADS", "8"))
+
+def on_starting(server):
+    """Compile the model once in the master so every worker maps the same artifact.
+
+    Workers then load the node arrays with mmap instead of each unpickling and
+    decompressing the forest, and the pages are shared through the page cache.
+    """
+    from model_manager import ModelManager
+    from forest_compiler import COMPILED_MODEL_PATH, export_artifact, load_compiled
+
+    manager = ModelManager()
+    try:
+        model = manager.load_model()
+    except Exception as e:
+        logging.error(f"Could not load model for the compiled artifact: {e}")
+        return
+    if model is None:
+        server.log.warning("No trained model yet; the first worker to need it trains it in the background")
+        return
+    version = manager.current_version()
+    existing = load_compiled(COMPILED_MODEL_PATH)
+    if existing is not None and version is not None and existing.model_version == version:
+        server.log.info(f"Compiled model artifact already matches model {version}")
+        return
+    if export_artifact(model, COMPILED_MODEL_PATH, model_version=version) is not None:
+        server.log.info(f"Compiled model artifact ready at {COMPILED_MODEL_PATH}")
+
+def post_fork(server, worker):
+    """Workers only serve the API; the controller process rotates the shared logs."""
+    from log_writer import disable_rotation
+
+    disable_rotation()
@@ -0,0 +1,200 @@
+import time
+import random
+import logging
+import threading
+from urllib.parse import urlsplit
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+from metrics import histogram, counter
+
+DEFAULT_TIMEOUT = 10
+DEFAULT_RETRIES = 2
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 8.0
+POOL_MAXSIZE = 10
+
+# Only these are safe to resend after the request may have reached the server
+IDEMPOTENT_METHODS = frozenset(["GET", "HEAD", "OPTIONS"])
+RETRY_STATUSES = frozenset([429, 500, 502, 503, 504])
+
+UPSTREAM_SECONDS = histogram("greenguard_upstream_request_seconds",
+                             "Upstream call duration including retries", ("upstream", "method"))
+UPSTREAM_ERRORS = counter("greenguard_upstream_errors_total",
+                          "Upstream calls that failed after retries", ("upstream", "reason"))
+
+
+def retry_after_seconds(response):
+    """Seconds the server asked us to wait (delta or HTTP-date form), or None."""
+    value = response.headers.get("Retry-After", "").strip()
+    if not value:
+        return None
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def _never_sent(error):
+    """True if the request failed before a connection to the server existed."""
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], "reason", None) if error.args else None
+    return isinstance(reason, NewConnectionError)
+
+
+class HttpTransport:
+    """Keep-alive HTTP sessions pooled per upstream host, with bounded retries.
+
+    Idempotent requests are retried on connection errors, timeouts and
+    retryable status codes. Other methods are only retried when the
+    connection could not be opened at all, so a write is never sent twice.
+    """
+
+    def __init__(self, timeout=DEFAULT_TIMEOUT, retries=DEFAULT_RETRIES, backoff_base=BACKOFF_BASE,
+                 backoff_max=BACKOFF_MAX, pool_maxsize=POOL_MAXSIZE):
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.pool_maxsize = pool_maxsize
+        self._lock = threading.Lock()
+        self._sessions = {}
+        self._adapters = {}
+        self._counters = {}
+
+    def _host_key(self, url):
+        parts = urlsplit(url)
+        return f"{parts.scheme}://{parts.netloc}"
+
+    def session_for(self, url):
+        """Return the shared session for the URL's scheme and host."""
+        host = self._host_key(url)
+        session = self._sessions.get(host)
+        if session is not None:
+            return session
+        with self._lock:
+            session = self._sessions.get(host)
+            if session is None:
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_maxsize, max_retries=0)
+                session = requests.Session()
+                session.mount(host, adapter)
+                self._adapters[host] = adapter
+                self._counters[host] = {"requests": 0, "retries": 0, "failures": 0}
+                self._sessions[host] = session
+        return session
+
+    def _count(self, host, name):
+        with self._lock:
+            self._counters[host][name] += 1
+
+    def _backoff_delay(self, attempt, response=None):
+        """Seconds to wait before the next attempt, or None to give up.
+        
+        Full jitter keeps many zones from retrying in lockstep. A Retry-After
+        is a floor: jitter goes on top of it, never below, so retries do not
+        land early and burn the rate limit. A Retry-After longer than the
+        backoff budget is not worth waiting for inside a request.
+        """
+        delay = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        retry_after = retry_after_seconds(response) if response is not None else None
+        if retry_after is None:
+            return random.uniform(0, delay)
+        if retry_after > self.backoff_max:
+            return None
+        return retry_after + random.uniform(0, min(delay, self.backoff_max - retry_after))
+
+    def request(self, method, url, timeout=None, retries=None, upstream=None, **kwargs):
+        """Send a request through the pooled session for its host.
+
+        ``upstream`` names the service in metrics; it defaults to the host.
+        """
+        method = method.upper()
+        session = self.session_for(url)
+        host = self._host_key(url)
+        upstream = upstream or urlsplit(url).netloc
+        started = time.perf_counter()
+        try:
+            response = self._send(session, method, url, host, timeout, retries, **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            UPSTREAM_ERRORS.labels(upstream, "timeout" if isinstance(e, requests.Timeout) else "connection").inc()
+            raise
+        finally:
+            UPSTREAM_SECONDS.labels(upstream, method).observe(time.perf_counter() - started)
+        if response.status_code >= 400:
+            UPSTREAM_ERRORS.labels(upstream, f"http_{response.status_code}").inc()
+        return response
+
+    def _send(self, session, method, url, host, timeout, retries, **kwargs):
+        timeout = self.timeout if timeout is None else timeout
+        retries = self.retries if retries is None else retries
+        idempotent = method in IDEMPOTENT_METHODS
+
+        attempt = 0
+        while True:
+            self._count(host, "requests")
+            try:
+                response = session.request(method, url, timeout=timeout, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt >= retries or not (idempotent or _never_sent(e)):
+                    self._count(host, "failures")
+                    raise
+                logging.warning(f"{method} {host} failed ({e}), retrying")
+                self._count(host, "retries")
+                time.sleep(self._backoff_delay(attempt))
+                attempt += 1
+                continue
+
+            if response.status_code in RETRY_STATUSES and idempotent and attempt < retries:
+                delay = self._backoff_delay(attempt, response)
+                if delay is not None:
+                    logging.warning(f"{method} {host} returned {response.status_code}, retrying")
+                    self._count(host, "retries")
+                    time.sleep(delay)
+                    attempt += 1
+                    continue
+                logging.warning(f"{method} {host} returned {response.status_code} with Retry-After "
+                                f"beyond the {self.backoff_max:.0f}s retry budget, giving up")
+            if response.status_code >= 400:
+                self._count(host, "failures")
+            return response
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def stats(self):
+        """Per-host request, retry and connection-reuse counters."""
+        with self._lock:
+            hosts = {host: dict(counters) for host, counters in self._counters.items()}
+            adapters = dict(self._adapters)
+        for host, adapter in adapters.items():
+            opened = served = 0
+            for key in list(adapter.poolmanager.pools.keys()):
+                pool = adapter.poolmanager.pools.get(key)
+                if pool is None:
+                    continue
+                opened += pool.num_connections
+                served += pool.num_requests
+            hosts[host]["connections_opened"] = opened
+            hosts[host]["connections_reused"] = max(0, served - opened)
+        return hosts
+
+    def close(self):
+        with self._lock:
+            sessions = list(self._sessions.values())
+            self._sessions.clear()
+            self._adapters.clear()
+        for session in sessions:
+            session.close()
+
+
+# Process-wide transport shared by every ThingSpeak and OpenWeather client
+shared_transport = HttpTransport()
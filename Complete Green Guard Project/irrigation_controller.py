@@ -11,17 +11,34 @@ from sklearn.ensemble import RandomForestRegressor
 import joblib
 import requests
 import time
+import math
 from datetime import datetime
 import os
 import smtplib
 from email.message import EmailMessage
 import json
+import hashlib
+import hmac
 import logging
 from contextlib import contextmanager
 from dotenv import load_dotenv
-from flask import Flask, request, jsonify
+from flask import Flask, Blueprint, Response, request, jsonify, g, current_app
 from flask_cors import CORS
+from werkzeug.serving import make_server
 import threading
+import queue
+import argparse
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process training lock
+    fcntl = None
+from http_transport import shared_transport, UPSTREAM_SECONDS, UPSTREAM_ERRORS
+from scheduler import Scheduler
+from log_writer import open_log_writer, disable_rotation
+from rollups import open_rollup_store
+from metrics import REGISTRY, CONTENT_TYPE, histogram, counter, FAST_BUCKETS
+from profiling import cycle_tracer, profiler, traced_cycle, span, PROFILE_TIMEOUT
+from events import event_broker, BrokerFull
 
 # Set up logging
 logging.basicConfig(
@@ -40,14 +57,57 @@ EMAIL_PASSWORD = os.getenv("EMAIL_PASSWORD", "")  # Should be App Password
 FARMER_PHONE = os.getenv("FARMER_PHONE", "6280357229")
 
 # Configuration
+# Point these at simulator.py to run without the real (rate-limited) services
+THINGSPEAK_BASE_URL = os.getenv("THINGSPEAK_BASE_URL", "https://api.thingspeak.com").rstrip("/")
+OPENWEATHER_BASE_URL = os.getenv("OPENWEATHER_BASE_URL", "http://api.openweathermap.org").rstrip("/")
 THINGSPEAK_CHANNEL_ID = "2300946"
-THINGSPEAK_READ_URL = f"https://api.thingspeak.com/channels/{THINGSPEAK_CHANNEL_ID}/feeds.json?api_key={THINGSPEAK_READ_API_KEY}&results=1"
-THINGSPEAK_WRITE_URL = "https://api.thingspeak.com/update"
+THINGSPEAK_READ_URL = f"{THINGSPEAK_BASE_URL}/channels/{THINGSPEAK_CHANNEL_ID}/feeds.json?api_key={THINGSPEAK_READ_API_KEY}&results=1"
+THINGSPEAK_WRITE_URL = f"{THINGSPEAK_BASE_URL}/update"
+
+# Read the manual flag, manual amount and sensor fields from one feeds.json
+# request instead of separate field lookups. The window is how many recent
+# entries are scanned for each field's latest non-empty value.
+THINGSPEAK_SINGLE_REQUEST = os.getenv("THINGSPEAK_SINGLE_REQUEST", "0") == "1"
+THINGSPEAK_FEED_WINDOW = int(os.getenv("THINGSPEAK_FEED_WINDOW", "1"))
 
 # Weather API configuration for Kapriwas, Haryana
 LAT = 28.3167
 LON = 76.9833
-WEATHER_URL = f"http://api.openweathermap.org/data/2.5/forecast?lat={LAT}&lon={LON}&appid={WEATHER_API_KEY}&units=metric"
+WEATHER_URL = f"{OPENWEATHER_BASE_URL}/data/2.5/forecast?lat={LAT}&lon={LON}&appid={WEATHER_API_KEY}&units=metric"
+
+def thingspeak_read_url(channel_id, read_api_key):
+    return f"{THINGSPEAK_BASE_URL}/channels/{channel_id}/feeds.json?api_key={read_api_key}&results=1"
+
+def weather_url(lat, lon):
+    return f"{OPENWEATHER_BASE_URL}/data/2.5/forecast?lat={lat}&lon={lon}&appid={WEATHER_API_KEY}&units=metric"
+
+# Forecast cache: serve from memory while younger than the TTL, serve stale
+# and refresh in the background up to MAX_STALE, block on OpenWeather after that
+WEATHER_CACHE_TTL = int(os.getenv("WEATHER_CACHE_TTL", "1800"))
+WEATHER_CACHE_MAX_STALE = int(os.getenv("WEATHER_CACHE_MAX_STALE", "21600"))
+WEATHER_CACHE_FILE = os.getenv("WEATHER_CACHE_FILE", "forecast_cache.json")
+# After a failed fetch, callers get the failure for this long instead of retrying OpenWeather
+WEATHER_FAILURE_TTL = int(os.getenv("WEATHER_FAILURE_TTL", "60"))
+
+# /sensor-data serves the latest reading from memory for this long (the device
+# posts about every 15 s), and falls back to a reading up to MAX_STALE old
+# when ThingSpeak cannot be reached
+SENSOR_CACHE_TTL = float(os.getenv("SENSOR_CACHE_TTL", "10"))
+SENSOR_CACHE_MAX_STALE = float(os.getenv("SENSOR_CACHE_MAX_STALE", "300"))
+
+# Email alerts: identical messages repeated within the digest window are
+# collapsed into one summary email sent when the window closes
+SMTP_HOST = os.getenv("SMTP_HOST", "smtp.gmail.com")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "587"))
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "1") == "1"
+SMTP_IDLE_TIMEOUT = 300
+ALERT_DIGEST_WINDOW = int(os.getenv("ALERT_DIGEST_WINDOW", "900"))
+ALERT_QUEUE_SIZE = 1000
+
+# Control loop timing (seconds)
+MANUAL_CHECK_INTERVAL = 30
+AUTO_CHECK_INTERVAL = 300
+ERROR_RETRY_DELAY = 60
 
 # Crop-specific thresholds
 CROP_PROFILES = {
@@ -55,67 +115,154 @@ CROP_PROFILES = {
     "rice": {"ideal_moisture": 80, "max_temp": 38, "water_per_percent": 0.8, "max_water": 80},
 }
 
-# Flask app initialization at module level
-app = Flask(__name__)
-CORS(app)
+# Model input columns, in the order the forest was trained on
+FEATURE_COLUMNS = ["soil_moisture", "temperature", "humidity", "rainfall_1d", "rainfall_3d", "raindrop"]
+
+# Upper bound on readings accepted by a single /predict-batch request
+MAX_BATCH_SIZE = 1000
+
+# /admin/* endpoints require this value in the X-Admin-Token header; unset, they are disabled
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
+# With --role controller the control loop serves its own /metrics, /admin/cycles,
+# cycle profiling and /scheduler-stats on this port; 0 disables
+CONTROL_PORT = int(os.getenv("CONTROL_PORT", "5001"))
+
+# Routes live on blueprints; create_app() builds the Flask app without touching the model.
+# ``ops`` routes report on the process that answers, so every role serves them;
+# ``control`` routes need the control loop, so only the roles that run it do;
+# ``stream`` holds a connection (and a worker thread) per client, so it has a role of its own;
+# in production stream_server.py serves /stream from an event loop instead.
+api = Blueprint("api", __name__)
+ops = Blueprint("ops", __name__)
+control = Blueprint("control", __name__)
+stream = Blueprint("stream", __name__)
+# What /admin/profile can profile in each role
+PROFILE_TARGETS_BY_ROLE = {"api": ("requests",), "stream": ("requests",), "controller": ("cycles",),
+                           "all": ("cycles", "requests")}
+
+HTTP_REQUEST_SECONDS = histogram("greenguard_http_request_seconds", "API request latency", ("route", "method"))
+HTTP_REQUESTS = counter("greenguard_http_requests_total", "API responses", ("route", "method", "status"))
+MODEL_INFERENCE_SECONDS = histogram("greenguard_model_inference_seconds", "Model prediction time",
+                                    ("call", "engine"), buckets=FAST_BUCKETS)
+_PREDICT_COMPILED = MODEL_INFERENCE_SECONDS.labels("predict", "compiled")
+_PREDICT_SKLEARN = MODEL_INFERENCE_SECONDS.labels("predict", "sklearn")
+_BATCH_COMPILED = MODEL_INFERENCE_SECONDS.labels("predict_batch", "compiled")
+_BATCH_SKLEARN = MODEL_INFERENCE_SECONDS.labels("predict_batch", "sklearn")
+_SMTP_SECONDS = UPSTREAM_SECONDS.labels("smtp", "SEND")
+SENSOR_CACHE_LOOKUPS = counter("greenguard_sensor_cache_total", "Latest-reading cache lookups", ("result",))
 
 class ThingSpeakInterface:
-    def __init__(self, read_url, write_url, write_api_key):
+    def __init__(self, read_url, write_url, write_api_key, transport=None,
+                 single_request=THINGSPEAK_SINGLE_REQUEST, feed_window=THINGSPEAK_FEED_WINDOW,
+                 channel_id=THINGSPEAK_CHANNEL_ID, read_api_key=THINGSPEAK_READ_API_KEY):
         self.read_url = read_url
         self.write_url = write_url
         self.write_api_key = write_api_key
-        self.manual_control_url = f"https://api.thingspeak.com/channels/{THINGSPEAK_CHANNEL_ID}/fields/5/last.json?api_key={THINGSPEAK_READ_API_KEY}"
-        self.manual_value_url = f"https://api.thingspeak.com/channels/{THINGSPEAK_CHANNEL_ID}/fields/6/last.json?api_key={THINGSPEAK_READ_API_KEY}"
+        self.channel_id = channel_id
+        self.http = transport or shared_transport
+        self.single_request = single_request
+        self.manual_control_url = f"{THINGSPEAK_BASE_URL}/channels/{channel_id}/fields/5/last.json?api_key={read_api_key}"
+        self.manual_value_url = f"{THINGSPEAK_BASE_URL}/channels/{channel_id}/fields/6/last.json?api_key={read_api_key}"
+        self.feed_url = f"{THINGSPEAK_BASE_URL}/channels/{channel_id}/feeds.json?api_key={read_api_key}&results={feed_window}"
+    
+    @classmethod
+    def for_channel(cls, channel_id, read_api_key, write_api_key, transport=None):
+        """Build an interface for any channel rather than the configured default."""
+        return cls(thingspeak_read_url(channel_id, read_api_key), THINGSPEAK_WRITE_URL, write_api_key,
+                   transport=transport, channel_id=channel_id, read_api_key=read_api_key)
+    
+    def read_latest_feed(self):
+        """Fetch recent entries once and merge each field's latest non-empty value."""
+        try:
+            response = self.http.get(self.feed_url, timeout=10, upstream="thingspeak")
+            response.raise_for_status()
+            data = response.json()
+        except (requests.RequestException, ValueError) as e:
+            logging.error(f"Error reading feed from ThingSpeak: {e}")
+            return None
+        
+        return self.merge_feeds(data)
+    
+    @staticmethod
+    def merge_feeds(data):
+        """Merge feeds.json entries into each field's latest non-empty value."""
+        if not data or not data.get('feeds'):
+            logging.warning("No data available from ThingSpeak")
+            return None
+        
+        merged = {}
+        for entry in reversed(data['feeds']):
+            for key, value in entry.items():
+                if key not in merged and value not in (None, ""):
+                    merged[key] = value
+        return merged
     
-    def read_sensor_data(self):
+    def parse_sensor_fields(self, feed):
+        """Convert fields 1-4 of a feed entry into validated sensor readings."""
+        try:
+            soil_moisture = float(feed.get("field1", 0) or 0)
+            temperature = float(feed.get("field2", 0) or 0)
+            humidity = float(feed.get("field3", 0) or 0)
+            raindrop_raw = float(feed.get("field4", 0) or 0)
+            
+            raindrop = 100 * (1023 - raindrop_raw) / 1023 if not np.isnan(raindrop_raw) else 0.0
+            
+            sensor_data = {
+                "soil_moisture": soil_moisture if 0 <= soil_moisture <= 100 else 50.0,
+                "temperature": temperature if -10 <= temperature <= 50 else 25.0,
+                "humidity": humidity if 10 <= humidity <= 100 else 60.0,
+                "raindrop": raindrop if 0 <= raindrop <= 100 else 0.0
+            }
+            
+            logging.info(f"Received data from ThingSpeak: {sensor_data}")
+            return sensor_data
+        except (ValueError, TypeError) as e:
+            logging.error(f"Error parsing sensor values: {e}")
+            return None
+    
+    def parse_manual_fields(self, feed):
+        """Read the manual flag (field5) and amount (field6) from a feed entry."""
+        manual_flag = int(float(feed.get('field5', '0') or 0))
+        if manual_flag == 1:
+            return True, float(feed.get('field6', '0') or 0)
+        return False, 0
+    
+    def read_sensor_data(self, feed=None):
         """Read latest sensor data from ThingSpeak channel."""
+        if feed is not None:
+            return self.parse_sensor_fields(feed)
         try:
-            response = requests.get(self.read_url, timeout=10)
+            response = self.http.get(self.read_url, timeout=10, upstream="thingspeak")
             response.raise_for_status()
             
             data = response.json()
             if not data or 'feeds' not in data or not data['feeds']:
                 logging.warning("No data available from ThingSpeak")
                 return None
-                
-            latest_feed = data['feeds'][-1]
-            
-            try:
-                soil_moisture = float(latest_feed.get("field1", 0) or 0)
-                temperature = float(latest_feed.get("field2", 0) or 0)
-                humidity = float(latest_feed.get("field3", 0) or 0)
-                raindrop_raw = float(latest_feed.get("field4", 0) or 0)
-                
-                raindrop = 100 * (1023 - raindrop_raw) / 1023 if not np.isnan(raindrop_raw) else 0.0
-                
-                sensor_data = {
-                    "soil_moisture": soil_moisture if 0 <= soil_moisture <= 100 else 50.0,
-                    "temperature": temperature if -10 <= temperature <= 50 else 25.0,
-                    "humidity": humidity if 10 <= humidity <= 100 else 60.0,
-                    "raindrop": raindrop if 0 <= raindrop <= 100 else 0.0
-                }
-                
-                logging.info(f"Received data from ThingSpeak: {sensor_data}")
-                return sensor_data
-            except (ValueError, TypeError) as e:
-                logging.error(f"Error parsing sensor values: {e}")
-                return None
             
+            return self.parse_sensor_fields(data['feeds'][-1])
         except requests.RequestException as e:
             logging.error(f"Error reading from ThingSpeak: {e}")
             return None
     
-    def check_manual_irrigation(self):
+    def check_manual_irrigation(self, feed=None):
         """Check if manual irrigation is requested via ThingSpeak."""
+        if feed is None and self.single_request:
+            feed = self.read_latest_feed()
+            if feed is None:
+                return False, 0
+        if feed is not None:
+            return self.parse_manual_fields(feed)
         try:
-            control_response = requests.get(self.manual_control_url, timeout=10)
+            control_response = self.http.get(self.manual_control_url, timeout=10, upstream="thingspeak")
             control_response.raise_for_status()
             
             control_data = control_response.json()
             manual_flag = int(float(control_data.get('field5', '0') or 0))
             
             if manual_flag == 1:
-                value_response = requests.get(self.manual_value_url, timeout=10)
+                value_response = self.http.get(self.manual_value_url, timeout=10, upstream="thingspeak")
                 value_response.raise_for_status()
                 
                 value_data = value_response.json()
@@ -128,15 +275,18 @@ class ThingSpeakInterface:
             logging.error(f"Error checking manual irrigation: {e}")
             return False, 0
     
+    def command_payload(self, water_amount, is_manual=False):
+        return {
+            'api_key': self.write_api_key,
+            'field1': water_amount,
+            'field2': 1 if is_manual else 0
+        }
+    
     def write_irrigation_command(self, water_amount, is_manual=False):
         """Write irrigation command to ThingSpeak channel."""
         try:
-            payload = {
-                'api_key': self.write_api_key,
-                'field1': water_amount,
-                'field2': 1 if is_manual else 0
-            }
-            response = requests.post(self.write_url, data=payload)
+            payload = self.command_payload(water_amount, is_manual)
+            response = self.http.post(self.write_url, data=payload, timeout=10, upstream="thingspeak")
             if response.status_code == 200:
                 mode = "Manual" if is_manual else "Automatic"
                 logging.info(f"Sent {mode} irrigation command: {water_amount:.2f} liters")
@@ -147,17 +297,226 @@ class ThingSpeakInterface:
             logging.error(f"Error writing to ThingSpeak: {e}")
             return False
 
+class SensorReadingCache:
+    """The latest sensor reading, shared by every API request in the process.
+    
+    Requests that miss while a ThingSpeak read is in flight wait for it and
+    share its outcome, so N dashboards polling together cost one upstream call
+    per TTL rather than N.
+    """
+    
+    def __init__(self, thingspeak, ttl=SENSOR_CACHE_TTL, max_stale=SENSOR_CACHE_MAX_STALE, zone_id=None):
+        self.thingspeak = thingspeak
+        self.zone_id = zone_id
+        self.ttl = ttl
+        self.max_stale = max(ttl, max_stale)
+        self._lock = threading.Lock()
+        self._fetch_lock = threading.Lock()
+        self._reading = None
+        self._fetched_at = 0.0
+        self._attempt_finished = 0.0
+        self._hits = SENSOR_CACHE_LOOKUPS.labels("hit")
+        self._misses = SENSOR_CACHE_LOOKUPS.labels("miss")
+        self._coalesced = SENSOR_CACHE_LOOKUPS.labels("coalesced")
+        self._stale = SENSOR_CACHE_LOOKUPS.labels("stale")
+    
+    def _cached(self, max_age):
+        with self._lock:
+            age = time.time() - self._fetched_at
+            if self._reading is not None and age < max_age:
+                return dict(self._reading), max(0.0, age)
+        return None, None
+    
+    def get(self):
+        """Return ``(reading, age_seconds, stale)``; reading is None if nothing usable is cached."""
+        reading, age = self._cached(self.ttl)
+        if reading is not None:
+            self._hits.inc()
+            return reading, age, False
+        requested = time.monotonic()
+        with self._fetch_lock:
+            # A read that finished while we waited answers for us too, even if it failed
+            if self._attempt_finished >= requested:
+                self._coalesced.inc()
+            else:
+                self._misses.inc()
+                try:
+                    reading = self.thingspeak.read_sensor_data()
+                finally:
+                    self._attempt_finished = time.monotonic()
+                if reading:
+                    self.store(reading)
+            reading, age = self._cached(self.ttl)
+        if reading is not None:
+            return reading, age, False
+        reading, age = self._cached(self.max_stale)
+        if reading is not None:
+            self._stale.inc()
+            return reading, age, True
+        return None, None, False
+    
+    def store(self, reading):
+        """Cache a reading obtained elsewhere, e.g. by the control loop; changed readings go to /stream."""
+        with self._lock:
+            changed = reading != self._reading
+            self._reading = dict(reading)
+            self._fetched_at = time.time()
+        if changed:
+            event_broker.publish("reading", dict(reading, zone=self.zone_id,
+                                                 timestamp=datetime.now().isoformat(timespec="seconds")))
+
 from model_manager import ModelManager
+from forest_compiler import COMPILED_MODEL_PATH, load_compiled, export_artifact
+from model_refresh import DRIFT_CHECK_INTERVAL, ModelRefresher
+
+# Above this many rows sklearn's own batch predict beats the compiled walker
+COMPILED_BATCH_LIMIT = 128
+# How often a worker checks whether another process published a new model artifact
+ARTIFACT_CHECK_INTERVAL = int(os.getenv("ARTIFACT_CHECK_INTERVAL", "30"))
+
+@contextmanager
+def training_lock(path):
+    """Hold an exclusive lock beside the artifact so only one process trains at a time."""
+    if fcntl is None:
+        yield
+        return
+    with open(f"{path}.lock", "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+class ModelSnapshot:
+    """A forest and its compiled arrays, published together as one reference.
+    
+    Predictions read ``IrrigationModel._snapshot`` once and use only that
+    object, so a swap never mixes an old forest with new compiled arrays.
+    Only ``model`` is filled in later, when the pickled forest is first needed.
+    """
+    
+    def __init__(self, model=None, compiled=None, version=0, artifact_id=None):
+        self.model = model
+        self.compiled = compiled
+        self.version = version
+        self.artifact_id = artifact_id
+
+def artifact_id(path):
+    """Identity of the artifact file on disk; changes whenever it is replaced."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
 
 class IrrigationModel:
-    def __init__(self):
+    def __init__(self, compiled_path=COMPILED_MODEL_PATH, train_in_background=False):
         self.model_manager = ModelManager()
-        self.model = self.load_or_train_model()
+        self.compiled_path = compiled_path
+        self._snapshot = ModelSnapshot()
+        self._model_lock = threading.Lock()
+        self._training = None
+        self._artifact_checked = time.monotonic()
+        # Map the shared compiled artifact if there is one; the pickled forest is then
+        # only unpickled on demand (large batches), so workers share the node arrays
+        compiled = load_compiled(compiled_path, n_features=len(FEATURE_COLUMNS))
+        current = self.model_manager.current_version()
+        if compiled is not None and current is not None and compiled.model_version != current:
+            logging.info(f"Compiled artifact is from model {compiled.model_version}, current is {current}; "
+                         f"recompiling")
+            compiled = None
+        if compiled is not None:
+            self._snapshot = ModelSnapshot(compiled=compiled, artifact_id=artifact_id(compiled_path))
+        else:
+            model = self.model_manager.load_model()
+            if model is not None:
+                self.publish(model, self.model_manager.current_version())
+            elif train_in_background:
+                logging.info("No trained model found; training in the background, "
+                             "using offline predictions meanwhile")
+                self._training = threading.Thread(target=self._train_in_background, name="model-train",
+                                                  daemon=True)
+                self._training.start()
+            else:
+                self.load_or_train_model()
+    
+    @property
+    def compiled(self):
+        return self._snapshot.compiled
+    
+    @property
+    def version(self):
+        return self._snapshot.version
+    
+    @property
+    def ready(self):
+        """False only while a background training run has not finished yet."""
+        snapshot = self._snapshot
+        return snapshot.compiled is not None or snapshot.model is not None
+    
+    @property
+    def model(self):
+        return self._model_for(self._snapshot)
+    
+    def _model_for(self, snapshot):
+        if snapshot.model is None:
+            if self._training is not None and self._training.is_alive():
+                return None
+            with self._model_lock:
+                if snapshot.model is None:
+                    snapshot.model = self.load_or_train_model()
+        return snapshot.model
+    
+    def publish(self, model, model_version=None):
+        """Compile ``model``, write its artifact and swap it in with one reference assignment.
+        
+        Requests already running finish on the snapshot they started with;
+        other processes pick the new artifact up within ARTIFACT_CHECK_INTERVAL.
+        """
+        compiled = export_artifact(model, self.compiled_path, model_version=model_version)
+        snapshot = ModelSnapshot(model, compiled, version=self._snapshot.version + 1,
+                                 artifact_id=artifact_id(self.compiled_path))
+        self._snapshot = snapshot
+        logging.info(f"Published model version {snapshot.version}")
+        return snapshot
+    
+    def reload_if_changed(self):
+        """Swap in an artifact another process has published, checking at most every interval."""
+        now = time.monotonic()
+        if now - self._artifact_checked < ARTIFACT_CHECK_INTERVAL:
+            return False
+        self._artifact_checked = now
+        current = artifact_id(self.compiled_path)
+        if current is None or current == self._snapshot.artifact_id:
+            return False
+        compiled = load_compiled(self.compiled_path, n_features=len(FEATURE_COLUMNS))
+        if compiled is None:
+            return False
+        self._snapshot = ModelSnapshot(compiled=compiled, version=self._snapshot.version + 1,
+                                       artifact_id=current)
+        logging.info(f"Loaded updated model artifact as version {self._snapshot.version}")
+        return True
+    
+    def _train_in_background(self):
+        try:
+            with training_lock(self.compiled_path):
+                # Another worker may have finished training while we waited for the lock
+                compiled = load_compiled(self.compiled_path, n_features=len(FEATURE_COLUMNS))
+                if compiled is not None:
+                    self._snapshot = ModelSnapshot(compiled=compiled, version=self._snapshot.version + 1,
+                                                   artifact_id=artifact_id(self.compiled_path))
+                else:
+                    self.load_or_train_model()
+            logging.info("Background model training finished; switching to ML predictions")
+        except Exception as e:
+            logging.error(f"Background model training failed: {e}")
     
     def load_or_train_model(self):
         # Try to load existing model first
         model = self.model_manager.load_model()
         if model is not None:
+            if self._snapshot.compiled is None:
+                self.publish(model, self.model_manager.current_version())
             return model
             
         # If loading fails, train a new model
@@ -185,87 +544,406 @@ class IrrigationModel:
             0
         )
         df = pd.DataFrame(data)
-        X = df[["soil_moisture", "temperature", "humidity", "rainfall_1d", "rainfall_3d", "raindrop"]]
+        X = df[FEATURE_COLUMNS]
         y = df["water_needed"]
         model = RandomForestRegressor(n_estimators=100, random_state=42)
         model.fit(X, y)
-        # Save the trained model using ModelManager
-        self.model_manager.save_model(model)
+        # Register the trained model with ModelManager
+        version = self.model_manager.save_model(model, source="synthetic")
+        self.publish(model, version)
         return model
     
     def predict(self, features):
-        if self.model is None:
+        self.reload_if_changed()
+        if not self.ready:
             raise Exception("Model not loaded")
+        snapshot = self._snapshot
+        started = time.perf_counter()
         try:
-            return max(0, self.model.predict(features)[0])
+            if snapshot.compiled is not None:
+                prediction = snapshot.compiled.predict_one(np.asarray(features, dtype=float))
+                _PREDICT_COMPILED.observe(time.perf_counter() - started)
+                return max(0, prediction)
+            if not isinstance(features, pd.DataFrame):
+                features = pd.DataFrame(features, columns=FEATURE_COLUMNS)
+            prediction = self._model_for(snapshot).predict(features)[0]
+            _PREDICT_SKLEARN.observe(time.perf_counter() - started)
+            return max(0, prediction)
         except Exception as e:
             logging.error(f"Prediction error: {e}")
             return None
+    
+    def predict_batch(self, features):
+        """Score many rows with a single model call; returns one value per row."""
+        self.reload_if_changed()
+        if not self.ready:
+            raise Exception("Model not loaded")
+        snapshot = self._snapshot
+        started = time.perf_counter()
+        try:
+            # Don't unpickle a second copy of the forest just to speed up one batch
+            if snapshot.compiled is not None and (len(features) <= COMPILED_BATCH_LIMIT or snapshot.model is None):
+                predictions = snapshot.compiled.predict(np.asarray(features, dtype=float))
+                _BATCH_COMPILED.observe(time.perf_counter() - started)
+            else:
+                if not isinstance(features, pd.DataFrame):
+                    features = pd.DataFrame(features, columns=FEATURE_COLUMNS)
+                predictions = self._model_for(snapshot).predict(features)
+                _BATCH_SKLEARN.observe(time.perf_counter() - started)
+            return np.maximum(predictions, 0).tolist()
+        except Exception as e:
+            logging.error(f"Batch prediction error: {e}")
+            return None
 
 class WeatherService:
-    def __init__(self, api_url):
+    def __init__(self, api_url, ttl=WEATHER_CACHE_TTL, max_stale=WEATHER_CACHE_MAX_STALE,
+                 cache_file=WEATHER_CACHE_FILE, transport=None, failure_ttl=WEATHER_FAILURE_TTL):
         self.api_url = api_url
+        self.http = transport or shared_transport
+        self.ttl = ttl
+        self.max_stale = max(ttl, max_stale)
+        self.failure_ttl = failure_ttl
+        self.cache_file = cache_file
+        # Key persisted entries by URL so a location change never reuses another forecast
+        self._cache_key = hashlib.sha1(api_url.encode()).hexdigest()
+        self._lock = threading.Lock()
+        self._fetch_lock = threading.Lock()
+        self._refresh_thread = None
+        self._forecast = None
+        self._fetched_at = 0.0
+        # Outcome of the latest fetch attempt, shared with callers that queued behind it
+        self._last_result = None
+        self._attempt_finished = 0.0
+        self._failed_at = None
+        self._load_cache()
     
     def get_forecast(self):
+        """Return the cached forecast, refreshing it in the background when stale."""
+        with self._lock:
+            forecast = self._forecast
+            age = time.time() - self._fetched_at
+        if forecast is not None:
+            if age >= self.ttl:
+                if age < self.max_stale:
+                    self.refresh_async()
+                    return dict(forecast)
+                return self.refresh(force=False)
+            return dict(forecast)
+        return self.refresh(force=False)
+    
+    def cache_age(self):
+        """Seconds since the cached forecast was fetched, or None if there is none."""
+        with self._lock:
+            if self._forecast is None:
+                return None
+            return time.time() - self._fetched_at
+    
+    def refresh(self, force=True):
+        """Fetch a new forecast now and cache it if the call succeeded.
+        
+        Callers that queued behind an in-flight fetch reuse its outcome, and
+        unless ``force`` is set a recent failure is returned without calling
+        OpenWeather again, so an outage costs one fetch per failure TTL.
+        """
+        requested = time.monotonic()
+        with self._fetch_lock:
+            reused = self.reusable_result(requested, force)
+            if reused is not None:
+                return reused
+            forecast = self._fetch_forecast()
+            self.record_attempt(forecast)
+        return dict(forecast)
+    
+    def reusable_result(self, requested, force=False):
+        """Result a caller that asked at monotonic time ``requested`` can use without fetching, or None.
+        
+        Call with the fetch lock held; AsyncWeatherService holds its own.
+        """
+        if self._attempt_finished >= requested:
+            return dict(self._last_result)
+        if not force:
+            if self.is_fresh():
+                return self.cached_forecast()
+            if self.recently_failed():
+                return dict(self._last_result)
+        return None
+    
+    def record_attempt(self, forecast):
+        """Cache a successful fetch, or start the failure TTL, and share the outcome with waiters."""
+        if forecast["success"]:
+            self.store_forecast(forecast)
+            self._failed_at = None
+        else:
+            self._failed_at = time.monotonic()
+        self._last_result = forecast
+        self._attempt_finished = time.monotonic()
+    
+    def recently_failed(self):
+        failed_at = self._failed_at
+        return failed_at is not None and time.monotonic() - failed_at < self.failure_ttl
+    
+    def is_fresh(self):
+        with self._lock:
+            return self._forecast is not None and time.time() - self._fetched_at < self.ttl
+    
+    def cached_forecast(self):
+        """Return a copy of the cached forecast (possibly stale), or None."""
+        with self._lock:
+            return dict(self._forecast) if self._forecast is not None else None
+    
+    def store_forecast(self, forecast):
+        """Cache and persist a successfully fetched forecast."""
+        with self._lock:
+            self._forecast = forecast
+            self._fetched_at = time.time()
+        self._save_cache()
+    
+    def refresh_async(self):
+        """Start a background refresh unless one is running or the last one just failed."""
+        if self.recently_failed():
+            return False
+        with self._lock:
+            if self._refresh_thread is not None and self._refresh_thread.is_alive():
+                return False
+            self._refresh_thread = threading.Thread(target=self.refresh, name="forecast-refresh", daemon=True)
+            self._refresh_thread.start()
+        return True
+    
+    def _load_cache(self):
+        if not self.cache_file or not os.path.exists(self.cache_file):
+            return
+        try:
+            with open(self.cache_file) as f:
+                entry = json.load(f)
+            if entry.get("key") != self._cache_key:
+                return
+            self._forecast = entry["forecast"]
+            self._fetched_at = float(entry["fetched_at"])
+            logging.info(f"Loaded cached forecast from {self.cache_file} "
+                         f"({time.time() - self._fetched_at:.0f}s old)")
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logging.warning(f"Ignoring unreadable forecast cache {self.cache_file}: {e}")
+    
+    def _save_cache(self):
+        if not self.cache_file:
+            return
+        with self._lock:
+            entry = {"key": self._cache_key, "fetched_at": self._fetched_at, "forecast": self._forecast}
+        tmp_path = f"{self.cache_file}.tmp"
         try:
-            response = requests.get(self.api_url, timeout=10)
+            with open(tmp_path, "w") as f:
+                json.dump(entry, f)
+            os.replace(tmp_path, self.cache_file)
+        except OSError as e:
+            logging.error(f"Could not persist forecast cache: {e}")
+    
+    @staticmethod
+    def parse_forecast(data):
+        """Sum forecast rainfall for the next day and three days."""
+        rainfall_1d = rainfall_3d = 0
+        for i in range(min(8, len(data.get("list", [])))):
+            rain_3h = data["list"][i].get("rain", {}).get("3h", 0)
+            if i < 8:
+                rainfall_1d += rain_3h
+            rainfall_3d += rain_3h
+        return {"rainfall_1d": rainfall_1d, "rainfall_3d": rainfall_3d, "success": True}
+    
+    def _fetch_forecast(self):
+        try:
+            response = self.http.get(self.api_url, timeout=10, upstream="openweather")
             if response.status_code != 200:
                 raise Exception(f"API returned status code {response.status_code}")
-            data = response.json()
-            rainfall_1d = rainfall_3d = 0
-            for i in range(min(8, len(data.get("list", [])))):
-                rain_3h = data["list"][i].get("rain", {}).get("3h", 0)
-                if i < 8:
-                    rainfall_1d += rain_3h
-                rainfall_3d += rain_3h
-            return {"rainfall_1d": rainfall_1d, "rainfall_3d": rainfall_3d, "success": True}
+            return self.parse_forecast(response.json())
         except Exception as e:
             logging.error(f"Weather API error: {e}")
             return {"rainfall_1d": 0, "rainfall_3d": 0, "success": False}
 
 class NotificationService:
-    def __init__(self, email, password, recipient):
+    """Queues alerts for a background worker that emails them over one SMTP connection."""
+    
+    def __init__(self, email, password, recipient, smtp_host=SMTP_HOST, smtp_port=SMTP_PORT,
+                 starttls=SMTP_STARTTLS, digest_window=ALERT_DIGEST_WINDOW, queue_size=ALERT_QUEUE_SIZE):
         self.email = email
         self.password = password
         self.recipient = recipient
+        self.smtp_host = smtp_host
+        self.smtp_port = smtp_port
+        self.starttls = starttls
+        self.digest_window = digest_window
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._worker = None
+        self._worker_lock = threading.Lock()
+        self._server = None
+        self._server_used_at = 0.0
+        # message -> monotonic time it was last emailed / repeats since then
+        self._last_sent = {}
+        self._repeats = {}
+        self.sent = 0
+        self.suppressed = 0
+        self.failed = 0
     
     def send_alert(self, message):
+        """Queue an alert for delivery; never blocks the caller."""
         logging.warning(f"Alert: {message}")
+        self._ensure_worker()
         try:
-            msg = EmailMessage()
-            msg.set_content(message)
-            msg['Subject'] = 'GreenGuard Irrigation Alert'
-            msg['From'] = self.email
-            msg['To'] = self.recipient
-            with smtplib.SMTP("smtp.gmail.com", 587) as server:
-                server.starttls()
-                server.login(self.email, self.password)
-                server.send_message(msg)
-            logging.info("Email alert sent successfully")
+            self._queue.put_nowait(message)
             return True
-        except Exception as e:
-            logging.error(f"Email alert failed: {e}")
+        except queue.Full:
+            logging.error(f"Alert queue full, dropping alert: {message}")
+            self.failed += 1
             return False
+    
+    def flush(self, timeout=None):
+        """Wait until every queued alert has been handled."""
+        if self._worker is None:
+            return True
+        done = threading.Event()
+        def wait():
+            self._queue.join()
+            done.set()
+        threading.Thread(target=wait, daemon=True).start()
+        return done.wait(timeout)
+    
+    def _ensure_worker(self):
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._worker_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="alert-sender", daemon=True)
+                self._worker.start()
+    
+    def _run(self):
+        while True:
+            try:
+                message = self._queue.get(timeout=self._next_wakeup())
+            except queue.Empty:
+                message = None
+            try:
+                if message is not None:
+                    self._handle(message)
+                self._send_due_digests()
+                self._close_if_idle()
+            except Exception as e:
+                logging.error(f"Alert worker error: {e}")
+            finally:
+                if message is not None:
+                    self._queue.task_done()
+    
+    def _next_wakeup(self):
+        if not self._repeats and self._server is None:
+            return None
+        wakeups = [self._last_sent[m] + self.digest_window for m in self._repeats]
+        if self._server is not None:
+            wakeups.append(self._server_used_at + SMTP_IDLE_TIMEOUT)
+        return max(0.0, min(wakeups) - time.monotonic())
+    
+    def _handle(self, message):
+        last_sent = self._last_sent.get(message)
+        if last_sent is not None and time.monotonic() - last_sent < self.digest_window:
+            self._repeats[message] = self._repeats.get(message, 0) + 1
+            self.suppressed += 1
+            return
+        if self._deliver(message):
+            self._last_sent[message] = time.monotonic()
+    
+    def _send_due_digests(self):
+        now = time.monotonic()
+        for message, count in list(self._repeats.items()):
+            if now - self._last_sent[message] < self.digest_window:
+                continue
+            minutes = self.digest_window / 60
+            body = f"Repeated {count} times in the last {minutes:.0f} minutes:\n\n{message}"
+            if self._deliver(body, subject='GreenGuard Irrigation Alert Digest'):
+                self._last_sent[message] = now
+                del self._repeats[message]
+        # Forget messages that have been quiet for a full window
+        for message in [m for m, t in self._last_sent.items() if now - t >= self.digest_window and m not in self._repeats]:
+            del self._last_sent[message]
+    
+    def _connect(self):
+        server = smtplib.SMTP(self.smtp_host, self.smtp_port, timeout=10)
+        if self.starttls:
+            server.starttls()
+        if self.password:
+            server.login(self.email, self.password)
+        return server
+    
+    def _deliver(self, body, subject='GreenGuard Irrigation Alert'):
+        msg = EmailMessage()
+        msg.set_content(body)
+        msg['Subject'] = subject
+        msg['From'] = self.email
+        msg['To'] = self.recipient
+        # Reuse the open connection; reconnect once if the server dropped it
+        for attempt in range(2):
+            started = time.perf_counter()
+            try:
+                if self._server is None:
+                    self._server = self._connect()
+                self._server.send_message(msg)
+                _SMTP_SECONDS.observe(time.perf_counter() - started)
+                self._server_used_at = time.monotonic()
+                self.sent += 1
+                logging.info("Email alert sent successfully")
+                return True
+            except (smtplib.SMTPServerDisconnected, OSError) as e:
+                _SMTP_SECONDS.observe(time.perf_counter() - started)
+                UPSTREAM_ERRORS.labels("smtp", type(e).__name__).inc()
+                self._drop_connection()
+                if attempt == 1:
+                    logging.error(f"Email alert failed: {e}")
+            except Exception as e:
+                _SMTP_SECONDS.observe(time.perf_counter() - started)
+                UPSTREAM_ERRORS.labels("smtp", type(e).__name__).inc()
+                self._drop_connection()
+                logging.error(f"Email alert failed: {e}")
+                break
+        self.failed += 1
+        return False
+    
+    def _close_if_idle(self):
+        if self._server is not None and time.monotonic() - self._server_used_at >= SMTP_IDLE_TIMEOUT:
+            self._drop_connection()
+    
+    def _drop_connection(self):
+        if self._server is None:
+            return
+        try:
+            self._server.quit()
+        except Exception:
+            pass
+        self._server = None
+    
+    def stats(self):
+        return {"queued": self._queue.qsize(), "sent": self.sent, "suppressed": self.suppressed,
+                "failed": self.failed, "pending_digests": len(self._repeats)}
+
+class SensorDataUnavailable(Exception):
+    """Raised when ThingSpeak returns no usable sensor reading."""
 
 class IrrigationController:
-    def __init__(self, crop_type="wheat"):
+    def __init__(self, crop_type="wheat", model=None, thingspeak=None, weather=None, notifier=None,
+                 log_file="irrigation_log.csv", zone_id=None):
         if crop_type not in CROP_PROFILES:
             raise ValueError(f"Invalid crop type: {crop_type}")
         
+        # Shared components can be injected so many zones reuse one model and weather cache
         self.crop_type = crop_type
-        self.model = IrrigationModel()
-        self.thingspeak = ThingSpeakInterface(THINGSPEAK_READ_URL, THINGSPEAK_WRITE_URL, THINGSPEAK_WRITE_API_KEY)
-        self.weather = WeatherService(WEATHER_URL)
-        self.notifier = NotificationService(EMAIL_USER, EMAIL_PASSWORD, FARMER_PHONE)
-        self.log_file = "irrigation_log.csv"
+        self.zone_id = zone_id
+        self.model = model or IrrigationModel()
+        self.thingspeak = thingspeak or ThingSpeakInterface(THINGSPEAK_READ_URL, THINGSPEAK_WRITE_URL, THINGSPEAK_WRITE_API_KEY)
+        self.weather = weather or WeatherService(WEATHER_URL)
+        self.notifier = notifier or NotificationService(EMAIL_USER, EMAIL_PASSWORD, FARMER_PHONE)
+        self.log_file = log_file
         self.last_manual_check = 0
+        self.scheduler = None
+        self.refresher = None
         
-        self._init_log_file()
-    
-    def _init_log_file(self):
-        if not os.path.exists(self.log_file):
-            with open(self.log_file, "w") as f:
-                f.write("timestamp,soil_moisture,temperature,humidity,raindrop,rainfall_1d,rainfall_3d,water_amount,mode,crop_type,is_manual\n")
+        # One buffered writer per file, shared by every zone and thread that logs to it
+        self.log_writer = open_log_writer(self.log_file)
+        self.rollups = open_rollup_store()
+        self.sensor_cache = SensorReadingCache(self.thingspeak, zone_id=zone_id)
     
     def offline_prediction(self, soil_moisture, temperature, humidity, raindrop):
         profile = CROP_PROFILES[self.crop_type]
@@ -291,166 +969,509 @@ class IrrigationController:
     
     def check_manual_irrigation(self):
         current_time = time.time()
-        if current_time - self.last_manual_check < 30:
+        if current_time - self.last_manual_check < MANUAL_CHECK_INTERVAL:
             return False
             
         self.last_manual_check = current_time
-        
-        manual_mode, water_amount = self.thingspeak.check_manual_irrigation()
-        if manual_mode and water_amount > 0:
-            logging.info(f"Manual irrigation requested: {water_amount:.2f} liters")
-            success = self.thingspeak.write_irrigation_command(water_amount, is_manual=True)
-            
-            if success:
-                sensor_data = self.thingspeak.read_sensor_data() or {}
-                log_data = {
-                    "soil_moisture": sensor_data.get("soil_moisture", 0),
-                    "temperature": sensor_data.get("temperature", 0),
-                    "humidity": sensor_data.get("humidity", 0),
-                    "raindrop": sensor_data.get("raindrop", 0),
-                    "rainfall_1d": 0,
-                    "rainfall_3d": 0,
-                    "water_amount": water_amount,
-                    "mode": "Manual",
-                    "crop_type": self.crop_type,
-                    "is_manual": 1
-                }
-                self.log_data(log_data)
-                self.notifier.send_alert(f"Manual irrigation completed: {water_amount:.2f} liters")
-            return True
-        return False
+        return self.handle_manual_request()
     
-    def log_data(self, data):
-        try:
-            with open(self.log_file, "a") as f:
-                timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                f.write(f"{timestamp},{data['soil_moisture']:.2f},{data['temperature']:.2f},"
-                       f"{data['humidity']:.2f},{data.get('raindrop', 0):.2f},"
-                       f"{data.get('rainfall_1d', 0):.2f},{data.get('rainfall_3d', 0):.2f},"
-                       f"{data['water_amount']:.2f},{data['mode']},{data['crop_type']},"
-                       f"{data.get('is_manual', 0)}\n")
-        except Exception as e:
-            logging.error(f"Logging error: {e}")
-            with open("error_log.txt", "a") as f:
-                f.write(f"{datetime.now()}: Logging error - {str(e)}\n")
+    def handle_manual_request(self):
+        """Run a manual irrigation if one is pending on ThingSpeak."""
+        # Manual checks are traced but not profiled; they would crowd out the automatic cycles
+        with traced_cycle("manual", self.zone_id, profile=False):
+            # In single-request mode one feed read serves both the flag and the sensor log
+            with span("manual_check"):
+                feed = self.thingspeak.read_latest_feed() if self.thingspeak.single_request else None
+                if self.thingspeak.single_request and feed is None:
+                    return False
+                manual_mode, water_amount = self.thingspeak.check_manual_irrigation(feed=feed)
+            if manual_mode and water_amount > 0:
+                logging.info(f"Manual irrigation requested: {water_amount:.2f} liters")
+                with span("thingspeak_write"):
+                    success = self.thingspeak.write_irrigation_command(water_amount, is_manual=True)
+                self.publish_manual(water_amount, success)
+                
+                if success:
+                    with span("sensor_read"):
+                        sensor_data = self.thingspeak.read_sensor_data(feed=feed) or {}
+                    self.log_data(self.manual_log_entry(water_amount, sensor_data))
+                    self.alert(f"Manual irrigation completed: {water_amount:.2f} liters")
+                return True
+            return False
     
-    def run(self):
-        logging.info(f"GreenGuard Smart Irrigation System Running for {self.crop_type}")
-        last_auto_check = 0
-        auto_check_interval = 300
-        while True:
+    def manual_log_entry(self, water_amount, sensor_data):
+        """Build the log row for a completed manual irrigation."""
+        return {
+            "soil_moisture": sensor_data.get("soil_moisture", 0),
+            "temperature": sensor_data.get("temperature", 0),
+            "humidity": sensor_data.get("humidity", 0),
+            "raindrop": sensor_data.get("raindrop", 0),
+            "rainfall_1d": 0,
+            "rainfall_3d": 0,
+            "water_amount": water_amount,
+            "mode": "Manual",
+            "crop_type": self.crop_type,
+            "is_manual": 1
+        }
+    
+    def log_data(self, data):
+        with span("log"):
             try:
-                if self.check_manual_irrigation():
-                    time.sleep(10)
-                    continue
-                
-                current_time = time.time()
-                if current_time - last_auto_check < auto_check_interval:
-                    time.sleep(5)
-                    continue
-                
-                last_auto_check = current_time
-                
+                logged_at = self.log_writer.write(data)
+                self.rollups.record(data, zone=self.zone_id, logged_at=logged_at)
+            except Exception as e:
+                logging.error(f"Logging error: {e}")
+    
+    def run_cycle(self):
+        """Run one automatic read-predict-irrigate-log cycle, timing each stage."""
+        with traced_cycle("auto", self.zone_id):
+            with span("sensor_read"):
                 sensor_data = self.thingspeak.read_sensor_data()
-                if not sensor_data:
-                    self.notifier.send_alert("Sensor data not received from ThingSpeak!")
-                    time.sleep(60)
-                    continue
-                
-                soil_moisture = sensor_data.get("soil_moisture", 0)
-                temperature = sensor_data.get("temperature", 0)
-                humidity = sensor_data.get("humidity", 0)
-                raindrop = sensor_data.get("raindrop", 0)
-                
+            if not sensor_data:
+                raise SensorDataUnavailable("Sensor data not received from ThingSpeak!")
+            self.sensor_cache.store(sensor_data)
+            
+            with span("forecast"):
                 weather_data = self.weather.get_forecast()
-                rainfall_1d = weather_data["rainfall_1d"]
-                rainfall_3d = weather_data["rainfall_3d"]
-                
-                if weather_data["success"]:
-                    input_features = pd.DataFrame([[
-                        soil_moisture, temperature, humidity,
-                        rainfall_1d, rainfall_3d, raindrop
-                    ]], columns=["soil_moisture", "temperature", "humidity",
-                               "rainfall_1d", "rainfall_3d", "raindrop"])
-                    water_needed = self.model.predict(input_features)
-                    prediction_mode = "ML-Model"
-                else:
-                    water_needed = self.offline_prediction(soil_moisture, temperature, humidity, raindrop)
-                    prediction_mode = "Fallback"
-                
-                final_water = self.adjust_for_rainfall(water_needed, rainfall_1d, rainfall_3d)
-                
-                if final_water > 0:
-                    logging.info(f"Irrigation needed: {final_water:.2f}L ({prediction_mode})")
+            final_water, log_data = self.decide(sensor_data, weather_data)
+            if final_water > 0:
+                with span("thingspeak_write"):
                     self.thingspeak.write_irrigation_command(final_water, is_manual=False)
-                else:
-                    logging.info(f"No irrigation needed. Soil moisture: {soil_moisture:.1f}%")
-                
-                log_data = {
-                    "soil_moisture": soil_moisture,
-                    "temperature": temperature,
-                    "humidity": humidity,
-                    "raindrop": raindrop,
-                    "rainfall_1d": rainfall_1d,
-                    "rainfall_3d": rainfall_3d,
-                    "water_amount": final_water,
-                    "mode": prediction_mode,
-                    "crop_type": self.crop_type,
-                    "is_manual": 0
-                }
-                self.log_data(log_data)
-            except KeyboardInterrupt:
-                logging.info("Irrigation system stopped by user")
-                break
-            except Exception as e:
-                logging.error(f"Error in irrigation cycle: {e}")
-                self.notifier.send_alert(f"System error: {str(e)}")
-                time.sleep(60)
+            self.log_data(log_data)
+            self.publish_decision(log_data)
+    
+    def publish_decision(self, log_data):
+        event_broker.publish("decision", dict(log_data, zone=self.zone_id,
+                                              timestamp=datetime.now().isoformat(timespec="seconds")))
+    
+    def publish_manual(self, water_amount, success):
+        event_broker.publish("manual", {"zone": self.zone_id, "water_amount": water_amount,
+                                        "success": success, "crop_type": self.crop_type,
+                                        "timestamp": datetime.now().isoformat(timespec="seconds")})
+    
+    def decide(self, sensor_data, weather_data):
+        """Turn a sensor reading and forecast into a water amount and its log row."""
+        soil_moisture = sensor_data.get("soil_moisture", 0)
+        temperature = sensor_data.get("temperature", 0)
+        humidity = sensor_data.get("humidity", 0)
+        raindrop = sensor_data.get("raindrop", 0)
+        
+        rainfall_1d = weather_data["rainfall_1d"]
+        rainfall_3d = weather_data["rainfall_3d"]
+        
+        if weather_data["success"] and self.model.ready:
+            input_features = [[
+                soil_moisture, temperature, humidity,
+                rainfall_1d, rainfall_3d, raindrop
+            ]]
+            with span("inference"):
+                water_needed = self.model.predict(input_features)
+            prediction_mode = "ML-Model"
+        else:
+            water_needed = self.offline_prediction(soil_moisture, temperature, humidity, raindrop)
+            prediction_mode = "Fallback"
+        
+        final_water = self.adjust_for_rainfall(water_needed, rainfall_1d, rainfall_3d)
+        
+        if final_water > 0:
+            logging.info(f"Irrigation needed: {final_water:.2f}L ({prediction_mode})")
+        else:
+            logging.info(f"No irrigation needed. Soil moisture: {soil_moisture:.1f}%")
+        
+        log_data = {
+            "soil_moisture": soil_moisture,
+            "temperature": temperature,
+            "humidity": humidity,
+            "raindrop": raindrop,
+            "rainfall_1d": rainfall_1d,
+            "rainfall_3d": rainfall_3d,
+            "water_amount": final_water,
+            "water_needed": float(water_needed),
+            "mode": prediction_mode,
+            "crop_type": self.crop_type,
+            "is_manual": 0
+        }
+        return final_water, log_data
+    
+    def refresh_forecast(self):
+        """Refresh the cached forecast ahead of the automatic cycle."""
+        if not self.weather.refresh()["success"]:
+            raise RuntimeError("Forecast refresh failed")
+    
+    def alert(self, message):
+        """Send an alert, tagged with the zone when running as part of a fleet."""
+        if self.zone_id is not None:
+            message = f"[{self.zone_id}] {message}"
+        with span("alert"):
+            return self.notifier.send_alert(message)
+    
+    def _on_job_error(self, job, error):
+        if isinstance(error, SensorDataUnavailable):
+            self.alert(str(error))
+        elif not job.name.endswith("forecast-refresh"):
+            self.alert(f"System error: {str(error)}")
+    
+    def schedule_jobs(self, scheduler, prefix="", offset=0.0, refresh_forecast=True):
+        """Register this controller's periodic jobs on a scheduler.
+        
+        ``offset`` delays the first runs so zones sharing a scheduler are spread
+        over the interval instead of firing together.
+        """
+        scheduler.add_job(f"{prefix}manual-check", self.handle_manual_request,
+                          interval=MANUAL_CHECK_INTERVAL, jitter=1,
+                          initial_delay=offset % MANUAL_CHECK_INTERVAL,
+                          retry_base=MANUAL_CHECK_INTERVAL, retry_max=ERROR_RETRY_DELAY,
+                          on_error=self._on_job_error)
+        scheduler.add_job(f"{prefix}auto-cycle", self.run_cycle,
+                          interval=AUTO_CHECK_INTERVAL,
+                          initial_delay=offset % AUTO_CHECK_INTERVAL,
+                          retry_base=ERROR_RETRY_DELAY, retry_max=AUTO_CHECK_INTERVAL,
+                          on_error=self._on_job_error)
+        if refresh_forecast:
+            # Refresh a little before the cache TTL so cycles never wait on OpenWeather
+            refresh_interval = max(ERROR_RETRY_DELAY, self.weather.ttl * 0.9)
+            scheduler.add_job(f"{prefix}forecast-refresh", self.refresh_forecast,
+                              interval=refresh_interval, jitter=ERROR_RETRY_DELAY,
+                              initial_delay=refresh_interval,
+                              retry_base=ERROR_RETRY_DELAY, retry_max=refresh_interval,
+                              on_error=self._on_job_error)
+        return scheduler
+    
+    def run(self):
+        logging.info(f"GreenGuard Smart Irrigation System Running for {self.crop_type}")
+        self.scheduler = self.schedule_jobs(Scheduler())
+        if DRIFT_CHECK_INTERVAL:
+            # Retrains off the scheduler thread; predictions keep using the old model meanwhile
+            self.refresher = ModelRefresher(self.model, [self.log_file], CROP_PROFILES)
+            self.refresher.schedule(self.scheduler)
+        try:
+            self.scheduler.run()
+        except KeyboardInterrupt:
+            logging.info("Irrigation system stopped by user")
+    
+    def stop(self):
+        if self.scheduler is not None:
+            self.scheduler.stop()
 
 # Flask routes
-@app.route('/sensor-data', methods=['GET'])
+@api.route('/sensor-data', methods=['GET'])
 def get_sensor_data():
+    """Latest reading from the shared cache, with its age in seconds."""
     try:
-        sensor_data = controller.thingspeak.read_sensor_data()
+        controller = get_controller()
+        sensor_data, age, stale = controller.sensor_cache.get()
         if sensor_data:
-            return jsonify(sensor_data)
+            response = jsonify(dict(sensor_data, age_seconds=round(age, 1), stale=stale))
+            response.headers["Age"] = str(int(age))
+            response.headers["Cache-Control"] = f"max-age={max(0, int(controller.sensor_cache.ttl - age))}"
+            return response
         return jsonify({"error": "No sensor data available"}), 503
     except Exception as e:
         logging.error(f"Error in sensor-data endpoint: {e}")
         return jsonify({"error": str(e)}), 500
 
-@app.route('/predict', methods=['POST'])
+_reading_poller = None
+_reading_poller_lock = threading.Lock()
+
+def _poll_readings(controller):
+    """Refresh the shared reading while anyone is streaming; new readings reach /stream via the cache."""
+    while True:
+        time.sleep(controller.sensor_cache.ttl)
+        if event_broker.subscriber_count():
+            try:
+                controller.sensor_cache.get()
+            except Exception as e:
+                logging.error(f"Stream reading poll failed: {e}")
+
+def start_reading_poller(controller):
+    """One poller per process, however many clients are connected."""
+    global _reading_poller
+    with _reading_poller_lock:
+        if _reading_poller is None or not _reading_poller.is_alive():
+            _reading_poller = threading.Thread(target=_poll_readings, args=(controller,),
+                                               name="stream-readings", daemon=True)
+            _reading_poller.start()
+
+@stream.route('/stream', methods=['GET'])
+def stream_events():
+    """Server-Sent Events: new readings, irrigation decisions and manual irrigations as they happen.
+    
+    ``?events=reading,decision`` limits the event types; a reconnecting browser
+    sends Last-Event-ID and receives what it missed, if still kept. Events come
+    from every process through STREAM_DB, including a separate control loop.
+    """
+    events = request.args.get('events')
+    try:
+        last_event_id = int(request.headers.get("Last-Event-ID", ""))
+    except ValueError:
+        last_event_id = None
+    start_reading_poller(get_controller())
+    try:
+        subscription = event_broker.subscribe(kinds=events.split(",") if events else None,
+                                              last_event_id=last_event_id)
+    except BrokerFull as e:
+        return jsonify({"error": str(e)}), 503
+    return Response(event_broker.stream(subscription), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@api.route('/transport-stats', methods=['GET'])
+def get_transport_stats():
+    """Connection reuse and retry counters for each upstream host."""
+    return jsonify(shared_transport.stats())
+
+@ops.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Every metric of this process in the Prometheus text format."""
+    return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
+
+def _admin_denied():
+    if not ADMIN_TOKEN:
+        return jsonify({"error": "Admin endpoints are disabled; set ADMIN_TOKEN to enable them"}), 403
+    if not hmac.compare_digest(request.headers.get("X-Admin-Token", ""), ADMIN_TOKEN):
+        return jsonify({"error": "Admin token required"}), 403
+    return None
+
+@control.route('/admin/cycles', methods=['GET'])
+def get_cycle_traces():
+    """Per-stage timings of recent control cycles plus p50/p95/max per stage."""
+    denied = _admin_denied()
+    if denied:
+        return denied
+    try:
+        limit = int(request.args.get('limit', 20))
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+    return jsonify({"summary": cycle_tracer.summary(),
+                    "recent": cycle_tracer.recent(kind=request.args.get('kind'), limit=limit)})
+
+@ops.route('/admin/profile', methods=['GET', 'POST', 'DELETE'])
+def profile_control_loop():
+    """POST {"mode": "cprofile"|"sample", "target": "cycles"|"requests", "count": N,
+    "timeout": seconds} to profile the next N automatic cycles or API requests of this
+    process; GET returns progress and the last finished report; DELETE cancels.
+    
+    Cycles can only be profiled on the process running the control loop, which with
+    --role controller is its own listener on CONTROL_PORT.
+    """
+    denied = _admin_denied()
+    if denied:
+        return denied
+    if request.method == 'GET':
+        return jsonify(profiler.status())
+    if request.method == 'DELETE':
+        if not profiler.cancel():
+            return jsonify({"error": "No profiling session is running"}), 404
+        return jsonify(profiler.status())
+    data = request.get_json(silent=True) or {}
+    targets = current_app.config["PROFILE_TARGETS"]
+    try:
+        session = profiler.start(mode=data.get('mode', 'cprofile'), target=data.get('target', targets[0]),
+                                 count=data.get('count', 5), top=data.get('top', 30),
+                                 timeout=data.get('timeout', PROFILE_TIMEOUT), targets=targets)
+    except (ValueError, TypeError) as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"active": session}), 202
+
+@control.route('/scheduler-stats', methods=['GET'])
+def get_scheduler_stats():
+    """Per-job run counts, failures and lateness of the control loop."""
+    controller = get_controller()
+    if controller.scheduler is None:
+        return jsonify({"error": "Control loop is not running"}), 503
+    return jsonify(controller.scheduler.stats())
+
+@api.route('/analytics/water-usage', methods=['GET'])
+def get_water_usage():
+    """Daily or weekly water totals per zone, crop and mode, with predicted-vs-actual."""
+    try:
+        buckets, summary = get_controller().rollups.query(
+            period=request.args.get('period', 'day'),
+            since=request.args.get('since'),
+            until=request.args.get('until'),
+            zone=request.args.get('zone'),
+            crop_type=request.args.get('crop_type'),
+            mode=request.args.get('mode'),
+        )
+        return jsonify({"buckets": buckets, "summary": summary})
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logging.error(f"Error in water-usage endpoint: {e}")
+        return jsonify({"error": str(e)}), 500
+
+def _parse_reading(data):
+    """Validate one prediction request body and return its sensor values."""
+    if not isinstance(data, dict):
+        raise ValueError("Reading must be a JSON object")
+    values = (
+        float(data.get('soil_moisture', 50)),
+        float(data.get('temperature', 25)),
+        float(data.get('humidity', 60)),
+        float(data.get('raindrop', 0)),
+    )
+    # float() accepts "nan" and "inf", which the forest would silently score
+    if not all(math.isfinite(value) for value in values):
+        raise ValueError("Sensor values must be finite numbers")
+    return values
+
+@api.route('/predict', methods=['POST'])
 def predict_irrigation():
     try:
         data = request.get_json() or {}
-        soil_moisture = float(data.get('soil_moisture', 50))
-        temperature = float(data.get('temperature', 25))
-        humidity = float(data.get('humidity', 60))
-        raindrop = float(data.get('raindrop', 0))
+        soil_moisture, temperature, humidity, raindrop = _parse_reading(data)
+        controller = get_controller()
         
         weather_data = controller.weather.get_forecast()
-        input_features = pd.DataFrame([[soil_moisture, temperature, humidity, 
-                                      weather_data["rainfall_1d"], weather_data["rainfall_3d"], raindrop]],
-                                    columns=["soil_moisture", "temperature", "humidity", 
-                                            "rainfall_1d", "rainfall_3d", "raindrop"])
-        water_needed = controller.model.predict(input_features)
+        if controller.model.ready:
+            input_features = [[soil_moisture, temperature, humidity,
+                               weather_data["rainfall_1d"], weather_data["rainfall_3d"], raindrop]]
+            water_needed = controller.model.predict(input_features)
+        else:
+            # The model is still training in the background
+            water_needed = controller.offline_prediction(soil_moisture, temperature, humidity, raindrop)
         final_water = controller.adjust_for_rainfall(water_needed, 
                                                    weather_data["rainfall_1d"], 
                                                    weather_data["rainfall_3d"])
         
         return jsonify({"predicted_water": final_water})
+    except (ValueError, TypeError) as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         logging.error(f"Error in predict endpoint: {e}")
         return jsonify({"error": str(e)}), 500
 
-# Global controller instance
-controller = IrrigationController(crop_type="wheat")
+@api.route('/predict-batch', methods=['POST'])
+def predict_irrigation_batch():
+    """Score many zones in one model call; results come back in input order."""
+    try:
+        data = request.get_json() or {}
+        readings = data.get('readings', []) if isinstance(data, dict) else data
+        if not isinstance(readings, list):
+            return jsonify({"error": "'readings' must be a list"}), 400
+        if len(readings) > MAX_BATCH_SIZE:
+            return jsonify({"error": f"Batch too large (max {MAX_BATCH_SIZE} readings)"}), 400
+        
+        results = [None] * len(readings)
+        rows = []
+        row_index = []
+        controller = get_controller()
+        weather_data = controller.weather.get_forecast()
+        rainfall_1d = weather_data["rainfall_1d"]
+        rainfall_3d = weather_data["rainfall_3d"]
+        for i, reading in enumerate(readings):
+            try:
+                soil_moisture, temperature, humidity, raindrop = _parse_reading(reading)
+            except (ValueError, TypeError) as e:
+                results[i] = {"error": str(e)}
+                continue
+            rows.append([soil_moisture, temperature, humidity, rainfall_1d, rainfall_3d, raindrop])
+            row_index.append(i)
+        
+        if rows:
+            if controller.model.ready:
+                predictions = controller.model.predict_batch(rows)
+            else:
+                # The model is still training in the background
+                predictions = [controller.offline_prediction(row[0], row[1], row[2], row[5]) for row in rows]
+            if predictions is None:
+                return jsonify({"error": "Prediction failed"}), 500
+            for i, water_needed in zip(row_index, predictions):
+                final_water = controller.adjust_for_rainfall(water_needed, rainfall_1d, rainfall_3d)
+                results[i] = {"predicted_water": final_water}
+        
+        return jsonify({"results": results})
+    except Exception as e:
+        logging.error(f"Error in predict-batch endpoint: {e}")
+        return jsonify({"error": str(e)}), 500
+
+_controller = None
+_controller_lock = threading.Lock()
+
+def get_controller():
+    """Build the API's controller on first use, so importing this module stays cheap."""
+    global _controller
+    if _controller is None:
+        with _controller_lock:
+            if _controller is None:
+                _controller = IrrigationController(crop_type="wheat",
+                                                   model=IrrigationModel(train_in_background=True))
+    return _controller
+
+def create_app(role="api"):
+    """Flask app factory; the controller is created lazily by the first request that needs it.
+    
+    ``role`` is "api" for the API without /stream, "stream" for /stream alone,
+    "controller" for the control loop's own listener, or "all" for everything in
+    one process.
+    """
+    flask_app = Flask(__name__)
+    CORS(flask_app)
+    flask_app.config["PROFILE_TARGETS"] = PROFILE_TARGETS_BY_ROLE[role]
+    if role in ("api", "all"):
+        flask_app.register_blueprint(api)
+    if role in ("stream", "all"):
+        flask_app.register_blueprint(stream)
+    if role in ("controller", "all"):
+        flask_app.register_blueprint(control)
+    flask_app.register_blueprint(ops)
+    
+    @flask_app.before_request
+    def start_timer():
+        g.request_started = time.perf_counter()
+        # Polling /admin/profile must not use up the requests being profiled
+        if not request.path.startswith("/admin/"):
+            g.profile_session = profiler.begin("requests")
+    
+    @flask_app.teardown_request
+    def finish_profile(error=None):
+        session = g.pop("profile_session", None)
+        if session is not None:
+            profiler.end(session)
+    
+    @flask_app.after_request
+    def record_request(response):
+        started = g.pop("request_started", None)
+        if started is not None:
+            # The rule, not the path, so query strings and ids don't create new series
+            route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+            HTTP_REQUEST_SECONDS.labels(route, request.method).observe(time.perf_counter() - started)
+            HTTP_REQUESTS.labels(route, request.method, response.status_code).inc()
+        return response
+    
+    return flask_app
+
+def serve_control_endpoints(port=CONTROL_PORT):
+    """Serve the controller role's endpoints from a daemon thread next to the control loop."""
+    server = make_server("0.0.0.0", port, create_app("controller"), threaded=True)
+    threading.Thread(target=server.serve_forever, name="control-http", daemon=True).start()
+    logging.info(f"Control loop metrics and admin endpoints on http://0.0.0.0:{port}")
+    return server
+
+# For `gunicorn irrigation_controller:app`; creating the app does not load the model
+app = create_app()
 
 if __name__ == "__main__":
-    # Start controller in a separate thread
-    controller_thread = threading.Thread(target=controller.run, daemon=True)
-    controller_thread.start()
+    parser = argparse.ArgumentParser(description="GreenGuard irrigation controller")
+    parser.add_argument("--role", choices=["all", "api", "stream", "controller"], default="all",
+                        help="api: HTTP API only, stream: /stream only, controller: control loop only, "
+                             "all: everything in one process")
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "5000")))
+    args = parser.parse_args()
     
-    # Run Flask app
-    logging.info("Starting Flask API on http://0.0.0.0:5000")
-    app.run(host="0.0.0.0", port=5000, debug=False)
+    if args.role == "controller":
+        # The API processes cannot see this process's metrics, cycles or scheduler, so it serves its own
+        if CONTROL_PORT:
+            serve_control_endpoints()
+        get_controller().run()
+    else:
+        if args.role in ("api", "stream"):
+            # The controller process owns log rotation
+            disable_rotation()
+        if args.role == "all":
+            # Start controller in a separate thread
+            controller_thread = threading.Thread(target=get_controller().run, daemon=True)
+            controller_thread.start()
+        
+        # Run Flask app
+        logging.info(f"Starting Flask API on http://0.0.0.0:{args.port}")
+        create_app(args.role).run(host="0.0.0.0", port=args.port, debug=False)
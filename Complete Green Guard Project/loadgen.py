@@ -0,0 +1,165 @@
+import sys
+import json
+import time
+import random
+import logging
+import argparse
+import threading
+
+import requests
+
+from benchmarks import summarize
+
+# Load generator for the controller API. Run the API against simulator.py so
+# upstream calls stay local, then e.g.:
+#   python loadgen.py --url http://127.0.0.1:5000 --concurrency 32 --duration 60
+#   python loadgen.py --rate 200 --mix predict=8,sensor-data=2
+# With --rate requests are sent on a fixed schedule and latency is measured
+# from the scheduled time, so a stalled server is not hidden by fewer sends.
+
+DEFAULT_MIX = "predict=6,sensor-data=3,predict-batch=1"
+BATCH_SIZE = 50
+
+
+def _reading(rng):
+    return {
+        "soil_moisture": round(rng.uniform(15, 85), 1),
+        "temperature": round(rng.uniform(18, 44), 1),
+        "humidity": round(rng.uniform(25, 95), 1),
+        "raindrop": round(rng.uniform(0, 100), 1),
+    }
+
+
+# name -> function(session, base_url, rng) returning the response
+ENDPOINTS = {
+    "predict": lambda s, url, rng: s.post(f"{url}/predict", json=_reading(rng), timeout=30),
+    "predict-batch": lambda s, url, rng: s.post(f"{url}/predict-batch", timeout=30,
+                                                json={"readings": [_reading(rng) for _ in range(BATCH_SIZE)]}),
+    "sensor-data": lambda s, url, rng: s.get(f"{url}/sensor-data", timeout=30),
+    "water-usage": lambda s, url, rng: s.get(f"{url}/analytics/water-usage?period=week", timeout=30),
+    "history": lambda s, url, rng: s.get(f"{url}/history?limit=50", timeout=30),
+}
+
+
+def parse_mix(mix):
+    """'predict=6,sensor-data=3' -> (names, cumulative weights)."""
+    names, weights = [], []
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in ENDPOINTS:
+            raise ValueError(f"Unknown endpoint {name!r}; choose from {', '.join(ENDPOINTS)}")
+        names.append(name)
+        weights.append(float(weight or 1))
+    return names, weights
+
+
+class LoadGenerator:
+    """Closed-loop (or paced) HTTP workers recording per-endpoint latency and errors."""
+
+    def __init__(self, base_url, mix=DEFAULT_MIX, concurrency=16, duration=30.0, rate=None, seed=0):
+        self.base_url = base_url.rstrip("/")
+        self.names, self.weights = parse_mix(mix)
+        self.concurrency = concurrency
+        self.duration = duration
+        self.rate = rate
+        self.seed = seed
+        self._lock = threading.Lock()
+        self.samples = {name: [] for name in self.names}
+        self.errors = {name: 0 for name in self.names}
+        self.statuses = {}
+
+    def _record(self, name, latency_ns, status):
+        with self._lock:
+            self.samples[name].append(latency_ns)
+            key = str(status)
+            self.statuses[key] = self.statuses.get(key, 0) + 1
+            if not isinstance(status, int) or status >= 400:
+                self.errors[name] += 1
+
+    def _worker(self, index, deadline):
+        rng = random.Random(self.seed + index)
+        session = requests.Session()
+        # Each paced worker sends every concurrency/rate seconds, offset so sends interleave
+        interval = self.concurrency / self.rate if self.rate else 0.0
+        next_send = time.perf_counter() + (interval * index / self.concurrency if interval else 0.0)
+        while True:
+            if interval:
+                now = time.perf_counter()
+                if next_send > now:
+                    time.sleep(next_send - now)
+                started = next_send
+                next_send += interval
+            else:
+                started = time.perf_counter()
+            if started >= deadline:
+                break
+            name = rng.choices(self.names, self.weights)[0]
+            try:
+                status = ENDPOINTS[name](session, self.base_url, rng).status_code
+            except requests.RequestException as e:
+                status = type(e).__name__
+            self._record(name, int((time.perf_counter() - started) * 1e9), status)
+        session.close()
+
+    def run(self):
+        started = time.perf_counter()
+        deadline = started + self.duration
+        workers = [threading.Thread(target=self._worker, args=(i, deadline), daemon=True)
+                   for i in range(self.concurrency)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        return self.report(time.perf_counter() - started)
+
+    def report(self, wall_seconds):
+        endpoints = {}
+        for name in self.names:
+            if self.samples[name]:
+                endpoints[name] = dict(summarize(self.samples[name], wall_seconds), errors=self.errors[name])
+        all_samples = [sample for samples in self.samples.values() for sample in samples]
+        return {
+            "url": self.base_url,
+            "concurrency": self.concurrency,
+            "target_rate": self.rate,
+            "seconds": round(wall_seconds, 2),
+            "total": dict(summarize(all_samples, wall_seconds), errors=sum(self.errors.values()))
+            if all_samples else None,
+            "endpoints": endpoints,
+            "statuses": self.statuses,
+        }
+
+
+def print_report(report):
+    print(f"{'endpoint':<16}{'requests':>10}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+          f"{'max ms':>10}{'req/s':>10}")
+    rows = list(report["endpoints"].items()) + ([("TOTAL", report["total"])] if report["total"] else [])
+    for name, stats in rows:
+        print(f"{name:<16}{stats['iterations']:>10}{stats['errors']:>8}{stats['p50_us'] / 1000:>10.1f}"
+              f"{stats['p95_us'] / 1000:>10.1f}{stats['p99_us'] / 1000:>10.1f}{stats['max_us'] / 1000:>10.1f}"
+              f"{stats['ops_per_sec']:>10.1f}")
+    print(f"Status codes: {report['statuses']}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s - %(levelname)s - %(message)s")
+    parser = argparse.ArgumentParser(description="Drive the controller API and report latency percentiles")
+    parser.add_argument("--url", default="http://127.0.0.1:5000")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"weighted endpoints (default {DEFAULT_MIX})")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds")
+    parser.add_argument("--rate", type=float, help="total requests/s; omit to send as fast as responses allow")
+    parser.add_argument("--output", help="also write the report as JSON")
+    args = parser.parse_args()
+
+    try:
+        generator = LoadGenerator(args.url, args.mix, args.concurrency, args.duration, args.rate)
+    except ValueError as e:
+        print(e)
+        sys.exit(1)
+    report = generator.run()
+    print_report(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
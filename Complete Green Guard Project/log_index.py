@@ -0,0 +1,238 @@
+import io
+import os
+import sys
+import glob
+import time
+import bisect
+import logging
+from datetime import datetime
+
+# One index entry per this many bytes of log; a range read scans at most this much extra
+LOG_INDEX_STRIDE = int(os.getenv("LOG_INDEX_STRIDE", str(64 * 1024)))
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+TIMESTAMP_WIDTH = 19
+
+
+def index_path_for(log_path):
+    return f"{log_path}.idx"
+
+
+def normalize_timestamp(value):
+    """Accept a datetime, a date string or a full timestamp; return the log's string form."""
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.strftime(TIMESTAMP_FORMAT)
+    value = str(value).replace("T", " ")
+    datetime.strptime(value[:10], "%Y-%m-%d")
+    return value[:TIMESTAMP_WIDTH]
+
+
+class LogIndex:
+    """Sparse timestamp -> byte offset sidecar for one append-only CSV log.
+
+    Every ``stride`` bytes the offset of the next row start is appended to
+    ``<log>.idx`` together with that row's timestamp. Rows are appended in
+    time order, so the entries are sorted and a range read can bisect to the
+    last entry before its start and seek straight there.
+    """
+
+    def __init__(self, log_path, stride=LOG_INDEX_STRIDE):
+        self.log_path = log_path
+        self.path = index_path_for(log_path)
+        self.stride = stride
+        self._file = None
+        self._next_mark = 0
+
+    def open(self, log_size, header_size):
+        """Open the sidecar for appending, rebuilding it if it is missing or stale."""
+        entries = load_index(self.path)
+        last_offset = entries[-1][1] if entries else header_size
+        # Missing, pointing past the end (log replaced) or far behind (written without an index)
+        if log_size > header_size and (not entries or last_offset >= log_size
+                                       or log_size - last_offset > 2 * self.stride):
+            entries = build_index(self.log_path, self.stride)
+        self._next_mark = entries[-1][1] + self.stride if entries else 0
+        self._file = open(self.path, "a")
+
+    def resume(self):
+        """Reopen the sidecar after close() without reading it again; the log must be unchanged."""
+        if self._file is None:
+            self._file = open(self.path, "a")
+
+    def observe(self, lines, offset):
+        """Record index entries for encoded ``lines`` about to be written at ``offset``."""
+        entries = []
+        for line in lines:
+            if offset >= self._next_mark:
+                entries.append(f"{line[:TIMESTAMP_WIDTH].decode()},{offset}\n")
+                self._next_mark = offset + self.stride
+            offset += len(line)
+        if entries:
+            self._file.write("".join(entries))
+
+    def flush(self):
+        if self._file is not None:
+            self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def load_index(path):
+    """Read a sidecar as a sorted list of (timestamp, offset); missing file gives []."""
+    entries = []
+    try:
+        with open(path) as f:
+            for line in f:
+                timestamp, _, offset = line.rstrip("\n").rpartition(",")
+                if timestamp and offset.isdigit():
+                    entries.append((timestamp, int(offset)))
+    except FileNotFoundError:
+        pass
+    return entries
+
+
+def build_index(log_path, stride=LOG_INDEX_STRIDE):
+    """Rebuild the sidecar for an existing log with one sequential scan."""
+    started = time.time()
+    entries = []
+    next_mark = 0
+    with open(log_path, "rb") as f:
+        offset = len(f.readline())
+        for line in f:
+            if offset >= next_mark and len(line) > TIMESTAMP_WIDTH:
+                entries.append((line[:TIMESTAMP_WIDTH].decode(), offset))
+                next_mark = offset + stride
+            offset += len(line)
+    tmp_path = f"{index_path_for(log_path)}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write("".join(f"{timestamp},{offset}\n" for timestamp, offset in entries))
+    os.replace(tmp_path, index_path_for(log_path))
+    logging.info(f"Indexed {log_path}: {len(entries)} entries in {time.time() - started:.2f}s")
+    return entries
+
+
+def log_segments(log_path):
+    """Rotated segments of a log in chronological order, followed by the active file."""
+    base, ext = os.path.splitext(log_path)
+    segments = sorted(p for p in glob.glob(f"{glob.escape(base)}.*{ext}") if p != log_path)
+    if os.path.exists(log_path):
+        segments.append(log_path)
+    return segments
+
+
+def _segment_rows(path, start, end):
+    entries = load_index(index_path_for(path))
+    if not entries and os.path.getsize(path) > 0:
+        entries = build_index(path)
+    if not entries:
+        return
+    if end is not None and entries[0][0] > end:
+        return
+    offset = entries[0][1]
+    if start is not None:
+        # Last entry strictly before start; rows with an equal timestamp may precede it
+        i = bisect.bisect_left(entries, (start,)) - 1
+        if i >= 0:
+            offset = entries[i][1]
+    start = start.encode() if start is not None else None
+    end = end.encode() if end is not None else None
+    with open(path, "rb") as f:
+        f.seek(offset)
+        for line in f:
+            timestamp = line[:TIMESTAMP_WIDTH]
+            if start is not None and timestamp < start:
+                continue
+            if end is not None and timestamp > end:
+                return
+            yield line
+
+
+def read_range(log_path, start=None, end=None):
+    """Yield raw CSV lines (bytes) with start <= timestamp <= end across all segments.
+
+    ``start``/``end`` are inclusive; a bare date as ``end`` covers that whole day.
+    """
+    start = normalize_timestamp(start)
+    if end is not None and len(str(end)) == 10:
+        end = f"{end} 23:59:59"
+    end = normalize_timestamp(end)
+    for segment in log_segments(log_path):
+        yield from _segment_rows(segment, start, end)
+
+
+def read_range_frame(log_path, start=None, end=None):
+    """Load just the rows in [start, end] into a DataFrame."""
+    import pandas as pd
+    from log_writer import LOG_HEADER
+
+    buffer = io.BytesIO()
+    buffer.write(LOG_HEADER.encode())
+    buffer.writelines(read_range(log_path, start, end))
+    buffer.seek(0)
+    return pd.read_csv(buffer, parse_dates=["timestamp"])
+
+
+def _write_synthetic_log(path, target_bytes, rows_per_day=86400 // 30):
+    """Append decisions every 30 s until the log reaches target_bytes."""
+    import numpy as np
+    from log_writer import LOG_HEADER, ROW_FORMAT
+
+    rng = np.random.default_rng(0)
+    day = datetime(2024, 1, 1).timestamp()
+    with open(path, "w") as f:
+        f.write(LOG_HEADER)
+        size = len(LOG_HEADER)
+        while size < target_bytes:
+            values = rng.uniform(0, 100, size=(rows_per_day, 7))
+            chunk = "".join(
+                ROW_FORMAT % ((datetime.fromtimestamp(day + i * 30).strftime(TIMESTAMP_FORMAT),) + tuple(row)
+                              + ("Automatic", "wheat", 0, row[6]))
+                for i, row in enumerate(values)
+            )
+            f.write(chunk)
+            size += len(chunk)
+            day += 86400
+    return datetime.fromtimestamp(day - 86400).strftime("%Y-%m-%d")
+
+
+def benchmark(log_path, size_mb):
+    import pandas as pd
+
+    if not os.path.exists(log_path):
+        print(f"Writing {size_mb} MB synthetic log to {log_path}...")
+        _write_synthetic_log(log_path, size_mb * 1024 * 1024)
+    size = os.path.getsize(log_path)
+    started = time.perf_counter()
+    entries = build_index(log_path)
+    print(f"Log: {size / 1e6:.0f} MB, index: {len(entries)} entries, built in "
+          f"{time.perf_counter() - started:.2f}s")
+
+    # Query the middle day so neither approach benefits from an early exit
+    day = entries[len(entries) // 2][0][:10]
+    started = time.perf_counter()
+    frame = read_range_frame(log_path, day, day)
+    indexed = time.perf_counter() - started
+    print(f"Indexed range read of {day}: {len(frame)} rows in {indexed * 1000:.1f} ms")
+
+    started = time.perf_counter()
+    full = pd.read_csv(log_path, parse_dates=["timestamp"])
+    full = full[full["timestamp"].dt.strftime("%Y-%m-%d") == day]
+    scanned = time.perf_counter() - started
+    print(f"Full pd.read_csv + filter: {len(full)} rows in {scanned * 1000:.1f} ms")
+    print(f"Speed-up: {scanned / indexed:.0f}x")
+
+
+if __name__ == "__main__":
+    # python log_index.py build <log.csv>     rebuild the sidecar index
+    # python log_index.py bench <log.csv> [size_mb]
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    command = sys.argv[1] if len(sys.argv) > 1 else "bench"
+    path = sys.argv[2] if len(sys.argv) > 2 else "bench_log.csv"
+    if command == "build":
+        build_index(path)
+    else:
+        benchmark(path, int(sys.argv[3]) if len(sys.argv) > 3 else 2048)
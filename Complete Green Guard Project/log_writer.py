@@ -0,0 +1,385 @@
+import os
+import time
+import atexit
+import weakref
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+from log_index import LogIndex, index_path_for, TIMESTAMP_FORMAT
+from metrics import histogram, FAST_BUCKETS
+
+# water_needed is the prediction before the rainfall adjustment; it is last so rows
+# from before it was logged still parse, with the column empty
+LOG_COLUMNS = ["timestamp", "soil_moisture", "temperature", "humidity", "raindrop", "rainfall_1d",
+               "rainfall_3d", "water_amount", "mode", "crop_type", "is_manual", "water_needed"]
+LOG_HEADER = ",".join(LOG_COLUMNS) + "\n"
+ROW_FORMAT = "%s,%.2f,%.2f,%.2f,%.2f,%.2f,%.2f,%.2f,%s,%s,%s,%.2f\n"
+
+# Flush buffered rows at least this often; a crash loses at most one interval
+LOG_FLUSH_INTERVAL = float(os.getenv("LOG_FLUSH_INTERVAL", "1.0"))
+# "always": fsync every row, "interval": fsync each flush, "never": leave it to the OS
+LOG_FSYNC = os.getenv("LOG_FSYNC", "interval")
+# "csv" or "columnar" (fixed-width binary records, see columnar_log)
+LOG_BACKEND = os.getenv("LOG_BACKEND", "csv")
+# Start a new segment past this size (bytes) or age (seconds); 0 disables either
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(64 * 1024 * 1024)))
+LOG_ROTATE_INTERVAL = int(os.getenv("LOG_ROTATE_INTERVAL", "0"))
+# Writers that may keep their log (and index) open at once; past this the least recently
+# flushed close theirs until their next flush, so a fleet of thousands of zones stays under
+# the process's descriptor limit
+LOG_MAX_OPEN_WRITERS = int(os.getenv("LOG_MAX_OPEN_WRITERS", "256"))
+# Only the process running the control loop may rotate; see disable_rotation()
+_rotation_enabled = True
+
+LOG_WRITE_SECONDS = histogram("greenguard_log_write_seconds", "Decision log write() and flush time", ("op",),
+                              buckets=FAST_BUCKETS)
+_WRITE_METRIC = LOG_WRITE_SECONDS.labels("write")
+_FLUSH_METRIC = LOG_WRITE_SECONDS.labels("flush")
+
+
+def format_row(data, timestamp=None):
+    """Render one decision as a CSV line in the irrigation_log.csv schema."""
+    if timestamp is None:
+        timestamp = datetime.now().strftime(TIMESTAMP_FORMAT)
+    return ROW_FORMAT % (
+        timestamp, data['soil_moisture'], data['temperature'], data['humidity'],
+        data.get('raindrop', 0), data.get('rainfall_1d', 0), data.get('rainfall_3d', 0),
+        data['water_amount'], data['mode'], data['crop_type'], data.get('is_manual', 0),
+        data.get('water_needed', data['water_amount']),
+    )
+
+
+def disable_rotation():
+    """Stop writers in this process from rotating, e.g. in API workers.
+
+    Rotation renames the shared active file, so two processes deciding to
+    rotate the same log at once would race; it is left to the control loop.
+    Writers that do not rotate reopen the file when they find it was renamed.
+    """
+    global _rotation_enabled
+    _rotation_enabled = False
+
+
+class SharedFlusher:
+    """One background thread that flushes every open writer when its interval is due.
+
+    A fleet with a log per zone would otherwise run a flush thread per zone.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._writers = weakref.WeakSet()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def register(self, writer):
+        with self._lock:
+            self._writers.add(writer)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="log-flush", daemon=True)
+                self._thread.start()
+        # Recompute the next wakeup, which may now be sooner
+        self._wakeup.set()
+
+    def unregister(self, writer):
+        with self._lock:
+            self._writers.discard(writer)
+
+    def _run(self):
+        while True:
+            with self._lock:
+                writers = list(self._writers)
+            now = time.monotonic()
+            next_due = now + 60.0
+            for writer in writers:
+                due = writer._flushed_at + writer.flush_interval
+                if due <= now:
+                    writer._flush_due()
+                    due = time.monotonic() + writer.flush_interval
+                next_due = min(next_due, due)
+            self._wakeup.wait(max(0.0, next_due - time.monotonic()))
+            self._wakeup.clear()
+
+
+_flusher = SharedFlusher()
+
+
+class OpenWriters:
+    """LRU of the writers holding open file handles, capped at ``limit``."""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self._lock = threading.Lock()
+        self._writers = OrderedDict()
+
+    def touch(self, writer):
+        """Mark ``writer`` as just used and close the handles of the least recently used past the limit."""
+        with self._lock:
+            self._writers[writer] = None
+            self._writers.move_to_end(writer)
+            victims = []
+            while len(self._writers) > max(self.limit, 1):
+                victim, _ = self._writers.popitem(last=False)
+                victims.append(victim)
+        for victim in victims:
+            if not victim._release():
+                # Busy flushing, so not idle after all; retry it on a later eviction
+                with self._lock:
+                    self._writers[victim] = None
+
+    def discard(self, writer):
+        with self._lock:
+            self._writers.pop(writer, None)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._writers)
+
+
+_open_writers = OpenWriters(LOG_MAX_OPEN_WRITERS)
+
+
+def segment_path(path, when=None):
+    """Name a rotated segment after the time it was closed; names sort chronologically."""
+    base, ext = os.path.splitext(path)
+    stamp = (when or datetime.now()).strftime("%Y%m%d-%H%M%S-%f")
+    return f"{base}.{stamp}{ext}"
+
+
+class LogWriter:
+    """Long-lived, thread-safe buffered writer for the decision log.
+
+    Rows are buffered in memory and written out by the shared flusher thread
+    every ``flush_interval`` seconds (or immediately with ``fsync="always"``).
+    When the active file passes ``max_bytes`` or ``rotate_interval`` it is
+    renamed to a timestamped segment and a fresh file with a header is started.
+    At most LOG_MAX_OPEN_WRITERS writers hold their files open; the others
+    reopen them on their next flush.
+    """
+
+    def __init__(self, path, flush_interval=LOG_FLUSH_INTERVAL, fsync=LOG_FSYNC, max_bytes=LOG_MAX_BYTES,
+                 rotate_interval=LOG_ROTATE_INTERVAL, header=LOG_HEADER, index=True):
+        if fsync not in ("always", "interval", "never"):
+            raise ValueError(f"Invalid fsync policy: {fsync}")
+        self.path = path
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.max_bytes = max_bytes
+        self.rotate_interval = rotate_interval
+        self.header = header.encode()
+        self.index = LogIndex(path) if index else None
+        self._lock = threading.Lock()
+        self._buffer = []
+        self._file = None
+        self._inode = None
+        self._size = 0
+        self._opened_at = 0.0
+        self._closed = False
+        with self._lock:
+            # Held so an eviction by another writer cannot close the files half opened
+            self._open()
+        self._flushed_at = time.monotonic()
+        _flusher.register(self)
+
+    def _open(self):
+        log_dir = os.path.dirname(self.path)
+        if log_dir:
+            os.makedirs(log_dir, exist_ok=True)
+        if _rotation_enabled and self._header_changed():
+            # Written with other columns; appending would mix two layouts in one file
+            logging.info(f"Log columns changed; moved {self.path} to {self._move_to_segment()}")
+        self._file = open(self.path, "ab", buffering=1024 * 1024)
+        self._size = self._file.tell()
+        if self._size == 0:
+            self._file.write(self.header)
+            self._file.flush()
+            self._size = len(self.header)
+        if self.index is not None:
+            self.index.open(self._size, len(self.header))
+        stat = os.fstat(self._file.fileno())
+        self._inode = (stat.st_dev, stat.st_ino)
+        self._opened_at = time.time()
+        _open_writers.touch(self)
+
+    def _ensure_open_locked(self):
+        if self._file is not None:
+            _open_writers.touch(self)
+        elif self._rotated_elsewhere():
+            # Renamed or removed while the handles were closed; start over like a rotation would
+            self._open()
+        else:
+            self._file = open(self.path, "ab", buffering=1024 * 1024)
+            self._size = self._file.tell()
+            if self.index is not None:
+                self.index.resume()
+            _open_writers.touch(self)
+
+    def _release(self):
+        """Close the file handles for another writer; False if this one is busy. Reopened on next flush."""
+        if not self._lock.acquire(blocking=False):
+            return False
+        try:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+                if self.index is not None:
+                    self.index.close()
+        finally:
+            self._lock.release()
+        return True
+
+    def encode(self, data, logged_at):
+        return format_row(data, logged_at.strftime(TIMESTAMP_FORMAT)).encode()
+
+    def write(self, data):
+        """Buffer one decision row and return the time it was stamped with."""
+        started = time.perf_counter()
+        with self._lock:
+            if self._closed:
+                raise ValueError(f"Log writer for {self.path} is closed")
+            # Stamped under the lock so rows land in timestamp order for the index
+            logged_at = datetime.now()
+            self._buffer.append(self.encode(data, logged_at))
+            if self.fsync == "always":
+                self._flush_locked()
+        _WRITE_METRIC.observe(time.perf_counter() - started)
+        return logged_at
+
+    def flush(self):
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        if self._buffer:
+            started = time.perf_counter()
+            lines = self._buffer
+            chunk = b"".join(lines)
+            self._buffer = []
+            self._ensure_open_locked()
+            if self._should_rotate(len(chunk)):
+                self._rotate_locked()
+            elif not _rotation_enabled and self._rotated_elsewhere():
+                self._reopen_locked()
+            self._file.write(chunk)
+            self._file.flush()
+            if self.fsync != "never":
+                os.fsync(self._file.fileno())
+            # Index after the rows are written so it never points past the end of the log
+            if self.index is not None:
+                self.index.observe(lines, self._size)
+                self.index.flush()
+            self._size += len(chunk)
+            _FLUSH_METRIC.observe(time.perf_counter() - started)
+        if self._should_rotate():
+            self._rotate_locked()
+
+    def _should_rotate(self, pending=0):
+        if not _rotation_enabled or self._size <= len(self.header):
+            return False
+        if self.max_bytes and self._size + pending > self.max_bytes:
+            return True
+        return bool(self.rotate_interval) and time.time() - self._opened_at >= self.rotate_interval
+
+    def _header_changed(self):
+        if not self.header:
+            return False
+        try:
+            with open(self.path, "rb") as f:
+                # Bounded, so a binary file without newlines is not read whole
+                first_line = f.readline(len(self.header))
+        except FileNotFoundError:
+            return False
+        return bool(first_line) and first_line != self.header
+
+    def _move_to_segment(self):
+        segment = segment_path(self.path)
+        os.replace(self.path, segment)
+        if self.index is not None and os.path.exists(self.index.path):
+            os.replace(self.index.path, index_path_for(segment))
+        return segment
+
+    def _close_files_locked(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self.index is not None:
+            self.index.close()
+
+    def _rotate_locked(self):
+        self._close_files_locked()
+        segment = self._move_to_segment()
+        logging.info(f"Rotated {self.path} to {segment}")
+        self._open()
+
+    def _rotated_elsewhere(self):
+        """True once the controller process has renamed the active file under us."""
+        try:
+            current = os.stat(self.path)
+        except FileNotFoundError:
+            return True
+        return (current.st_dev, current.st_ino) != self._inode
+
+    def _reopen_locked(self):
+        self._close_files_locked()
+        self._open()
+
+    def rotate(self):
+        with self._lock:
+            self._flush_locked()
+            if self._size > len(self.header):
+                self._rotate_locked()
+
+    def _flush_due(self):
+        with self._lock:
+            self._flushed_at = time.monotonic()
+            if self._closed:
+                return
+            try:
+                self._flush_locked()
+            except Exception as e:
+                logging.error(f"Logging error: {e}")
+
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return
+            try:
+                self._flush_locked()
+            finally:
+                self._closed = True
+                self._close_files_locked()
+        _flusher.unregister(self)
+        _open_writers.discard(self)
+
+
+_writers = {}
+_writers_lock = threading.Lock()
+
+
+def open_log_writer(path, **kwargs):
+    """Return the process-wide writer for ``path``, creating it on first use."""
+    writer_class = LogWriter
+    if LOG_BACKEND == "columnar":
+        from columnar_log import ColumnarLogWriter, columnar_path_for
+        writer_class = ColumnarLogWriter
+        path = columnar_path_for(path)
+    key = os.path.abspath(path)
+    with _writers_lock:
+        writer = _writers.get(key)
+        if writer is None or writer._closed:
+            writer = writer_class(path, **kwargs)
+            _writers[key] = writer
+        return writer
+
+
+@atexit.register
+def close_all():
+    with _writers_lock:
+        writers = list(_writers.values())
+    for writer in writers:
+        try:
+            writer.close()
+        except Exception as e:
+            logging.error(f"Error closing log {writer.path}: {e}")
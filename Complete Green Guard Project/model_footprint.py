@@ -0,0 +1,73 @@
+import os
+import sys
+import time
+import multiprocessing as mp
+
+# Simulates N gunicorn workers loading the model side by side and reports
+# each one's startup time and memory, for the pickled and the mapped model.
+#   python model_footprint.py [water_model.pkl] [workers]
+
+
+def _memory_kb():
+    """Rss, Pss and private memory of this process from /proc (Linux only)."""
+    fields = {}
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                fields[parts[0].rstrip(":")] = int(parts[1])
+    private = fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0)
+    return fields.get("Rss", 0), fields.get("Pss", 0), private
+
+
+def _worker(mode, model_path, artifact_path, barrier, results):
+    import numpy as np
+    import joblib
+    from forest_compiler import CompiledForest
+
+    base_rss, base_pss, base_private = _memory_kb()
+    started = time.perf_counter()
+    if mode == "pickle":
+        forest = CompiledForest.from_model(joblib.load(model_path))
+    else:
+        forest = CompiledForest.load_artifact(artifact_path)
+    forest.predict_one(np.zeros(forest.n_features))
+    startup = time.perf_counter() - started
+    # Touch every node the way a stream of predictions eventually would
+    forest.predict(np.random.default_rng(0).uniform(0, 100, (2000, forest.n_features)))
+    # Measure while every worker is alive so shared pages are split between them
+    barrier.wait()
+    rss, pss, private = _memory_kb()
+    results.put((startup, rss - base_rss, pss - base_pss, private - base_private))
+    barrier.wait()
+
+
+def measure(mode, model_path, artifact_path, workers):
+    ctx = mp.get_context("spawn")
+    barrier = ctx.Barrier(workers)
+    results = ctx.Queue()
+    procs = [ctx.Process(target=_worker, args=(mode, model_path, artifact_path, barrier, results))
+             for _ in range(workers)]
+    for proc in procs:
+        proc.start()
+    rows = [results.get() for _ in procs]
+    for proc in procs:
+        proc.join()
+    return rows
+
+
+if __name__ == "__main__":
+    from forest_compiler import COMPILED_MODEL_PATH, export_artifact
+    import joblib
+
+    model_path = sys.argv[1] if len(sys.argv) > 1 else "water_model.pkl"
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    export_artifact(joblib.load(model_path), COMPILED_MODEL_PATH)
+    print(f"Model: {model_path} ({os.path.getsize(model_path) / 1024:.0f} KB), "
+          f"artifact: {COMPILED_MODEL_PATH} ({os.path.getsize(COMPILED_MODEL_PATH) / 1024:.0f} KB), "
+          f"{workers} workers")
+    print(f"{'mode':<8}{'startup ms':>12}{'RSS KB':>10}{'PSS KB':>10}{'private KB':>12}")
+    for mode in ("pickle", "mmap"):
+        rows = measure(mode, model_path, COMPILED_MODEL_PATH, workers)
+        startup, rss, pss, private = (sum(col) / len(rows) for col in zip(*rows))
+        print(f"{mode:<8}{startup * 1000:>12.1f}{rss:>10.0f}{pss:>10.0f}{private:>12.0f}")
@@ -0,0 +1,261 @@
+import os
+import sys
+import json
+import hashlib
+import logging
+import threading
+from datetime import datetime
+from contextlib import contextmanager
+
+import joblib
+
+try:
+    import fcntl
+except ImportError:  # Windows: saves from concurrent processes are not serialized
+    fcntl = None
+
+MODEL_REGISTRY_DIR = os.getenv("MODEL_REGISTRY_DIR", "models")
+# Versions kept on disk besides the current one; older ones are pruned on save
+MODEL_REGISTRY_KEEP = int(os.getenv("MODEL_REGISTRY_KEEP", "10"))
+# Model files written before the registry existed, imported on first load in this order:
+# this directory's main.py, train_model.py, then the root main.py and setup.py
+LEGACY_MODEL_PATHS = ("water_model.pkl", "water_prediction_model.pkl", "irrigation_model.pkl",
+                      os.path.join("..", "irrigation_model.pkl"))
+# Column order every registered model is trained on and called with
+FEATURE_COLUMNS = ["soil_moisture", "temperature", "humidity", "rainfall_1d", "rainfall_3d", "raindrop"]
+CURRENT_POINTER = "CURRENT"
+
+
+def file_checksum(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def feature_schema(model):
+    """Feature names and count a fitted model expects."""
+    names = getattr(model, "feature_names_in_", None)
+    n_features = getattr(model, "n_features_in_", None)
+    return {
+        "feature_names": [str(name) for name in names] if names is not None else None,
+        "n_features": int(n_features) if n_features is not None else None,
+    }
+
+
+class ModelManager:
+    """Versioned on-disk registry of trained models.
+
+    Each version is ``<root>/<version>.pkl`` plus ``<version>.json`` holding
+    its SHA-256, feature schema, metrics and origin. ``CURRENT`` names the
+    version in use and is replaced atomically, so readers see either the old
+    or the new pointer. Saved versions are never modified; identical content
+    is not stored twice.
+
+    Loaded models are cached per process by version. load_model() only stats
+    the pointer file, so calling it per request costs no unpickling.
+    """
+
+    _cache = {}
+    _cache_lock = threading.Lock()
+
+    def __init__(self, root=MODEL_REGISTRY_DIR, feature_names=FEATURE_COLUMNS, legacy_paths=LEGACY_MODEL_PATHS,
+                 keep=MODEL_REGISTRY_KEEP):
+        self.root = root
+        self.feature_names = list(feature_names) if feature_names is not None else None
+        self.legacy_paths = legacy_paths
+        self.keep = keep
+        self._pointer_stat = None
+        self._pointer_version = None
+
+    def _path(self, name):
+        return os.path.join(self.root, name)
+
+    def model_path(self, version):
+        return self._path(f"{version}.pkl")
+
+    @contextmanager
+    def _locked(self):
+        os.makedirs(self.root, exist_ok=True)
+        with open(self._path(".lock"), "a") as lock_file:
+            if fcntl is None:
+                yield
+                return
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def metadata(self, version):
+        try:
+            with open(self._path(f"{version}.json")) as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def versions(self):
+        """Metadata of every registered version, oldest first."""
+        if not os.path.isdir(self.root):
+            return []
+        names = sorted(name[:-5] for name in os.listdir(self.root) if name.endswith(".json"))
+        return [meta for meta in map(self.metadata, names) if meta is not None]
+
+    def current_version(self):
+        """Version the pointer names, re-read only when the pointer file changes."""
+        try:
+            st = os.stat(self._path(CURRENT_POINTER))
+        except FileNotFoundError:
+            self._pointer_stat = self._pointer_version = None
+            return None
+        stamp = (st.st_ino, st.st_mtime_ns, st.st_size)
+        if stamp != self._pointer_stat:
+            with open(self._path(CURRENT_POINTER)) as f:
+                self._pointer_version = f.read().strip() or None
+            self._pointer_stat = stamp
+        return self._pointer_version
+
+    def set_current(self, version):
+        """Point CURRENT at an existing version after checking its file."""
+        meta = self.metadata(version)
+        if meta is None:
+            raise ValueError(f"Unknown model version: {version}")
+        if file_checksum(self.model_path(version)) != meta["sha256"]:
+            raise ValueError(f"Checksum mismatch for model version {version}")
+        self._check_schema(meta)
+        tmp_path = self._path(f"{CURRENT_POINTER}.tmp")
+        with open(tmp_path, "w") as f:
+            f.write(f"{version}\n")
+        os.replace(tmp_path, self._path(CURRENT_POINTER))
+        logging.info(f"Current model is now {version}")
+        return version
+
+    def _check_schema(self, meta):
+        names = meta.get("feature_names")
+        if self.feature_names is None:
+            return
+        if names is not None and names != self.feature_names:
+            raise ValueError(f"Model {meta['version']} was trained on {names}, expected {self.feature_names}")
+        if meta.get("n_features") not in (None, len(self.feature_names)):
+            raise ValueError(f"Model {meta['version']} expects {meta['n_features']} features, "
+                             f"not {len(self.feature_names)}")
+
+    def save_model(self, model, metrics=None, source=None, activate=True):
+        """Register a fitted model as a new version (and make it current); returns the version."""
+        schema = feature_schema(model)
+        with self._locked():
+            existing = self.versions()
+            number = int(existing[-1]["version"][1:]) + 1 if existing else 1
+            version = f"v{number:04d}"
+            self._check_schema(dict(schema, version=version))
+            tmp_path = self._path(f"{version}.pkl.tmp")
+            joblib.dump(model, tmp_path, compress=3)
+            checksum = file_checksum(tmp_path)
+            duplicate = next((meta for meta in existing if meta["sha256"] == checksum), None)
+            if duplicate is not None:
+                os.remove(tmp_path)
+                version = duplicate["version"]
+            else:
+                meta = dict(schema, version=version, sha256=checksum, size=os.path.getsize(tmp_path),
+                            created_at=datetime.now().isoformat(timespec="seconds"),
+                            model_type=type(model).__name__,
+                            n_estimators=len(getattr(model, "estimators_", [])) or None,
+                            metrics=metrics or {}, source=source)
+                os.replace(tmp_path, self.model_path(version))
+                # Metadata last: a version is only listed once its model file is complete
+                meta_tmp = self._path(f"{version}.json.tmp")
+                with open(meta_tmp, "w") as f:
+                    json.dump(meta, f, indent=2)
+                os.replace(meta_tmp, self._path(f"{version}.json"))
+                logging.info(f"Registered model {version} ({meta['size']} bytes)")
+            with self._cache_lock:
+                self._cache[(os.path.abspath(self.root), version)] = model
+            if activate:
+                self.set_current(version)
+                self.prune()
+        return version
+
+    def load_model(self, version=None):
+        """Return the current (or given) version's model, or None if there is none.
+
+        The first load of a version verifies its checksum and schema; later
+        calls return the cached object.
+        """
+        if version is None:
+            version = self.current_version()
+            if version is None:
+                version = self.import_legacy()
+                if version is None:
+                    return None
+        key = (os.path.abspath(self.root), version)
+        with self._cache_lock:
+            model = self._cache.get(key)
+        if model is not None:
+            return model
+        meta = self.metadata(version)
+        if meta is None:
+            logging.error(f"Model version {version} is not registered")
+            return None
+        try:
+            if file_checksum(self.model_path(version)) != meta["sha256"]:
+                raise ValueError("checksum mismatch")
+            self._check_schema(meta)
+            model = joblib.load(self.model_path(version))
+        except Exception as e:
+            logging.error(f"Could not load model {version}: {e}")
+            return None
+        with self._cache_lock:
+            self._cache[key] = model
+        logging.info(f"Loaded model {version}")
+        return model
+
+    def import_legacy(self):
+        """Register the first pre-registry model file found; returns its version or None."""
+        for path in self.legacy_paths or ():
+            if not os.path.exists(path):
+                continue
+            try:
+                model = joblib.load(path)
+                return self.save_model(model, source=os.path.abspath(path))
+            except Exception as e:
+                logging.error(f"Could not import legacy model {path}: {e}")
+        return None
+
+    def prune(self):
+        """Delete the oldest versions beyond ``keep``, never the current one."""
+        if not self.keep:
+            return []
+        current = self.current_version()
+        old = [meta["version"] for meta in self.versions() if meta["version"] != current][:-self.keep]
+        for version in old:
+            for name in (f"{version}.json", f"{version}.pkl"):
+                try:
+                    os.remove(self._path(name))
+                except FileNotFoundError:
+                    pass
+            with self._cache_lock:
+                self._cache.pop((os.path.abspath(self.root), version), None)
+        return old
+
+
+if __name__ == "__main__":
+    # python model_manager.py list | current | activate <version> | import <model.pkl>
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    manager = ModelManager()
+    command = sys.argv[1] if len(sys.argv) > 1 else "list"
+    if command == "list":
+        current = manager.current_version()
+        for meta in manager.versions():
+            marker = "*" if meta["version"] == current else " "
+            print(f"{marker} {meta['version']}  {meta['created_at']}  {meta['sha256'][:12]}  "
+                  f"{meta.get('n_estimators')} trees  {meta.get('source') or ''}")
+    elif command == "current":
+        print(manager.current_version())
+    elif command == "activate" and len(sys.argv) > 2:
+        manager.set_current(sys.argv[2])
+    elif command == "import" and len(sys.argv) > 2:
+        print(manager.save_model(joblib.load(sys.argv[2]), source=os.path.abspath(sys.argv[2])))
+    else:
+        print("usage: model_manager.py list | current | activate <version> | import <model.pkl>")
+        sys.exit(1)
@@ -0,0 +1,275 @@
+import os
+import copy
+import time
+import logging
+import threading
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestRegressor
+
+from columnar_log import ColumnarLog, read_columns
+from train_pipeline import FEATURE_COLUMNS, TARGET_COLUMN, MIN_SAMPLES_LEAF, TRAIN_MAX_ROWS, outcome_labels
+
+# Scheduled retrain period in seconds; 0 leaves only drift-triggered refreshes
+MODEL_REFRESH_INTERVAL = int(os.getenv("MODEL_REFRESH_INTERVAL", str(7 * 86400)))
+# How often recent decisions are scored against the live model; 0 disables refreshing
+DRIFT_CHECK_INTERVAL = int(os.getenv("DRIFT_CHECK_INTERVAL", "3600"))
+# Drift is the larger of the inputs' population stability index against the live model's
+# reference window and the relative rise of its MAE on outcome labels; above this it retrains
+DRIFT_THRESHOLD = float(os.getenv("DRIFT_THRESHOLD", "0.25"))
+# Smallest reference MAE (liters) the rise is measured against, so a near-perfect reference
+# does not turn noise of a few hundredths of a liter into drift
+DRIFT_MAE_FLOOR = float(os.getenv("DRIFT_MAE_FLOOR", "1.0"))
+DRIFT_BINS = 10
+DRIFT_WINDOW_HOURS = int(os.getenv("DRIFT_WINDOW_HOURS", "24"))
+REFRESH_WINDOW_DAYS = int(os.getenv("REFRESH_WINDOW_DAYS", "30"))
+# "warm_start" adds trees fitted on the window to the current forest; "refit" replaces it
+MODEL_REFRESH_MODE = os.getenv("MODEL_REFRESH_MODE", "warm_start")
+WARM_START_TREES = 20
+MAX_TREES = 200
+MIN_REFRESH_ROWS = 200
+MIN_DRIFT_ROWS = 50
+HOLDOUT_FRACTION = 0.1
+
+
+def mean_absolute_error(predictions, y):
+    if predictions is None or len(y) == 0:
+        return None
+    return float(np.abs(np.asarray(predictions) - y).mean())
+
+
+def feature_bins(frame, bins=DRIFT_BINS):
+    """Per-feature quantile edges and bin shares of a reference window, for stability_index()."""
+    reference = {}
+    for name in FEATURE_COLUMNS:
+        values = frame[name].to_numpy(dtype=float)
+        edges = np.unique(np.quantile(values, np.linspace(0, 1, bins + 1)[1:-1]))
+        reference[name] = (edges, _bin_shares(values, edges))
+    return reference
+
+
+def _bin_shares(values, edges):
+    counts = np.bincount(np.searchsorted(edges, values, side="right"), minlength=len(edges) + 1)
+    # Floor empty bins so the log ratio stays finite
+    return np.maximum(counts / max(len(values), 1), 1e-4)
+
+
+def stability_index(reference, frame):
+    """Largest population stability index of any feature of ``frame`` against ``reference``."""
+    worst = 0.0
+    for name, (edges, expected) in reference.items():
+        actual = _bin_shares(frame[name].to_numpy(dtype=float), edges)
+        worst = max(worst, float(np.sum((actual - expected) * np.log(actual / expected))))
+    return worst
+
+
+class ModelRefresher:
+    """Retrains the shared model from recent logged decisions without pausing predictions.
+
+    check() runs as a scheduler job and only starts a background thread, so
+    the scheduler never waits on log reads or scoring. When the refresh
+    interval has passed that thread retrains; otherwise it scores the live
+    model on the last DRIFT_WINDOW_HOURS of decisions and retrains if they
+    drifted more than DRIFT_THRESHOLD from the model's reference window: the
+    window it was trained on when this refresher published it, or else the
+    first drift window it was scored on. Drift is measured on signals the
+    model's outputs cannot echo: the shift of the input distribution, and
+    the rise of its error on outcome labels over a reference error of at
+    least DRIFT_MAE_FLOOR. The candidate is scored on the newest
+    HOLDOUT_FRACTION of the window and only published, through
+    IrrigationModel.publish(), if it does no worse than the live model.
+
+    Training and scoring use train_pipeline's labels: automatic decisions
+    labelled by the soil moisture at the next reading (see outcome_labels).
+    """
+
+    def __init__(self, model, log_paths, crop_profiles, mode=MODEL_REFRESH_MODE, interval=MODEL_REFRESH_INTERVAL,
+                 window_days=REFRESH_WINDOW_DAYS, drift_threshold=DRIFT_THRESHOLD):
+        if mode not in ("warm_start", "refit"):
+            raise ValueError(f"Invalid model refresh mode: {mode}")
+        self.model = model
+        # A callable lets a fleet pass zones added after startup
+        self._log_paths = log_paths
+        self.crop_profiles = crop_profiles
+        self.mode = mode
+        self.interval = interval
+        self.window_days = window_days
+        self.drift_threshold = drift_threshold
+        self._lock = threading.Lock()
+        self._thread = None
+        self.last_refresh = time.time()
+        self.last_drift = None
+        self.last_drift_signals = None
+        # (snapshot version, MAE, feature_bins()) the drift of that model is measured against
+        self._reference = None
+        self.last_result = None
+        self.refreshes = 0
+        self.rejected = 0
+
+    def log_paths(self):
+        paths = self._log_paths() if callable(self._log_paths) else self._log_paths
+        return [path for path in paths if os.path.exists(path) or ColumnarLog(path).exists()]
+
+    def load_window(self, window=None):
+        """Labelled decisions over ``window`` (a timedelta) across all logs, oldest first."""
+        start = datetime.now() - (window or timedelta(days=self.window_days))
+        frames = []
+        for path in self.log_paths():
+            # Labelled per log, since the next reading has to come from the same zone
+            frame = outcome_labels(read_columns(path, start=start).reset_index(drop=True), self.crop_profiles)
+            if len(frame):
+                frames.append(frame)
+        if not frames:
+            return pd.DataFrame(columns=["timestamp"] + FEATURE_COLUMNS + [TARGET_COLUMN])
+        frame = pd.concat(frames, ignore_index=True)
+        return frame.sort_values("timestamp", kind="stable").tail(TRAIN_MAX_ROWS)
+
+    def _score(self, frame):
+        return mean_absolute_error(self.model.predict_batch(frame[FEATURE_COLUMNS].to_numpy(dtype=float)),
+                                   frame[TARGET_COLUMN].to_numpy(dtype=float))
+
+    def drift(self):
+        """Drift of the last DRIFT_WINDOW_HOURS from the live model's reference window.
+
+        The larger of the input stability index and the relative MAE rise;
+        both are kept in last_drift_signals.
+        """
+        if not self.model.ready:
+            return None
+        version = self.model.version
+        frame = self.load_window(timedelta(hours=DRIFT_WINDOW_HOURS))
+        if len(frame) < MIN_DRIFT_ROWS:
+            return None
+        recent_mae = self._score(frame)
+        if recent_mae is None:
+            return None
+        if self._reference is None or self._reference[0] != version:
+            # Nothing recorded for this model yet; its first window is the baseline
+            self._reference = (version, recent_mae, feature_bins(frame))
+            return None
+        _, reference_mae, reference_bins = self._reference
+        self.last_drift_signals = {
+            "input_shift": stability_index(reference_bins, frame),
+            "error_rise": (recent_mae - reference_mae) / max(reference_mae, DRIFT_MAE_FLOOR),
+        }
+        return max(self.last_drift_signals.values())
+
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def check(self):
+        """Scheduler job: start a background refresh if one is due, else a background drift check."""
+        if self.interval and time.time() - self.last_refresh >= self.interval:
+            return self.start("scheduled")
+        return self._spawn(self._check_drift_safely)
+
+    def start(self, reason="manual"):
+        return self._spawn(self._refresh_safely, reason)
+
+    def _spawn(self, target, *args):
+        with self._lock:
+            if self.running():
+                return False
+            self._thread = threading.Thread(target=target, args=args, name="model-refresh", daemon=True)
+            self._thread.start()
+        return True
+
+    def _check_drift_safely(self):
+        try:
+            self.last_drift = self.drift()
+            if self.last_drift is not None and self.last_drift > self.drift_threshold:
+                self._refresh_safely(f"drift {self.last_drift:.2f}")
+        except Exception as e:
+            logging.error(f"Model drift check failed: {e}")
+
+    def _refresh_safely(self, reason):
+        try:
+            self.refresh(reason)
+        except Exception as e:
+            logging.error(f"Model refresh failed: {e}")
+            self.last_result = {"reason": reason, "error": str(e)}
+
+    def refresh(self, reason="manual"):
+        """Fit a candidate on the window and publish it if it beats the live model on the holdout."""
+        started = time.perf_counter()
+        self.last_refresh = time.time()
+        frame = self.load_window()
+        if len(frame) < MIN_REFRESH_ROWS:
+            logging.info(f"Skipping model refresh: only {len(frame)} logged decisions in the window")
+            return None
+        # Hold out the newest rows; they are the ones the next model has to predict
+        split = int(len(frame) * (1 - HOLDOUT_FRACTION))
+        train, holdout = frame.iloc[:split], frame.iloc[split:]
+        X, y = train[FEATURE_COLUMNS], train[TARGET_COLUMN].to_numpy(dtype=float)
+
+        current = self.model.model if self.model.ready else None
+        if self.mode == "warm_start" and current is not None and hasattr(current, "estimators_"):
+            candidate = self._warm_start(current, X, y)
+        else:
+            candidate = RandomForestRegressor(n_estimators=100, min_samples_leaf=MIN_SAMPLES_LEAF,
+                                              n_jobs=-1, random_state=42)
+            candidate.fit(X, y)
+
+        old_mae = self._score(holdout) if current is not None else None
+        new_mae = mean_absolute_error(np.maximum(candidate.predict(holdout[FEATURE_COLUMNS]), 0),
+                                      holdout[TARGET_COLUMN].to_numpy(dtype=float))
+        result = {
+            "reason": reason,
+            "mode": self.mode,
+            "rows": len(frame),
+            "trees": len(candidate.estimators_),
+            "old_mae": old_mae,
+            "new_mae": new_mae,
+            "seconds": round(time.perf_counter() - started, 3),
+        }
+        if old_mae is not None and new_mae is not None and new_mae > old_mae:
+            self.rejected += 1
+            result["published"] = False
+            logging.info(f"Refreshed model rejected ({reason}): holdout MAE {new_mae:.3f} > {old_mae:.3f}")
+        else:
+            model_version = self.model.model_manager.save_model(
+                candidate, metrics={"holdout_mae": new_mae, "previous_mae": old_mae}, source=f"refresh:{self.mode}")
+            snapshot = self.model.publish(candidate, model_version)
+            if new_mae is not None:
+                self._reference = (snapshot.version, new_mae, feature_bins(train))
+            self.refreshes += 1
+            result["published"] = True
+            result["version"] = snapshot.version
+            result["model_version"] = model_version
+            logging.info(f"Refreshed model published ({reason}): holdout MAE {new_mae} "
+                         f"(was {old_mae}), {result['trees']} trees")
+        self.last_result = result
+        return result
+
+    @staticmethod
+    def _warm_start(current, X, y):
+        # Grow a copy so the live forest is never touched while it is serving
+        candidate = copy.deepcopy(current)
+        candidate.set_params(warm_start=True, n_estimators=len(candidate.estimators_) + WARM_START_TREES,
+                             min_samples_leaf=MIN_SAMPLES_LEAF, n_jobs=-1)
+        candidate.fit(X, y)
+        if len(candidate.estimators_) > MAX_TREES:
+            # Retire the oldest trees so the forest tracks recent conditions and stays bounded
+            candidate.estimators_ = candidate.estimators_[-MAX_TREES:]
+        candidate.set_params(warm_start=False, n_estimators=len(candidate.estimators_))
+        return candidate
+
+    def schedule(self, scheduler, name="model-refresh"):
+        scheduler.add_job(name, self.check, interval=DRIFT_CHECK_INTERVAL, jitter=60,
+                          initial_delay=DRIFT_CHECK_INTERVAL)
+        return scheduler
+
+    def stats(self):
+        return {
+            "mode": self.mode,
+            "running": self.running(),
+            "model_version": self.model.version,
+            "last_refresh": datetime.fromtimestamp(self.last_refresh).isoformat(timespec="seconds"),
+            "last_drift": self.last_drift,
+            "last_drift_signals": self.last_drift_signals,
+            "last_result": self.last_result,
+            "refreshes": self.refreshes,
+            "rejected": self.rejected,
+        }
@@ -0,0 +1,336 @@
+import io
+import os
+import sys
+import time
+import pstats
+import cProfile
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+# Cycles kept per kind ("auto", "manual") for /admin/cycles
+CYCLE_TRACE_SIZE = int(os.getenv("CYCLE_TRACE_SIZE", "100"))
+# Seconds between stack samples in "sample" profiling mode
+PROFILE_SAMPLE_INTERVAL = float(os.getenv("PROFILE_SAMPLE_INTERVAL", "0.005"))
+PROFILE_MAX_UNITS = 1000
+# A session that has not profiled its units within this many seconds is stopped
+# with what it has, so an idle target cannot keep a session (or sampler) alive
+PROFILE_TIMEOUT = float(os.getenv("PROFILE_TIMEOUT", "300"))
+PROFILE_MAX_TIMEOUT = 3600
+PROFILE_MODES = ("cprofile", "sample")
+PROFILE_TARGETS = ("cycles", "requests")
+
+
+def _percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+class CycleTracer:
+    """Per-stage timings of the most recent control cycles, kept per cycle kind.
+
+    A cycle is opened with ``cycle()``; ``span()`` blocks inside it on the same
+    thread add their elapsed time to that cycle. Outside a cycle a span does
+    nothing, so the same code can run from the API without being recorded.
+    """
+
+    def __init__(self, size=CYCLE_TRACE_SIZE):
+        self.size = size
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._cycles = {}
+
+    @contextmanager
+    def cycle(self, kind, zone=None):
+        record = {"kind": kind, "zone": zone, "started_at": time.time(), "spans": {}, "error": None}
+        previous = getattr(self._local, "current", None)
+        self._local.current = record
+        started = time.perf_counter()
+        try:
+            yield record
+        except Exception as e:
+            record["error"] = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            record["total_ms"] = (time.perf_counter() - started) * 1000
+            self._local.current = previous
+            with self._lock:
+                ring = self._cycles.get(kind)
+                if ring is None:
+                    ring = self._cycles[kind] = deque(maxlen=self.size)
+                ring.append(record)
+
+    @contextmanager
+    def span(self, name):
+        record = getattr(self._local, "current", None)
+        if record is None:
+            yield
+            return
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            spans = record["spans"]
+            spans[name] = spans.get(name, 0.0) + (time.perf_counter() - started) * 1000
+
+    def recent(self, kind=None, limit=None):
+        """Recorded cycles, newest first, with times rounded to microseconds."""
+        with self._lock:
+            records = [record for name, ring in self._cycles.items() if kind in (None, name) for record in ring]
+        records.sort(key=lambda record: record["started_at"], reverse=True)
+        return [dict(record, total_ms=round(record["total_ms"], 3),
+                     spans={name: round(ms, 3) for name, ms in record["spans"].items()})
+                for record in records[:limit]]
+
+    def summary(self):
+        """p50/p95/max per stage and cycle kind over the buffered cycles.
+
+        ``other`` is time inside the cycle not covered by any span.
+        """
+        with self._lock:
+            cycles = {kind: list(ring) for kind, ring in self._cycles.items()}
+        summary = {}
+        for kind, records in cycles.items():
+            stages = {}
+            for record in records:
+                for name, ms in record["spans"].items():
+                    stages.setdefault(name, []).append(ms)
+                stages.setdefault("other", []).append(max(0.0, record["total_ms"] - sum(record["spans"].values())))
+                stages.setdefault("total", []).append(record["total_ms"])
+            stats = {}
+            for name, values in stages.items():
+                values.sort()
+                stats[name] = {"count": len(values), "p50_ms": round(_percentile(values, 0.5), 3),
+                               "p95_ms": round(_percentile(values, 0.95), 3), "max_ms": round(values[-1], 3)}
+            summary[kind] = {"cycles": len(records),
+                             "errors": sum(1 for record in records if record["error"]),
+                             "stages": stats}
+        return summary
+
+
+class ProfileSession:
+    """One armed profiling run covering the next ``count`` cycles or requests.
+
+    Only one unit is profiled at a time: cProfile cannot profile two threads
+    into one report reliably, so a unit that starts while another is being
+    profiled simply runs unprofiled and does not use up the count. A session
+    also ends when it is stopped (cancelled, or past its timeout); the unit
+    being profiled at that moment still finishes.
+    """
+
+    def __init__(self, mode, target, count, top, timeout=PROFILE_TIMEOUT):
+        self.mode = mode
+        self.target = target
+        self.count = count
+        self.top = top
+        self.timeout = timeout
+        self.completed = 0
+        self.started_at = time.time()
+        self.deadline = time.monotonic() + timeout
+        self.stopped = None
+        self.active_thread = None
+        self._lock = threading.Lock()
+        self._profile = cProfile.Profile() if mode == "cprofile" else None
+        self._samples = {}
+        self._sample_count = 0
+        self._sampler = None
+        if mode == "sample":
+            self._sampler = threading.Thread(target=self._sample_loop, name="profile-sampler", daemon=True)
+            self._sampler.start()
+
+    @property
+    def done(self):
+        return self.completed >= self.count or self.stopped is not None
+
+    def stop(self, reason):
+        if self.stopped is None:
+            self.stopped = reason
+
+    def expire(self):
+        """Stop the session if it is past its deadline; returns whether it is done."""
+        if not self.done and time.monotonic() >= self.deadline:
+            self.stop("timeout")
+        return self.done
+
+    def claim(self):
+        with self._lock:
+            if self.expire() or self.active_thread is not None:
+                return False
+            self.active_thread = threading.get_ident()
+        if self._profile is not None:
+            try:
+                self._profile.enable()
+            except ValueError as e:  # another profiler is already active in this process
+                logging.warning(f"Could not start cProfile: {e}")
+                with self._lock:
+                    self.active_thread = None
+                return False
+        return True
+
+    def release(self):
+        if self._profile is not None:
+            self._profile.disable()
+        with self._lock:
+            self.active_thread = None
+            self.completed += 1
+
+    def _sample_loop(self):
+        while not self.done:
+            time.sleep(PROFILE_SAMPLE_INTERVAL)
+            thread_id = self.active_thread
+            if thread_id is None:
+                continue
+            frame = sys._current_frames().get(thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            if stack:
+                key = ";".join(reversed(stack))
+                self._samples[key] = self._samples.get(key, 0) + 1
+                self._sample_count += 1
+
+    def status(self):
+        return {"mode": self.mode, "target": self.target, "count": self.count, "completed": self.completed,
+                "started_at": self.started_at, "timeout": self.timeout, "stopped": self.stopped}
+
+    def result(self):
+        result = dict(self.status(), finished_at=time.time())
+        if self._profile is not None and self.completed == 0:
+            # Stopped before any unit ran; pstats refuses an empty profile
+            result["functions"] = []
+            result["text"] = ""
+        elif self._profile is not None:
+            stats = pstats.Stats(self._profile)
+            rows = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:self.top]
+            result["functions"] = [{
+                "function": f"{os.path.basename(filename)}:{line}({name})",
+                "calls": calls,
+                "primitive_calls": primitive_calls,
+                "self_ms": round(own_time * 1000, 3),
+                "cumulative_ms": round(cumulative_time * 1000, 3),
+            } for (filename, line, name), (primitive_calls, calls, own_time, cumulative_time, _) in rows]
+            text = io.StringIO()
+            stats.stream = text
+            stats.sort_stats("cumulative").print_stats(self.top)
+            result["text"] = text.getvalue()
+        else:
+            # Inclusive counts: a function is charged for every sample it appears anywhere in
+            functions = {}
+            samples = dict(self._samples)
+            for stack, count in samples.items():
+                for frame in set(stack.split(";")):
+                    functions[frame] = functions.get(frame, 0) + count
+            total = self._sample_count or 1
+            result["samples"] = self._sample_count
+            result["interval_ms"] = PROFILE_SAMPLE_INTERVAL * 1000
+            result["functions"] = [{"function": frame, "samples": count, "fraction": round(count / total, 4)}
+                                   for frame, count in sorted(functions.items(), key=lambda item: -item[1])[:self.top]]
+            result["stacks"] = [{"stack": stack, "samples": count}
+                                for stack, count in sorted(samples.items(), key=lambda item: -item[1])[:self.top]]
+        return result
+
+
+class Profiler:
+    """Profiles the next N control cycles or API requests when armed from /admin/profile."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.session = None
+        self.last_result = None
+
+    def start(self, mode="cprofile", target="cycles", count=5, top=30, timeout=PROFILE_TIMEOUT,
+              targets=PROFILE_TARGETS):
+        """Arm a session; ``targets`` are the kinds of unit this process runs."""
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"Unknown profiling mode {mode!r}; choose from {', '.join(PROFILE_MODES)}")
+        if target not in targets:
+            raise ValueError(f"Cannot profile {target!r} here; choose from {', '.join(targets)}")
+        count, top, timeout = int(count), int(top), float(timeout)
+        if not 0 < count <= PROFILE_MAX_UNITS:
+            raise ValueError(f"count must be between 1 and {PROFILE_MAX_UNITS}")
+        if not 0 < timeout <= PROFILE_MAX_TIMEOUT:
+            raise ValueError(f"timeout must be between 0 and {PROFILE_MAX_TIMEOUT} seconds")
+        self.expire()
+        with self._lock:
+            if self.session is not None:
+                raise ValueError("A profiling session is already running")
+            self.session = ProfileSession(mode, target, count, max(1, top), timeout)
+        logging.info(f"Profiling the next {count} {target} ({mode}) for up to {timeout:g}s")
+        return self.session.status()
+
+    def begin(self, target):
+        """Claim the current unit for the armed session; returns it, or None if not profiling."""
+        session = self.session
+        if session is None or session.target != target:
+            return None
+        if not session.claim():
+            if session.done:
+                self._finish(session)
+            return None
+        return session
+
+    def end(self, session):
+        session.release()
+        if session.done:
+            self._finish(session)
+
+    def _finish(self, session):
+        # A unit still being profiled finishes the session from end() instead
+        if session.active_thread is not None:
+            return
+        with self._lock:
+            if self.session is session:
+                self.last_result = session.result()
+                self.session = None
+                logging.info(f"Profiling of {session.completed}/{session.count} {session.target} finished"
+                             + (f" ({session.stopped})" if session.stopped else ""))
+
+    def expire(self):
+        session = self.session
+        if session is not None and session.expire():
+            self._finish(session)
+
+    def cancel(self):
+        """Stop the running session and keep what it has profiled so far as the last result."""
+        session = self.session
+        if session is None:
+            return False
+        session.stop("cancelled")
+        self._finish(session)
+        return True
+
+    @contextmanager
+    def unit(self, target):
+        session = self.begin(target)
+        try:
+            yield
+        finally:
+            if session is not None:
+                self.end(session)
+
+    def status(self):
+        self.expire()
+        session = self.session
+        return {"active": session.status() if session is not None else None, "last": self.last_result}
+
+
+# Shared by every controller in the process, like the HTTP transport
+cycle_tracer = CycleTracer()
+profiler = Profiler()
+
+
+@contextmanager
+def traced_cycle(kind, zone=None, profile=True):
+    """Record a control cycle's stage timings and, if ``profile``, count it as a profiling unit."""
+    with (profiler.unit("cycles") if profile else _untraced()), cycle_tracer.cycle(kind, zone):
+        yield
+
+
+@contextmanager
+def _untraced():
+    yield
+
+
+span = cycle_tracer.span
@@ -0,0 +1,358 @@
+import os
+import sys
+import atexit
+import sqlite3
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+try:
+    import fcntl
+except ImportError:  # Windows: rebuilds are not serialized against other processes' flushes
+    fcntl = None
+
+import numpy as np
+import pandas as pd
+
+from log_index import log_segments, TIMESTAMP_FORMAT
+from log_writer import LOG_FLUSH_INTERVAL
+from columnar_log import ColumnarLog, CONVERT_CHUNK_ROWS, epoch_bound
+
+ROLLUP_DB = os.getenv("ROLLUP_DB", "rollups.db")
+ROLLUP_FLUSH_INTERVAL = float(os.getenv("ROLLUP_FLUSH_INTERVAL", "5.0"))
+DEFAULT_ZONE = "default"
+# Every other mode (ML-Model, Fallback) is a decision the controller predicted itself
+MANUAL_MODE = "Manual"
+CHUNK_COLUMNS = ("timestamp", "water_amount", "water_needed", "mode", "crop_type")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS water_rollup (
+    day TEXT NOT NULL,
+    zone TEXT NOT NULL,
+    crop_type TEXT NOT NULL,
+    mode TEXT NOT NULL,
+    decisions INTEGER NOT NULL,
+    water_total REAL NOT NULL,
+    needed_total REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, zone, crop_type, mode)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS rollup_rebuilt (
+    zone TEXT PRIMARY KEY,
+    logged_before TEXT NOT NULL
+);
+"""
+
+UPSERT = """
+INSERT INTO water_rollup (day, zone, crop_type, mode, decisions, water_total, needed_total)
+VALUES (?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (day, zone, crop_type, mode) DO UPDATE SET
+    decisions = decisions + excluded.decisions,
+    water_total = water_total + excluded.water_total,
+    needed_total = needed_total + excluded.needed_total
+"""
+
+
+class RollupStore:
+    """Daily water totals per zone, crop and mode, kept current as decisions are logged.
+
+    Each bucket sums both the water delivered (water_amount) and the model's
+    prediction before the rainfall adjustment (water_needed).
+
+    record() only bumps an in-memory counter; a background thread folds the
+    pending deltas into SQLite with one UPSERT per touched bucket. Weekly
+    totals are summed from the daily rows at query time, which stays cheap
+    because there is one row per day and bucket, not per decision.
+
+    Every process that logs decisions keeps its own pending deltas, so a
+    rebuild holds an exclusive lock file, during which flushes keep their
+    deltas in memory, and records per zone the log timestamp it counted up
+    to. Deltas for rows logged before that mark are dropped when flushed.
+    """
+
+    def __init__(self, path=ROLLUP_DB, flush_interval=ROLLUP_FLUSH_INTERVAL):
+        # Absolute, so the lock file and late flushes stay put if the process changes directory
+        self.path = os.path.abspath(path)
+        self.lock_path = f"{self.path}.lock"
+        self.flush_interval = flush_interval
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._closed = False
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(water_rollup)")}
+            if "needed_total" not in columns:
+                # Existing buckets read 0 until `python rollups.py rebuild` recounts them from the logs
+                conn.execute("ALTER TABLE water_rollup ADD COLUMN needed_total REAL NOT NULL DEFAULT 0")
+                logging.warning(f"Added needed_total to {self.path}; rebuild to fill in earlier days")
+        self._flusher = threading.Thread(target=self._flush_loop, name="rollup-flush", daemon=True)
+        self._flusher.start()
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def record(self, data, zone=None, logged_at=None):
+        """Add one logged decision to its day/zone/crop/mode bucket.
+
+        ``logged_at`` is the timestamp the decision log stamped the row with.
+        """
+        logged_at = (logged_at or datetime.now()).strftime(TIMESTAMP_FORMAT)
+        # Kept per second until flushed, so a rebuild's mark can split them
+        key = (logged_at[:10], str(zone or DEFAULT_ZONE), data["crop_type"], data["mode"], logged_at)
+        water = float(data["water_amount"])
+        needed = float(data.get("water_needed", water))
+        with self._lock:
+            bucket = self._pending.get(key)
+            if bucket is None:
+                self._pending[key] = [1, water, needed]
+            else:
+                bucket[0] += 1
+                bucket[1] += water
+                bucket[2] += needed
+
+    def flush(self):
+        """Write the pending deltas; returns the buckets written, 0 while a rebuild runs."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        # SQLite is written outside self._lock so record() never waits on the disk
+        try:
+            with self._file_lock(exclusive=False) as locked:
+                if not locked:
+                    self._restore(pending)
+                    return 0
+                with self._connect() as conn:
+                    rebuilt = dict(conn.execute("SELECT zone, logged_before FROM rollup_rebuilt").fetchall())
+                    totals = {}
+                    for (day, zone, crop_type, mode, logged_at), deltas in pending.items():
+                        if logged_at < rebuilt.get(zone, ""):
+                            # Already counted from the raw log by a rebuild
+                            continue
+                        bucket = totals.setdefault((day, zone, crop_type, mode), [0, 0.0, 0.0])
+                        for i, delta in enumerate(deltas):
+                            bucket[i] += delta
+                    conn.executemany(UPSERT, [key + tuple(bucket) for key, bucket in totals.items()])
+        except sqlite3.Error:
+            # Fold the deltas back in so the next flush retries them
+            self._restore(pending)
+            raise
+        return len(totals)
+
+    def _restore(self, pending):
+        with self._lock:
+            for key, deltas in pending.items():
+                bucket = self._pending.setdefault(key, [0, 0.0, 0.0])
+                for i, delta in enumerate(deltas):
+                    bucket[i] += delta
+
+    @contextmanager
+    def _file_lock(self, exclusive):
+        """Shared for flushes, which skip rather than wait; exclusive and blocking for rebuilds."""
+        with open(self.lock_path, "a") as lock_file:
+            if fcntl is None:
+                yield True
+                return
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH | fcntl.LOCK_NB)
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _flush_loop(self):
+        while not self._closed:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                logging.error(f"Error writing rollups: {e}")
+
+    def query(self, period="day", since=None, until=None, zone=None, crop_type=None, mode=None):
+        """Totals per period, zone, crop and mode, plus predicted-vs-actual per period.
+
+        In the summary, predicted_water is what the model asked for and
+        delivered_water what was sent for those same decisions after the
+        rainfall adjustment; manual_water is sent on request and actual_water
+        is everything delivered.
+        """
+        if period not in ("day", "week"):
+            raise ValueError(f"Invalid period: {period}")
+        self.flush()
+        # Weeks start on Monday and are labelled by that date
+        period_expr = "day" if period == "day" else "date(day, '-' || ((strftime('%w', day) + 6) % 7) || ' days')"
+        clauses = []
+        params = []
+        for column, value in (("zone", zone), ("crop_type", crop_type), ("mode", mode)):
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        if since is not None:
+            clauses.append("day >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("day <= ?")
+            params.append(until)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        rows = self._connect().execute(
+            f"SELECT {period_expr} AS period, zone, crop_type, mode, SUM(decisions) AS decisions, "
+            f"SUM(water_total) AS water_total, SUM(needed_total) AS needed_total FROM water_rollup {where} "
+            f"GROUP BY period, zone, crop_type, mode ORDER BY period, zone, crop_type, mode", params).fetchall()
+        buckets = [dict(row) for row in rows]
+
+        summary = {}
+        for bucket in buckets:
+            totals = summary.setdefault(bucket["period"], {"period": bucket["period"], "predicted_water": 0.0,
+                                                           "delivered_water": 0.0, "manual_water": 0.0,
+                                                           "actual_water": 0.0})
+            if bucket["mode"] == MANUAL_MODE:
+                totals["manual_water"] += bucket["water_total"]
+            else:
+                totals["predicted_water"] += bucket["needed_total"]
+                totals["delivered_water"] += bucket["water_total"]
+            totals["actual_water"] += bucket["water_total"]
+        return buckets, list(summary.values())
+
+    def rebuild(self, zone_logs, chunk_rows=CONVERT_CHUNK_ROWS):
+        """Recompute the rollups of the given {zone: log_path} from their raw logs.
+
+        Rows logged before the mark are counted from the logs and rows after it
+        from the deltas flushed once the lock is released, so running this next
+        to a live controller neither loses nor double-counts decisions.
+        """
+        self.flush()
+        with self._file_lock(exclusive=True):
+            # Flushes are blocked from here on, so every flushed delta so far was
+            # stamped within the current second at the latest; start the mark after it
+            time.sleep(1 - time.time() % 1)
+            logged_before = datetime.now().strftime(TIMESTAMP_FORMAT)
+            # Give every writer time to put rows stamped before the mark on disk
+            time.sleep(LOG_FLUSH_INTERVAL + 1)
+            rebuilt = {}
+            for zone, log_path in zone_logs.items():
+                totals = None
+                for chunk in iter_log_chunks(log_path, chunk_rows, before=logged_before):
+                    grouped = aggregate_chunk(chunk)
+                    totals = grouped if totals is None else totals.add(grouped, fill_value=0)
+                rebuilt[zone] = totals
+            with self._connect() as conn:
+                for zone, totals in rebuilt.items():
+                    conn.execute("DELETE FROM water_rollup WHERE zone = ?", (zone,))
+                    conn.execute("INSERT OR REPLACE INTO rollup_rebuilt (zone, logged_before) VALUES (?, ?)",
+                                 (zone, logged_before))
+                    if totals is None:
+                        continue
+                    conn.executemany(UPSERT, [
+                        (day, zone, crop_type, mode, int(row.decisions), float(row.water_total),
+                         float(row.needed_total))
+                        for (day, crop_type, mode), row in totals.iterrows()
+                    ])
+                    logging.info(f"Rebuilt rollups for zone {zone} up to {logged_before}: {len(totals)} buckets")
+        return {zone: 0 if totals is None else int(totals["decisions"].sum()) for zone, totals in rebuilt.items()}
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            self._closed = True
+
+
+def iter_log_chunks(log_path, chunk_rows=CONVERT_CHUNK_ROWS, before=None):
+    """Yield DataFrames of day, water_amount, water_needed, mode and crop_type from either backend.
+
+    ``before`` is an exclusive timestamp bound in the log's format. Rows logged
+    before water_needed was get their water_amount, as format_row would.
+    """
+    columnar = ColumnarLog(log_path)
+    if columnar.exists():
+        for records in columnar.records():
+            if before is not None:
+                records = records[records["timestamp"] < epoch_bound(before)]
+            for start in range(0, len(records), chunk_rows):
+                part = records[start:start + chunk_rows]
+                yield pd.DataFrame({
+                    "day": (part["timestamp"] // 86400).astype("datetime64[D]").astype(str),
+                    "water_amount": part["water_amount"],
+                    "water_needed": np.where(np.isnan(part["water_needed"]), part["water_amount"],
+                                             part["water_needed"]),
+                    "mode": columnar.dictionary.categorical("mode", part["mode"]),
+                    "crop_type": columnar.dictionary.categorical("crop_type", part["crop_type"]),
+                })
+        return
+    for segment in log_segments(log_path):
+        for chunk in pd.read_csv(segment, usecols=lambda column: column in CHUNK_COLUMNS, chunksize=chunk_rows):
+            if before is not None:
+                chunk = chunk[chunk["timestamp"] < before].copy()
+            if "water_needed" not in chunk:
+                chunk["water_needed"] = chunk["water_amount"]
+            else:
+                chunk["water_needed"] = chunk["water_needed"].fillna(chunk["water_amount"])
+            # The timestamp text starts with the date, so no datetime parsing is needed
+            chunk["day"] = chunk.pop("timestamp").str[:10]
+            yield chunk
+
+
+def aggregate_chunk(chunk):
+    keys = [chunk["day"], chunk["crop_type"].astype(str), chunk["mode"].astype(str)]
+    grouped = chunk.groupby(keys)
+    return pd.DataFrame({
+        "decisions": grouped["water_amount"].count(),
+        "water_total": grouped["water_amount"].sum(),
+        "needed_total": grouped["water_needed"].sum(),
+    })
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def open_rollup_store(path=ROLLUP_DB, **kwargs):
+    """Return the process-wide store for ``path``, creating it on first use."""
+    key = os.path.abspath(path)
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None or store._closed:
+            store = RollupStore(path, **kwargs)
+            _stores[key] = store
+        return store
+
+
+@atexit.register
+def close_all():
+    with _stores_lock:
+        stores = list(_stores.values())
+    for store in stores:
+        try:
+            store.close()
+        except Exception as e:
+            logging.error(f"Error closing rollups {store.path}: {e}")
+
+
+if __name__ == "__main__":
+    # python rollups.py rebuild [zones.json]
+    # Without a zones file the single default zone and irrigation_log.csv are rebuilt.
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    if len(sys.argv) < 2 or sys.argv[1] != "rebuild":
+        print("usage: rollups.py rebuild [zones.json]")
+        sys.exit(1)
+    if len(sys.argv) > 2:
+        import json
+        zone_log_dir = os.getenv("ZONE_LOG_DIR", "logs")
+        with open(sys.argv[2]) as f:
+            zone_logs = {str(entry["zone_id"]): entry.get("log_file")
+                         or os.path.join(zone_log_dir, f"{entry['zone_id']}.csv") for entry in json.load(f)}
+    else:
+        zone_logs = {DEFAULT_ZONE: "irrigation_log.csv"}
+    for zone, count in open_rollup_store().rebuild(zone_logs).items():
+        print(f"{zone}: {count} decisions")
@@ -0,0 +1,207 @@
+import time
+import heapq
+import random
+import logging
+import itertools
+import threading
+
+from metrics import histogram, counter, FAST_BUCKETS
+
+JOB_SECONDS = histogram("greenguard_job_duration_seconds", "Scheduled job run time", ("job",),
+                        buckets=FAST_BUCKETS + (2.5, 5.0, 10.0, 30.0, 60.0))
+JOB_LAG = histogram("greenguard_job_lag_seconds", "How late a scheduled job started", ("job",),
+                    buckets=FAST_BUCKETS + (2.5, 5.0, 10.0, 30.0, 60.0))
+JOB_FAILURES = counter("greenguard_job_failures_total", "Scheduled job runs that raised", ("job",))
+
+
+class Job:
+    """A periodic task with its own interval, jitter, retry backoff and timing stats."""
+
+    def __init__(self, name, func, interval, jitter=0.0, retry_base=None, retry_max=None, on_error=None):
+        self.name = name
+        self.func = func
+        self.interval = float(interval)
+        self.jitter = float(jitter)
+        self.retry_base = retry_base
+        self.retry_max = retry_max if retry_max is not None else self.interval
+        self.on_error = on_error
+        self.cancelled = False
+        # Drift-free base deadline; the actual run time adds jitter on top
+        self.base_deadline = 0.0
+        self.deadline = 0.0
+        self.runs = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.last_lateness = 0.0
+        self.max_lateness = 0.0
+        self.total_lateness = 0.0
+        self.last_duration = 0.0
+        self.max_duration = 0.0
+        # Fleet jobs are named "<zone>:<job>"; metrics aggregate per job kind so series stay few
+        kind = name.rsplit(":", 1)[-1]
+        self._duration_metric = JOB_SECONDS.labels(kind)
+        self._lag_metric = JOB_LAG.labels(kind)
+        self._failure_metric = JOB_FAILURES.labels(kind)
+
+    def _jittered(self, base):
+        return base + (random.uniform(0, self.jitter) if self.jitter > 0 else 0.0)
+
+    def stats(self):
+        return {
+            "interval": self.interval,
+            "runs": self.runs,
+            "failures": self.failures,
+            "consecutive_failures": self.consecutive_failures,
+            "last_lateness": self.last_lateness,
+            "max_lateness": self.max_lateness,
+            "mean_lateness": self.total_lateness / self.runs if self.runs else 0.0,
+            "last_duration": self.last_duration,
+            "max_duration": self.max_duration,
+        }
+
+
+class Scheduler:
+    """Heap-based timer scheduler driven by the monotonic clock.
+
+    Jobs keep their own cadence: a successful run schedules the next one an
+    interval after the previous *deadline*, so timing does not drift with run
+    time, and missed slots are skipped rather than replayed. A job that raises
+    is retried with exponential backoff if it has a ``retry_base``.
+
+    With an ``executor`` due jobs are handed to its worker threads, so a slow
+    job only delays itself; a job is never run concurrently with itself.
+    """
+
+    def __init__(self, clock=time.monotonic, executor=None):
+        self.clock = clock
+        self.executor = executor
+        self._heap = []
+        self._jobs = {}
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._stopped = False
+
+    def add_job(self, name, func, interval, jitter=0.0, initial_delay=0.0, retry_base=None,
+                retry_max=None, on_error=None):
+        """Register ``func`` to run every ``interval`` seconds, first after ``initial_delay``."""
+        job = Job(name, func, interval, jitter=jitter, retry_base=retry_base,
+                  retry_max=retry_max, on_error=on_error)
+        job.base_deadline = self.clock() + initial_delay
+        job.deadline = job._jittered(job.base_deadline)
+        with self._cond:
+            if name in self._jobs:
+                self._jobs[name].cancelled = True
+            self._jobs[name] = job
+            heapq.heappush(self._heap, (job.deadline, next(self._seq), job))
+            self._cond.notify()
+        return job
+
+    def remove_job(self, name):
+        with self._cond:
+            job = self._jobs.pop(name, None)
+            if job is not None:
+                job.cancelled = True
+            self._cond.notify()
+
+    def jobs(self):
+        with self._cond:
+            return list(self._jobs.values())
+
+    def _pop_due(self, now):
+        """Pop the next due job, or return (None, seconds until the next deadline)."""
+        with self._cond:
+            while self._heap:
+                deadline, _, job = self._heap[0]
+                if job.cancelled:
+                    heapq.heappop(self._heap)
+                    continue
+                if deadline > now:
+                    return None, deadline - now
+                heapq.heappop(self._heap)
+                return job, 0.0
+            return None, None
+
+    def _reschedule(self, job, now, failed):
+        if failed and job.retry_base is not None:
+            delay = min(job.retry_max, job.retry_base * (2 ** (job.consecutive_failures - 1)))
+            job.base_deadline = now + delay
+        else:
+            job.base_deadline += job.interval
+            if job.base_deadline <= now:
+                # Skip the slots we overran instead of running them back to back
+                missed = int((now - job.base_deadline) // job.interval) + 1
+                job.base_deadline += missed * job.interval
+        job.deadline = job._jittered(job.base_deadline)
+        with self._cond:
+            if not job.cancelled:
+                heapq.heappush(self._heap, (job.deadline, next(self._seq), job))
+                self._cond.notify()
+
+    def _execute(self, job):
+        now = self.clock()
+        lateness = max(0.0, now - job.deadline)
+        job.last_lateness = lateness
+        job.max_lateness = max(job.max_lateness, lateness)
+        job.total_lateness += lateness
+        job.runs += 1
+        job._lag_metric.observe(lateness)
+
+        failed = False
+        try:
+            job.func()
+            job.consecutive_failures = 0
+        except Exception as e:
+            failed = True
+            job.failures += 1
+            job.consecutive_failures += 1
+            job._failure_metric.inc()
+            logging.error(f"Job {job.name} failed: {e}")
+            if job.on_error is not None:
+                try:
+                    job.on_error(job, e)
+                except Exception as handler_error:
+                    logging.error(f"Error handler for job {job.name} failed: {handler_error}")
+
+        finished = self.clock()
+        job.last_duration = finished - now
+        job.max_duration = max(job.max_duration, job.last_duration)
+        job._duration_metric.observe(job.last_duration)
+        self._reschedule(job, finished, failed)
+
+    def run_pending(self):
+        """Run every job that is due; returns seconds until the next deadline (or None)."""
+        while True:
+            now = self.clock()
+            job, wait = self._pop_due(now)
+            if job is None:
+                return wait
+            if self.executor is not None:
+                self.executor.submit(self._execute, job)
+            else:
+                self._execute(job)
+
+    def run(self):
+        """Run jobs until stop() is called."""
+        with self._cond:
+            self._stopped = False
+        while True:
+            self.run_pending()
+            with self._cond:
+                if self._stopped:
+                    break
+                # Recompute under the lock so a job pushed meanwhile is not missed
+                wait = self._heap[0][0] - self.clock() if self._heap else None
+                if wait is not None and wait <= 0:
+                    continue
+                self._cond.wait(timeout=wait)
+                if self._stopped:
+                    break
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+
+    def stats(self):
+        """Per-job run counts, failures, lateness and duration."""
+        return {job.name: job.stats() for job in self.jobs()}
@@ -0,0 +1,251 @@
+import os
+import sys
+import json
+import math
+import time
+import zlib
+import random
+import logging
+import argparse
+import threading
+from datetime import datetime, timezone
+from urllib.parse import urlsplit, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# Local stand-in for the ThingSpeak and OpenWeather endpoints the controller
+# calls, so the API and fleet can be load-tested without real channels:
+#   python simulator.py --port 8081 --channels 5000 --latency-ms 80 --error-rate 0.01
+#   THINGSPEAK_BASE_URL=http://127.0.0.1:8081 OPENWEATHER_BASE_URL=http://127.0.0.1:8081 \
+#       python fleet.py zones.json
+# Readings are a deterministic function of channel and time, so every worker
+# and every run sees the same feed without shared state.
+
+SIM_PORT = int(os.getenv("SIM_PORT", "8081"))
+SIM_CHANNELS = int(os.getenv("SIM_CHANNELS", "1000"))
+SIM_LATENCY_MS = float(os.getenv("SIM_LATENCY_MS", "0"))
+SIM_JITTER_MS = float(os.getenv("SIM_JITTER_MS", "0"))
+SIM_ERROR_RATE = float(os.getenv("SIM_ERROR_RATE", "0"))
+# How often each simulated channel gets a new entry, like a device posting every 15 s
+SIM_ENTRY_INTERVAL = 15
+# Chance that an entry carries a manual irrigation request (field5 = 1)
+SIM_MANUAL_RATE = float(os.getenv("SIM_MANUAL_RATE", "0.01"))
+MAX_RESULTS = 8000
+FORECAST_SLOTS = 40
+
+
+def _unit(*key):
+    """Deterministic pseudo-random number in [0, 1) for a key, the same in every process."""
+    return zlib.crc32(repr(key).encode()) / 2 ** 32
+
+
+def _iso(ts):
+    return datetime.fromtimestamp(ts, tz=timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def channel_entry(channel, entry_id):
+    """Entry ``entry_id`` of a channel: a daily soil-moisture cycle plus noise."""
+    ts = entry_id * SIM_ENTRY_INTERVAL
+    day_phase = 2 * math.pi * (ts % 86400) / 86400
+    offset = _unit(channel, "offset") * 20
+    noise = _unit(channel, entry_id) - 0.5
+    manual = _unit(channel, entry_id, "manual") < SIM_MANUAL_RATE
+    return {
+        "created_at": _iso(ts),
+        "entry_id": entry_id,
+        "field1": f"{35 + offset + 15 * math.cos(day_phase) + 4 * noise:.1f}",
+        "field2": f"{27 + 7 * math.sin(day_phase - 1.5) + noise:.1f}",
+        "field3": f"{60 - 15 * math.sin(day_phase - 1.5) + 6 * noise:.0f}",
+        "field4": f"{900 - 300 * max(0.0, _unit(channel, entry_id // 240, 'rain') - 0.8) * 5:.0f}",
+        "field5": "1" if manual else "0",
+        "field6": f"{10 + 20 * _unit(channel, entry_id, 'amount'):.1f}" if manual else "0",
+    }
+
+
+def forecast(lat, lon, now=None):
+    """OpenWeather /forecast shape: 40 three-hourly slots with occasional rain."""
+    slot = int((now or time.time()) // 10800)
+    entries = []
+    for i in range(FORECAST_SLOTS):
+        wet = _unit(round(lat, 2), round(lon, 2), slot + i)
+        entry = {"dt": (slot + i) * 10800, "main": {"temp": 22 + 8 * wet, "humidity": 50 + 40 * wet}}
+        if wet > 0.75:
+            entry["rain"] = {"3h": round((wet - 0.75) * 20, 2)}
+        entries.append(entry)
+    return {"cod": "200", "cnt": len(entries), "list": entries,
+            "city": {"coord": {"lat": lat, "lon": lon}, "name": "Simulated"}}
+
+
+class SimulatorStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = {}
+        self.writes = {}
+
+    def count(self, name):
+        with self._lock:
+            self.counts[name] = self.counts.get(name, 0) + 1
+
+    def write(self, api_key):
+        with self._lock:
+            entry_id = self.writes.get(api_key, 0) + 1
+            self.writes[api_key] = entry_id
+            return entry_id
+
+    def snapshot(self):
+        with self._lock:
+            return {"requests": dict(self.counts), "write_keys": len(self.writes),
+                    "writes": sum(self.writes.values())}
+
+
+class SimulatorHandler(BaseHTTPRequestHandler):
+    # Keep-alive, so the controller's pooled sessions behave as they do against the real APIs
+    protocol_version = "HTTP/1.1"
+    server_version = "GreenGuardSimulator/1.0"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body):
+        data = body if isinstance(body, bytes) else json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _delay_or_fail(self, kind):
+        config = self.server.config
+        if config["latency_ms"] or config["jitter_ms"]:
+            time.sleep(max(0.0, random.gauss(config["latency_ms"], config["jitter_ms"])) / 1000)
+        if config["error_rate"] and random.random() < config["error_rate"]:
+            self.server.stats.count(f"{kind}:error")
+            self._send(random.choice((500, 503)), {"error": "simulated upstream failure"})
+            return True
+        self.server.stats.count(kind)
+        return False
+
+    def _channel(self, value):
+        channel = int(value)
+        if not 0 < channel <= self.server.config["channels"] and channel != self.server.config["default_channel"]:
+            raise KeyError(channel)
+        return channel
+
+    def do_GET(self):
+        parts = urlsplit(self.path)
+        query = {key: values[-1] for key, values in parse_qs(parts.query).items()}
+        segments = parts.path.strip("/").split("/")
+        try:
+            if parts.path == "/data/2.5/forecast":
+                if self._delay_or_fail("forecast"):
+                    return
+                self._send(200, forecast(float(query.get("lat", 0)), float(query.get("lon", 0))))
+            elif len(segments) == 3 and segments[0] == "channels" and segments[2] == "feeds.json":
+                channel = self._channel(segments[1])
+                if self._delay_or_fail("feeds"):
+                    return
+                results = max(1, min(int(query.get("results", 100)), MAX_RESULTS))
+                last = int(time.time() // SIM_ENTRY_INTERVAL)
+                feeds = [channel_entry(channel, entry_id) for entry_id in range(last - results + 1, last + 1)]
+                self._send(200, {"channel": {"id": channel, "name": f"Simulated {channel}",
+                                             "last_entry_id": last}, "feeds": feeds})
+            elif (len(segments) == 5 and segments[0] == "channels" and segments[2] == "fields"
+                  and segments[4] == "last.json"):
+                channel = self._channel(segments[1])
+                if self._delay_or_fail("field"):
+                    return
+                field = f"field{int(segments[3])}"
+                entry = channel_entry(channel, int(time.time() // SIM_ENTRY_INTERVAL))
+                self._send(200, {"created_at": entry["created_at"], "entry_id": entry["entry_id"],
+                                 field: entry.get(field)})
+            elif parts.path == "/sim/stats":
+                self._send(200, self.server.stats.snapshot())
+            else:
+                self._send(404, {"error": "not found"})
+        except KeyError:
+            self._send(404, {"error": "channel not found"})
+        except ValueError as e:
+            self._send(400, {"error": str(e)})
+
+    def do_POST(self):
+        parts = urlsplit(self.path)
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length).decode() if length else ""
+        if parts.path != "/update":
+            self._send(404, {"error": "not found"})
+            return
+        if self._delay_or_fail("update"):
+            return
+        fields = {key: values[-1] for key, values in parse_qs(body or parts.query).items()}
+        api_key = fields.get("api_key")
+        if not api_key:
+            # ThingSpeak answers a rejected update with 200 and entry id 0
+            self._send(200, b"0")
+            return
+        self._send(200, str(self.server.stats.write(api_key)).encode())
+
+
+class SimulatorServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, address, config):
+        super().__init__(address, SimulatorHandler)
+        self.config = config
+        self.stats = SimulatorStats()
+
+
+def start_simulator(port=SIM_PORT, channels=SIM_CHANNELS, latency_ms=SIM_LATENCY_MS, jitter_ms=SIM_JITTER_MS,
+                    error_rate=SIM_ERROR_RATE, default_channel=2300946, host="127.0.0.1"):
+    """Serve on a background thread (port 0 picks a free one); returns the server."""
+    server = SimulatorServer((host, port), {
+        "channels": channels,
+        "latency_ms": latency_ms,
+        "jitter_ms": jitter_ms,
+        "error_rate": error_rate,
+        "default_channel": default_channel,
+    })
+    threading.Thread(target=server.serve_forever, name="simulator", daemon=True).start()
+    return server
+
+
+def simulated_zones(count, lat=28.3167, lon=76.9833):
+    """Zone entries for fleet.py, one per simulated channel, spread over ~20 forecast locations."""
+    from irrigation_controller import CROP_PROFILES
+    crops = tuple(CROP_PROFILES)
+    return [{
+        "zone_id": f"sim-{i}",
+        "channel_id": str(i),
+        "read_api_key": f"R{i}",
+        "write_api_key": f"W{i}",
+        "crop_type": crops[i % len(crops)],
+        "lat": round(lat + (i % 20) * 0.05, 4),
+        "lon": round(lon + (i % 20) * 0.05, 4),
+    } for i in range(1, count + 1)]
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    parser = argparse.ArgumentParser(description="Local ThingSpeak/OpenWeather simulator")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=SIM_PORT)
+    parser.add_argument("--channels", type=int, default=SIM_CHANNELS)
+    parser.add_argument("--latency-ms", type=float, default=SIM_LATENCY_MS)
+    parser.add_argument("--jitter-ms", type=float, default=SIM_JITTER_MS)
+    parser.add_argument("--error-rate", type=float, default=SIM_ERROR_RATE)
+    parser.add_argument("--write-zones", metavar="PATH", help="write a zones file for the simulated channels and exit")
+    args = parser.parse_args()
+
+    if args.write_zones:
+        with open(args.write_zones, "w") as f:
+            json.dump(simulated_zones(args.channels), f, indent=2)
+        print(f"Wrote {args.channels} zones to {args.write_zones}")
+        sys.exit(0)
+    server = start_simulator(args.port, args.channels, args.latency_ms, args.jitter_ms, args.error_rate,
+                             host=args.host)
+    logging.info(f"Simulating {args.channels} channels on http://{args.host}:{server.server_address[1]} "
+                 f"(latency {args.latency_ms}±{args.jitter_ms} ms, error rate {args.error_rate:.1%})")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,94 @@
+import os
+import asyncio
+import logging
+import argparse
+import functools
+
+from aiohttp import web
+
+from events import event_broker, BrokerFull, STREAM_HEARTBEAT, STREAM_RETRY_MS
+from metrics import REGISTRY, CONTENT_TYPE
+
+BROKER = web.AppKey("broker", object)
+HEARTBEAT = web.AppKey("heartbeat", float)
+
+# Production /stream: one event loop holds every client connection, so an idle client
+# costs a socket and a queue, not a thread. See Procfile.
+#   python stream_server.py --port 5002
+STREAM_PORT = int(os.getenv("STREAM_PORT", "5002"))
+
+
+def _last_event_id(request):
+    try:
+        return int(request.headers.get("Last-Event-ID", ""))
+    except ValueError:
+        return None
+
+
+async def stream_events(request):
+    """Server-Sent Events, as the Flask /stream route: ``?events=`` filters, Last-Event-ID resumes."""
+    broker = request.app[BROKER]
+    loop = asyncio.get_running_loop()
+    events = request.query.get("events")
+    # subscribe() reads the replay from SQLite; keep that off the loop
+    subscribe = functools.partial(broker.subscribe, kinds=events.split(",") if events else None,
+                                  last_event_id=_last_event_id(request), loop=loop)
+    try:
+        subscription = await loop.run_in_executor(None, subscribe)
+    except BrokerFull as e:
+        return web.json_response({"error": str(e)}, status=503)
+    try:
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache",
+                                               "X-Accel-Buffering": "no"})
+        await response.prepare(request)
+        await response.write(f"retry: {STREAM_RETRY_MS}\n\n".encode())
+        while True:
+            events = await subscription.wait_async(request.app[HEARTBEAT])
+            await response.write(subscription.render(events).encode())
+    except ConnectionResetError:
+        # The heartbeat write finds clients that went away
+        logging.debug("Stream client disconnected")
+        return response
+    finally:
+        broker.unsubscribe(subscription)
+
+
+async def get_metrics(request):
+    """Every metric of this process in the Prometheus text format."""
+    return web.Response(body=REGISTRY.render().encode(), headers={"Content-Type": CONTENT_TYPE})
+
+
+async def _start_reading_poller(app):
+    # The controller is built on first use; that loads the model, so not on the loop
+    from irrigation_controller import get_controller, start_reading_poller
+
+    await asyncio.get_running_loop().run_in_executor(None, lambda: start_reading_poller(get_controller()))
+
+
+def create_stream_app(broker=event_broker, heartbeat=STREAM_HEARTBEAT, poll_readings=True):
+    """aiohttp app serving /stream and /metrics.
+
+    With ``poll_readings`` the shared sensor reading is refreshed while anyone
+    is connected, as under the Flask stream role.
+    """
+    app = web.Application()
+    app[BROKER] = broker
+    app[HEARTBEAT] = heartbeat
+    app.router.add_get("/stream", stream_events)
+    app.router.add_get("/metrics", get_metrics)
+    if poll_readings:
+        app.on_startup.append(_start_reading_poller)
+    return app
+
+
+if __name__ == "__main__":
+    from log_writer import disable_rotation
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    parser = argparse.ArgumentParser(description="GreenGuard /stream server")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=STREAM_PORT)
+    args = parser.parse_args()
+    # The controller process owns log rotation
+    disable_rotation()
+    web.run_app(create_stream_app(), host=args.host, port=args.port)
@@ -0,0 +1,8 @@
+import os
+import sys
+
+# The modules are flat files in the project directory, not an installed package
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_DIR)
+# history_store sits beside the dashboard API one level up; appended so its main.py never shadows ours
+sys.path.append(os.path.dirname(PROJECT_DIR))
@@ -0,0 +1,177 @@
+import time
+import asyncio
+import threading
+from types import SimpleNamespace
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+import irrigation_controller as ic
+from async_client import AsyncFleetController
+
+
+class StandIn:
+    """Local ThingSpeak/OpenWeather stand-in with per-channel delay and failure."""
+
+    def __init__(self, delays=None, failing=(), manual=()):
+        self.delays = delays or {}
+        self.failing = set(failing)
+        self.manual = set(manual)
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.writes = []
+
+    async def _enter(self, channel):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delays.get(channel, 0))
+        finally:
+            self.in_flight -= 1
+
+    async def feeds(self, request):
+        channel = request.match_info["channel"]
+        await self._enter(channel)
+        if channel in self.failing:
+            return web.json_response({"error": "upstream down"}, status=500)
+        manual = "1" if channel in self.manual else "0"
+        return web.json_response({"feeds": [{"field1": "20.0", "field2": "30.0", "field3": "40", "field4": "900",
+                                             "field5": manual, "field6": "12.5" if manual == "1" else "0"}]})
+
+    async def field(self, request):
+        channel = request.match_info["channel"]
+        await self._enter(channel)
+        field = f"field{request.match_info['field']}"
+        manual = channel in self.manual
+        value = {"field5": "1" if manual else "0", "field6": "12.5" if manual else "0"}[field]
+        return web.json_response({field: value})
+
+    async def update(self, request):
+        data = await request.post()
+        self.writes.append(dict(data))
+        return web.Response(text=str(len(self.writes)))
+
+    async def forecast(self, request):
+        return web.json_response({"list": [{"rain": {"3h": 0.5}} for _ in range(8)]})
+
+    def app(self):
+        app = web.Application()
+        app.router.add_get("/channels/{channel}/feeds.json", self.feeds)
+        app.router.add_get("/channels/{channel}/fields/{field}/last.json", self.field)
+        app.router.add_post("/update", self.update)
+        app.router.add_get("/data/2.5/forecast", self.forecast)
+        return app
+
+
+class RecordingNotifier:
+    def __init__(self):
+        self.alerts = []
+
+    def send_alert(self, message):
+        self.alerts.append(message)
+        return True
+
+
+def build_fleet(base_url, channels, tmp_path, single_request=False):
+    weather = ic.WeatherService(f"{base_url}/data/2.5/forecast", cache_file=None)
+    notifier = RecordingNotifier()
+    # An untrained model makes decide() use the offline rule, which is enough here
+    model = SimpleNamespace(ready=False)
+    controllers = {}
+    for channel in channels:
+        thingspeak = ic.ThingSpeakInterface(f"{base_url}/channels/{channel}/feeds.json", f"{base_url}/update",
+                                            f"W{channel}", single_request=single_request, channel_id=channel)
+        thingspeak.feed_url = f"{base_url}/channels/{channel}/feeds.json"
+        thingspeak.manual_control_url = f"{base_url}/channels/{channel}/fields/5/last.json"
+        thingspeak.manual_value_url = f"{base_url}/channels/{channel}/fields/6/last.json"
+        controllers[channel] = ic.IrrigationController(crop_type="wheat", model=model, thingspeak=thingspeak,
+                                                       weather=weather, notifier=notifier,
+                                                       log_file=str(tmp_path / f"{channel}.csv"), zone_id=channel)
+    return SimpleNamespace(controllers=controllers), notifier
+
+
+async def poll(stand_in, channels, tmp_path, job="run_cycle", concurrency=64, single_request=False):
+    server = TestServer(stand_in.app())
+    await server.start_server()
+    try:
+        fleet, notifier = build_fleet(str(server.make_url("")).rstrip("/"), channels, tmp_path, single_request)
+        controller = AsyncFleetController(fleet, concurrency=concurrency)
+        logged = []
+        for zone_controller in fleet.controllers.values():
+            zone_controller.log_data = lambda row, zone=zone_controller.zone_id: logged.append(
+                (zone, row, threading.current_thread() is threading.main_thread()))
+        await controller._open()
+        try:
+            started = time.monotonic()
+            result = await controller.poll_all(getattr(controller, job))
+            return result, time.monotonic() - started, notifier, logged
+        finally:
+            await controller.close()
+    finally:
+        await server.close()
+
+
+@pytest.fixture(autouse=True)
+def workdir(tmp_path, monkeypatch):
+    # Rollup and log files default to relative paths
+    monkeypatch.chdir(tmp_path)
+
+
+def test_slow_channels_do_not_hold_up_the_rest(tmp_path):
+    channels = [f"c{i}" for i in range(10)]
+    stand_in = StandIn(delays={f"c{i}": 0.5 for i in range(5)})
+    (succeeded, failed), elapsed, _, logged = asyncio.run(poll(stand_in, channels, tmp_path))
+    assert (succeeded, failed) == (10, 0)
+    # Sequential polling would take 2.5 s
+    assert elapsed < 1.5
+    assert sorted(zone for zone, _, _ in logged) == sorted(channels)
+    # Low soil moisture needs water, so every zone sent a command
+    assert len(stand_in.writes) == 10
+
+
+def test_failing_channel_is_reported_and_others_complete(tmp_path):
+    channels = ["ok1", "bad", "ok2"]
+    stand_in = StandIn(failing={"bad"})
+    (succeeded, failed), _, notifier, logged = asyncio.run(poll(stand_in, channels, tmp_path))
+    assert (succeeded, failed) == (2, 1)
+    assert sorted(zone for zone, _, _ in logged) == ["ok1", "ok2"]
+    assert notifier.alerts == ["[bad] Sensor data not received from ThingSpeak!"]
+    assert {write["api_key"] for write in stand_in.writes} == {"Wok1", "Wok2"}
+
+
+def test_concurrency_is_bounded(tmp_path):
+    channels = [f"c{i}" for i in range(12)]
+    stand_in = StandIn(delays={channel: 0.1 for channel in channels})
+    (succeeded, _), _, _, _ = asyncio.run(poll(stand_in, channels, tmp_path, concurrency=3))
+    assert succeeded == 12
+    assert stand_in.max_in_flight == 3
+
+
+def test_blocking_work_runs_off_the_event_loop(tmp_path):
+    _, _, _, logged = asyncio.run(poll(StandIn(), ["c1"], tmp_path))
+    [(_, row, on_main_thread)] = logged
+    assert row["mode"] == "Fallback"
+    assert not on_main_thread
+
+
+@pytest.mark.parametrize("single_request", [False, True])
+def test_manual_request_writes_logs_and_alerts(tmp_path, single_request):
+    stand_in = StandIn(manual={"m1"})
+    (succeeded, failed), _, notifier, logged = asyncio.run(
+        poll(stand_in, ["m1", "idle"], tmp_path, job="handle_manual_request", single_request=single_request))
+    assert (succeeded, failed) == (2, 0)
+    assert stand_in.writes == [{"api_key": "Wm1", "field1": "12.5", "field2": "1"}]
+    assert [(zone, row["is_manual"]) for zone, row, _ in logged] == [("m1", 1)]
+    assert notifier.alerts == ["[m1] Manual irrigation completed: 12.50 liters"]
+
+
+def test_cycles_publish_readings_decisions_and_manual_runs(tmp_path, monkeypatch):
+    published = []
+    monkeypatch.setattr(ic.event_broker, "publish", lambda kind, payload: published.append((kind, payload)))
+    asyncio.run(poll(StandIn(), ["c1"], tmp_path))
+    asyncio.run(poll(StandIn(manual={"m1"}), ["m1"], tmp_path, job="handle_manual_request"))
+    assert [(kind, payload["zone"]) for kind, payload in published] == [
+        ("reading", "c1"), ("decision", "c1"), ("manual", "m1")]
+    assert published[1][1]["mode"] == "Fallback"
+    assert (published[2][1]["water_amount"], published[2][1]["success"]) == (12.5, True)
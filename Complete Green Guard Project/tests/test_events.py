@@ -0,0 +1,70 @@
+import pytest
+
+import events
+from events import EventBroker
+
+
+@pytest.fixture
+def db(tmp_path):
+    return str(tmp_path / "events.db")
+
+
+def frames(subscription, timeout=2.0):
+    return [(event_id, kind) for event_id, kind, _ in subscription.wait(timeout)]
+
+
+def test_events_published_by_another_process_reach_subscribers(db):
+    controller, stream = EventBroker(db), EventBroker(db)
+    subscription = stream.subscribe()
+    first = controller.publish("decision", {"zone": "a", "water_amount": 3.5})
+    second = controller.publish("reading", {"zone": "a", "soil_moisture": 41})
+    # Delivered by the stream process's relay thread within a poll interval
+    assert frames(subscription) + frames(subscription, 0.5) == [(first, "decision"), (second, "reading")]
+
+
+def test_last_event_id_resumes_on_a_different_process(db):
+    controller, worker_a, worker_b = EventBroker(db), EventBroker(db), EventBroker(db)
+    worker_a.subscribe()
+    ids = [controller.publish("decision" if i % 2 else "reading", {"i": i}) for i in range(6)]
+    worker_b.relay()
+    worker_b.subscribe()
+    worker_b.relay()
+
+    # The client saw ids[1] on worker_a, then reconnected to worker_b
+    resumed = worker_b.subscribe(kinds=["decision"], last_event_id=ids[1])
+    assert frames(resumed) == [(ids[3], "decision"), (ids[5], "decision")]
+    later = controller.publish("decision", {"i": 6})
+    worker_b.relay()
+    assert frames(resumed) == [(later, "decision")]
+
+
+def test_new_subscribers_only_get_new_events(db):
+    broker = EventBroker(db)
+    broker.publish("decision", {"i": 0})
+    subscription = broker.subscribe()
+    assert subscription.wait(0.3) == []
+    event_id = broker.publish("decision", {"i": 1})
+    assert frames(subscription) == [(event_id, "decision")]
+
+
+def test_slow_subscriber_drops_oldest_events(db):
+    broker = EventBroker(db)
+    subscription = broker.subscribe(maxsize=2)
+    ids = [broker.publish("reading", {"i": i}) for i in range(5)]
+    broker.relay()
+    assert frames(subscription) == [(ids[3], "reading"), (ids[4], "reading")]
+    assert subscription.dropped == 3
+
+
+def test_nothing_is_recorded_while_nobody_listens(db, monkeypatch):
+    controller, stream = EventBroker(db), EventBroker(db)
+    assert controller.publish("decision", {"i": 0}) is None
+    subscription = stream.subscribe()
+    recorded = controller.publish("decision", {"i": 1})
+    assert frames(subscription) == [(recorded, "decision")]
+
+    # Still recorded for a while after the last client left, so it can resume
+    stream.unsubscribe(subscription)
+    assert controller.publish("decision", {"i": 2}) is not None
+    monkeypatch.setattr(events, "STREAM_RESUME_GRACE", 0)
+    assert controller.publish("decision", {"i": 3}) is None
@@ -0,0 +1,73 @@
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.ensemble import RandomForestRegressor
+
+from forest_compiler import CompiledForest, load_compiled
+
+COLUMNS = ["soil_moisture", "temperature", "humidity", "rainfall_1d", "rainfall_3d", "raindrop"]
+
+
+@pytest.fixture(scope="module")
+def model():
+    rng = np.random.default_rng(0)
+    X = pd.DataFrame(rng.uniform(0, 100, (2000, len(COLUMNS))), columns=COLUMNS)
+    y = 0.6 * (60 - X["soil_moisture"]) + 0.2 * X["temperature"] - 0.5 * X["rainfall_1d"] + rng.normal(0, 2, len(X))
+    return RandomForestRegressor(n_estimators=25, max_depth=12, random_state=0).fit(X, y)
+
+
+@pytest.fixture(scope="module")
+def rows():
+    # Wider than the training range so rows also reach the outermost leaves
+    return np.random.default_rng(1).uniform(-20, 120, (5000, len(COLUMNS)))
+
+
+def test_predict_batch_matches_sklearn(model, rows):
+    forest = CompiledForest.from_model(model)
+    expected = model.predict(pd.DataFrame(rows, columns=COLUMNS))
+    np.testing.assert_allclose(forest.predict(rows), expected, rtol=0, atol=1e-9)
+
+
+def test_predict_one_matches_sklearn(model, rows):
+    forest = CompiledForest.from_model(model)
+    for row in rows[:200]:
+        expected = model.predict(pd.DataFrame([row], columns=COLUMNS))[0]
+        assert forest.predict_one(row) == pytest.approx(expected, abs=1e-9)
+
+
+def test_rows_on_split_thresholds_match_sklearn(model):
+    # float32 rounding decides which side of a split a value lands on
+    forest = CompiledForest.from_model(model)
+    tree = model.estimators_[0].tree_
+    split = tree.feature >= 0
+    rows = np.full((int(split.sum()), len(COLUMNS)), 50.0)
+    rows[np.arange(len(rows)), tree.feature[split]] = tree.threshold[split]
+    expected = model.predict(pd.DataFrame(rows, columns=COLUMNS))
+    np.testing.assert_allclose(forest.predict(rows), expected, rtol=0, atol=1e-9)
+
+
+def test_artifact_round_trip_matches_sklearn(model, rows, tmp_path):
+    path = str(tmp_path / "model.forest")
+    CompiledForest.from_model(model).save_artifact(path)
+    forest = load_compiled(path)
+    expected = model.predict(pd.DataFrame(rows, columns=COLUMNS))
+    np.testing.assert_allclose(forest.predict(rows), expected, rtol=0, atol=1e-9)
+
+
+@pytest.mark.parametrize("bad", [np.nan, np.inf, -np.inf])
+def test_non_finite_input_is_rejected_like_sklearn(model, rows, bad):
+    forest = CompiledForest.from_model(model)
+    batch = rows[:10].copy()
+    batch[3, 2] = bad
+    with pytest.raises(ValueError):
+        model.predict(pd.DataFrame(batch, columns=COLUMNS))
+    with pytest.raises(ValueError):
+        forest.predict(batch)
+    with pytest.raises(ValueError):
+        forest.predict_one(batch[3])
+
+
+def test_wrong_feature_count_is_rejected(model, rows):
+    forest = CompiledForest.from_model(model)
+    with pytest.raises(ValueError):
+        forest.predict(rows[:, :5])
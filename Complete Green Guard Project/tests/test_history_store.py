@@ -0,0 +1,82 @@
+import pytest
+
+from history_store import HistoryStore, decode_cursor, encode_cursor
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = HistoryStore(str(tmp_path / "history.db"), flush_interval=60, seed=False)
+    yield store
+    store.close()
+
+
+def add_days(store, days, per_day=1, zone=None):
+    for day in days:
+        for i in range(per_day):
+            store.add({"date": day, "actual_water": 40 + i, "predicted_water": 38 + i}, zone=zone)
+
+
+def pages(store, limit, **filters):
+    """Every page of a query, following next_cursor until it runs out."""
+    result = []
+    cursor = None
+    while True:
+        records, cursor = store.query(limit=limit, cursor=cursor, **filters)
+        result.append(records)
+        if cursor is None:
+            return result
+
+
+def test_cursor_is_date_and_id():
+    assert encode_cursor({"date": "2025-02-21", "id": 17}) == "2025-02-21|17"
+    assert decode_cursor("2025-02-21|17") == ("2025-02-21", 17)
+    for bad in ("17", "2025-02-21|", "|17"):
+        with pytest.raises(ValueError):
+            decode_cursor(bad)
+
+
+def test_pages_walk_every_row_newest_first_without_gaps_or_repeats(store):
+    add_days(store, [f"2025-03-{day:02d}" for day in range(1, 11)])
+    walked = pages(store, limit=3)
+    assert [len(page) for page in walked] == [3, 3, 3, 1]
+    dates = [record["date"] for page in walked for record in page]
+    assert dates == [f"2025-03-{day:02d}" for day in range(10, 0, -1)]
+
+
+def test_rows_sharing_a_date_are_split_across_pages_by_id(store):
+    add_days(store, ["2025-03-01", "2025-03-02"], per_day=5)
+    walked = pages(store, limit=4)
+    ids = [record["id"] for page in walked for record in page]
+    assert len(ids) == len(set(ids)) == 10
+    keys = [(record["date"], record["id"]) for page in walked for record in page]
+    assert keys == sorted(keys, reverse=True)
+
+
+def test_last_full_page_has_no_next_cursor(store):
+    add_days(store, ["2025-03-01", "2025-03-02", "2025-03-03", "2025-03-04"])
+    first, cursor = store.query(limit=2)
+    second, cursor = store.query(limit=2, cursor=cursor)
+    assert len(second) == 2 and cursor is None
+
+
+def test_empty_results_give_an_empty_page(store):
+    assert store.query(limit=10) == ([], None)
+    add_days(store, ["2025-03-01"])
+    assert store.query(limit=10, since="2025-04-01") == ([], None)
+    # A cursor past the oldest row is an empty page, not an error
+    assert store.query(limit=10, cursor="2025-01-01|1") == ([], None)
+
+
+def test_filters_apply_on_every_page(store):
+    add_days(store, [f"2025-03-{day:02d}" for day in range(1, 9)], zone="north")
+    add_days(store, [f"2025-03-{day:02d}" for day in range(1, 9)], zone="south")
+    walked = pages(store, limit=2, zone="north", since="2025-03-03", until="2025-03-07")
+    records = [record for page in walked for record in page]
+    assert {record["zone"] for record in records} == {"north"}
+    assert [record["date"] for record in records] == [f"2025-03-{day:02d}" for day in range(7, 2, -1)]
+
+
+def test_queries_see_rows_still_queued_for_the_batch_insert(store):
+    store.add({"date": "2025-03-01", "actual_water": 40})
+    records, _ = store.query()
+    assert [(record["actual_water"], record["predicted_water"]) for record in records] == [(40.0, 40.0)]
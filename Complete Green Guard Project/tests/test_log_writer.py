@@ -0,0 +1,133 @@
+import os
+import time
+
+import pytest
+
+import log_writer
+from log_index import log_segments, read_range
+from log_writer import LogWriter, LOG_HEADER
+
+ROW = {"soil_moisture": 41.0, "temperature": 29.3, "humidity": 58, "water_amount": 3.5, "water_needed": 4.0,
+       "mode": "ML-Model", "crop_type": "wheat"}
+
+
+@pytest.fixture
+def max_open(monkeypatch):
+    def set_limit(limit):
+        monkeypatch.setattr(log_writer._open_writers, "limit", limit)
+    return set_limit
+
+
+def rows(path):
+    with open(path) as f:
+        return f.read().splitlines()
+
+
+def open_descriptors():
+    return len(os.listdir("/proc/self/fd"))
+
+
+@pytest.mark.skipif(not os.path.isdir("/proc/self/fd"), reason="needs /proc")
+def test_writers_past_the_cap_close_their_files_until_the_next_flush(tmp_path, max_open):
+    max_open(3)
+    before = open_descriptors()
+    writers = [LogWriter(str(tmp_path / f"zone-{i}.csv"), flush_interval=60) for i in range(20)]
+    try:
+        for _ in range(2):
+            for writer in writers:
+                writer.write(ROW)
+                writer.flush()
+        # Each open writer holds its log and its index
+        assert open_descriptors() - before <= 2 * 3
+    finally:
+        for writer in writers:
+            writer.close()
+    for i in range(20):
+        lines = rows(tmp_path / f"zone-{i}.csv")
+        assert lines[0] == LOG_HEADER.strip() and len(lines) == 3
+
+
+def test_rows_reach_disk_on_flush_not_on_write(tmp_path):
+    path = str(tmp_path / "log.csv")
+    writer = LogWriter(path, flush_interval=60)
+    try:
+        logged_at = writer.write(ROW)
+        assert rows(path) == [LOG_HEADER.strip()]
+        writer.flush()
+        assert rows(path)[1] == log_writer.format_row(ROW, logged_at.strftime("%Y-%m-%d %H:%M:%S")).strip()
+    finally:
+        writer.close()
+
+
+def test_shared_flusher_writes_rows_after_the_interval(tmp_path):
+    path = str(tmp_path / "log.csv")
+    writer = LogWriter(path, flush_interval=0.1)
+    try:
+        writer.write(ROW)
+        deadline = time.monotonic() + 2
+        while len(rows(path)) < 2 and time.monotonic() < deadline:
+            time.sleep(0.02)
+        assert len(rows(path)) == 2
+    finally:
+        writer.close()
+
+
+def test_close_flushes_and_refuses_further_writes(tmp_path):
+    path = str(tmp_path / "log.csv")
+    writer = LogWriter(path, flush_interval=60)
+    writer.write(ROW)
+    writer.close()
+    assert len(rows(path)) == 2
+    with pytest.raises(ValueError):
+        writer.write(ROW)
+
+
+def test_rotation_past_max_bytes_starts_a_new_file_with_a_header(tmp_path):
+    path = str(tmp_path / "log.csv")
+    writer = LogWriter(path, flush_interval=60, max_bytes=600)
+    try:
+        for _ in range(20):
+            writer.write(ROW)
+            writer.flush()
+    finally:
+        writer.close()
+    segments = log_segments(path)
+    assert len(segments) > 2 and segments[-1] == path
+    total = 0
+    for segment in segments:
+        lines = rows(segment)
+        assert lines[0] == LOG_HEADER.strip()
+        assert os.path.getsize(segment) <= 600
+        total += len(lines) - 1
+    assert total == 20
+    # Every segment keeps its own index, so range reads still cover all rows
+    assert len(list(read_range(path))) == 20
+
+
+def test_changed_columns_move_the_old_file_to_a_segment(tmp_path):
+    path = tmp_path / "log.csv"
+    path.write_text("timestamp,water_amount\n2024-01-01 00:00:00,1.00\n")
+    writer = LogWriter(str(path), flush_interval=60)
+    writer.write(ROW)
+    writer.close()
+    old, active = log_segments(str(path))
+    assert rows(old) == ["timestamp,water_amount", "2024-01-01 00:00:00,1.00"]
+    assert rows(active)[0] == LOG_HEADER.strip() and len(rows(active)) == 2
+
+
+def test_writer_without_rotation_follows_a_rename_by_another_process(tmp_path, monkeypatch):
+    path = str(tmp_path / "log.csv")
+    controller, worker = LogWriter(path, flush_interval=60), LogWriter(path, flush_interval=60)
+    try:
+        controller.write(ROW)
+        controller.rotate()
+        monkeypatch.setattr(log_writer, "_rotation_enabled", False)
+        worker.write(ROW)
+        worker.flush()
+    finally:
+        worker.close()
+        controller.close()
+    segment, active = log_segments(path)
+    # The worker's row went to the new active file, not the renamed segment
+    assert len(rows(segment)) == 2
+    assert rows(active)[0] == LOG_HEADER.strip() and len(rows(active)) == 2
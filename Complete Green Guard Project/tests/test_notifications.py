@@ -0,0 +1,126 @@
+import time
+import socket
+from email import message_from_bytes, policy
+
+import pytest
+from aiosmtpd.controller import Controller
+
+import irrigation_controller as ic
+
+
+class RecordingHandler:
+    def __init__(self):
+        self.messages = []
+        self.sessions = set()
+
+    async def handle_DATA(self, server, session, envelope):
+        # One client port per SMTP connection
+        self.sessions.add(session.peer)
+        self.messages.append(message_from_bytes(envelope.content, policy=policy.default))
+        return "250 OK"
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def smtp():
+    handler = RecordingHandler()
+    controller = Controller(handler, hostname="127.0.0.1", port=_free_port())
+    controller.start()
+    yield handler, controller.port
+    controller.stop()
+
+
+def notifier_for(port, digest_window=60):
+    return ic.NotificationService("alerts@example.com", "", "farmer@example.com", smtp_host="127.0.0.1",
+                                  smtp_port=port, starttls=False, digest_window=digest_window)
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.02)
+    return True
+
+
+def test_send_alert_does_not_block_and_reuses_one_connection(smtp):
+    handler, port = smtp
+    notifier = notifier_for(port)
+    started = time.perf_counter()
+    for i in range(3):
+        assert notifier.send_alert(f"Alert {i}")
+    assert time.perf_counter() - started < 0.1
+    assert notifier.flush(timeout=5)
+    assert [m["Subject"] for m in handler.messages] == ["GreenGuard Irrigation Alert"] * 3
+    assert [m.get_content().strip() for m in handler.messages] == ["Alert 0", "Alert 1", "Alert 2"]
+    assert len(handler.sessions) == 1
+    assert notifier.stats()["sent"] == 3
+
+
+def test_reconnects_when_the_server_dropped_the_connection(smtp):
+    handler, port = smtp
+    notifier = notifier_for(port)
+    notifier.send_alert("first")
+    assert notifier.flush(timeout=5)
+    # Next send sees SMTPServerDisconnected, as after a server-side timeout
+    notifier._server.close()
+    notifier.send_alert("second")
+    assert notifier.flush(timeout=5)
+    assert [m.get_content().strip() for m in handler.messages] == ["first", "second"]
+    assert len(handler.sessions) == 2
+    assert notifier.stats()["failed"] == 0
+
+
+def test_repeated_alerts_collapse_into_one_digest(smtp):
+    handler, port = smtp
+    notifier = notifier_for(port, digest_window=0.5)
+    for _ in range(5):
+        notifier.send_alert("Sensor data not received from ThingSpeak!")
+    notifier.send_alert("System error: boom")
+    assert notifier.flush(timeout=5)
+    # The first of each distinct alert goes out at once; the repeats wait for the window
+    assert len(handler.messages) == 2
+    assert notifier.stats()["suppressed"] == 4
+
+    assert wait_for(lambda: len(handler.messages) == 3)
+    digest = handler.messages[2]
+    assert digest["Subject"] == "GreenGuard Irrigation Alert Digest"
+    assert "Repeated 4 times" in digest.get_content()
+    assert "Sensor data not received from ThingSpeak!" in digest.get_content()
+    assert notifier.stats()["pending_digests"] == 0
+
+
+def test_digests_are_rate_limited_to_one_per_window(smtp):
+    handler, port = smtp
+    notifier = notifier_for(port, digest_window=0.5)
+    notifier.send_alert("flapping")
+    notifier.send_alert("flapping")
+    assert notifier.flush(timeout=5)
+    assert wait_for(lambda: len(handler.messages) == 2)
+    digest_sent = time.monotonic()
+
+    # Repeats right after a digest are held until the next window closes
+    notifier.send_alert("flapping")
+    notifier.send_alert("flapping")
+    assert notifier.flush(timeout=5)
+    assert len(handler.messages) == 2
+    assert wait_for(lambda: len(handler.messages) == 3)
+    assert time.monotonic() - digest_sent >= 0.4
+    assert "Repeated 2 times" in handler.messages[2].get_content()
+    assert len(handler.sessions) == 1
+
+
+def test_unreachable_server_counts_failures_without_blocking_the_caller():
+    notifier = notifier_for(_free_port())
+    started = time.perf_counter()
+    notifier.send_alert("nobody listening")
+    assert time.perf_counter() - started < 0.1
+    assert notifier.flush(timeout=30)
+    assert notifier.stats()["failed"] == 1
+    assert notifier.stats()["sent"] == 0
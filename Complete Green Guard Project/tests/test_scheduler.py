@@ -0,0 +1,122 @@
+import random
+
+import pytest
+
+from scheduler import Scheduler
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def scheduler(clock):
+    return Scheduler(clock=clock)
+
+
+def test_due_jobs_run_in_deadline_order(clock, scheduler):
+    ran = []
+    scheduler.add_job("slow", lambda: ran.append("slow"), interval=60, initial_delay=30)
+    scheduler.add_job("fast", lambda: ran.append("fast"), interval=60, initial_delay=10)
+    scheduler.add_job("later", lambda: ran.append("later"), interval=60, initial_delay=50)
+    assert scheduler.run_pending() == pytest.approx(10)
+    clock.advance(40)
+    assert scheduler.run_pending() == pytest.approx(10)
+    assert ran == ["fast", "slow"]
+
+
+def test_deadlines_follow_the_interval_and_skip_missed_slots(clock, scheduler):
+    ran = []
+    job = scheduler.add_job("tick", lambda: ran.append(clock()), interval=10)
+    scheduler.run_pending()
+    clock.advance(3)
+    assert scheduler.run_pending() == pytest.approx(7)
+    # Running 25 s late drops the two missed slots instead of replaying them
+    clock.advance(32)
+    scheduler.run_pending()
+    assert len(ran) == 2
+    assert job.base_deadline == pytest.approx(1040)
+    assert scheduler.run_pending() == pytest.approx(5)
+
+
+def test_jitter_delays_each_run_within_its_bound(clock, scheduler):
+    random.seed(7)
+    job = scheduler.add_job("jittered", lambda: None, interval=100, jitter=20)
+    deadlines = []
+    for _ in range(50):
+        deadlines.append(job.deadline - job.base_deadline)
+        clock.now = job.deadline
+        scheduler.run_pending()
+    assert all(0 <= offset <= 20 for offset in deadlines)
+    assert len(set(deadlines)) > 1
+    # Jitter never accumulates into the base cadence
+    assert job.base_deadline == pytest.approx(1000 + 50 * 100)
+
+
+def test_failures_back_off_exponentially_up_to_the_cap(clock, scheduler):
+    errors = []
+
+    def failing():
+        raise RuntimeError("upstream down")
+
+    job = scheduler.add_job("flaky", failing, interval=300, retry_base=5, retry_max=30,
+                            on_error=lambda job, e: errors.append(str(e)))
+    waits = []
+    for _ in range(5):
+        scheduler.run_pending()
+        waits.append(job.deadline - clock())
+        clock.now = job.deadline
+    assert waits == [5, 10, 20, 30, 30]
+    assert job.failures == job.consecutive_failures == 5
+    assert errors == ["upstream down"] * 5
+
+
+def test_success_after_failures_returns_to_the_interval(clock, scheduler):
+    outcomes = iter([RuntimeError("down"), None])
+
+    def job_func():
+        outcome = next(outcomes)
+        if outcome is not None:
+            raise outcome
+
+    job = scheduler.add_job("recovering", job_func, interval=60, retry_base=5)
+    scheduler.run_pending()
+    clock.now = job.deadline
+    scheduler.run_pending()
+    assert job.consecutive_failures == 0 and job.failures == 1
+    assert job.deadline - clock() == pytest.approx(60)
+
+
+def test_stats_report_lateness_and_runs(clock, scheduler):
+    scheduler.add_job("late", lambda: None, interval=10)
+    scheduler.run_pending()
+    clock.advance(12)
+    scheduler.run_pending()
+    clock.advance(8)
+    scheduler.run_pending()
+    stats = scheduler.stats()["late"]
+    assert stats["runs"] == 3
+    assert stats["last_lateness"] == pytest.approx(0)
+    assert stats["max_lateness"] == pytest.approx(2)
+    assert stats["mean_lateness"] == pytest.approx(2 / 3)
+
+
+def test_removed_jobs_never_run_again(clock, scheduler):
+    ran = []
+    scheduler.add_job("gone", lambda: ran.append(1), interval=10, initial_delay=5)
+    scheduler.remove_job("gone")
+    clock.advance(100)
+    assert scheduler.run_pending() is None
+    assert ran == [] and scheduler.stats() == {}
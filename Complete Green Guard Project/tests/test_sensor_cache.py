@@ -0,0 +1,112 @@
+import time
+import threading
+
+import pytest
+
+import irrigation_controller as ic
+from irrigation_controller import SensorReadingCache
+
+READING = {"soil_moisture": 41.0, "temperature": 29.3, "humidity": 58.0, "raindrop": 900.0}
+
+
+class SlowThingSpeak:
+    """read_sensor_data() stand-in that blocks until released and counts its calls."""
+
+    def __init__(self, result=READING):
+        self.result = result
+        self.calls = 0
+        self.release = threading.Event()
+        self.entered = threading.Event()
+
+    def read_sensor_data(self):
+        self.calls += 1
+        self.entered.set()
+        self.release.wait(5)
+        return dict(self.result) if self.result else None
+
+
+@pytest.fixture(autouse=True)
+def published(monkeypatch):
+    events = []
+    monkeypatch.setattr(ic.event_broker, "publish", lambda kind, payload: events.append((kind, payload)))
+    return events
+
+
+def age_by(cache, seconds):
+    cache._fetched_at -= seconds
+
+
+def get_concurrently(cache, thingspeak, callers):
+    results = [None] * callers
+
+    def get(i):
+        results[i] = cache.get()
+
+    threads = [threading.Thread(target=get, args=(i,)) for i in range(callers)]
+    threads[0].start()
+    assert thingspeak.entered.wait(2)
+    for thread in threads[1:]:
+        thread.start()
+    # Let the others queue behind the in-flight read before it returns
+    time.sleep(0.1)
+    thingspeak.release.set()
+    for thread in threads:
+        thread.join(5)
+    return results
+
+
+def test_fresh_reading_is_served_from_cache():
+    thingspeak = SlowThingSpeak()
+    thingspeak.release.set()
+    cache = SensorReadingCache(thingspeak, ttl=10, max_stale=300)
+    first = cache.get()
+    second = cache.get()
+    assert thingspeak.calls == 1
+    assert first[0] == second[0] == READING and second[2] is False
+
+
+def test_concurrent_misses_share_one_upstream_read():
+    thingspeak = SlowThingSpeak()
+    cache = SensorReadingCache(thingspeak, ttl=10, max_stale=300)
+    results = get_concurrently(cache, thingspeak, 20)
+    assert thingspeak.calls == 1
+    assert all(reading == READING and stale is False for reading, _, stale in results)
+
+
+def test_waiters_share_a_failed_read_instead_of_retrying():
+    thingspeak = SlowThingSpeak(result=None)
+    cache = SensorReadingCache(thingspeak, ttl=10, max_stale=300)
+    results = get_concurrently(cache, thingspeak, 10)
+    assert thingspeak.calls == 1
+    assert results == [(None, None, False)] * 10
+
+
+def test_failed_refresh_falls_back_to_a_stale_reading():
+    thingspeak = SlowThingSpeak()
+    thingspeak.release.set()
+    cache = SensorReadingCache(thingspeak, ttl=10, max_stale=300)
+    cache.get()
+    age_by(cache, 60)
+    thingspeak.result = None
+    reading, age, stale = cache.get()
+    assert thingspeak.calls == 2
+    assert reading == READING and stale is True and age == pytest.approx(60, abs=1)
+
+
+def test_readings_past_max_stale_are_not_served():
+    thingspeak = SlowThingSpeak()
+    thingspeak.release.set()
+    cache = SensorReadingCache(thingspeak, ttl=10, max_stale=300)
+    cache.get()
+    age_by(cache, 301)
+    thingspeak.result = None
+    assert cache.get() == (None, None, False)
+
+
+def test_only_changed_readings_are_published(published):
+    cache = SensorReadingCache(SlowThingSpeak(), zone_id="north")
+    cache.store(READING)
+    cache.store(dict(READING))
+    cache.store(dict(READING, soil_moisture=38.0))
+    assert [(kind, payload["zone"], payload["soil_moisture"]) for kind, payload in published] == [
+        ("reading", "north", 41.0), ("reading", "north", 38.0)]
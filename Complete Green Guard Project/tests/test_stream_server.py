@@ -0,0 +1,66 @@
+import asyncio
+
+import pytest
+from aiohttp.test_utils import TestClient, TestServer
+
+from events import EventBroker
+from stream_server import create_stream_app
+
+
+@pytest.fixture
+def db(tmp_path):
+    return str(tmp_path / "events.db")
+
+
+async def serve(broker, check):
+    client = TestClient(TestServer(create_stream_app(broker=broker, heartbeat=0.2, poll_readings=False)))
+    await client.start_server()
+    try:
+        await check(client)
+    finally:
+        await client.close()
+
+
+async def read_frame(response):
+    lines = []
+    while True:
+        line = (await asyncio.wait_for(response.content.readline(), 2)).decode().rstrip("\n")
+        if not line:
+            return lines
+        lines.append(line)
+
+
+def test_clients_receive_events_published_by_another_process(db):
+    stream, controller = EventBroker(db), EventBroker(db)
+
+    async def check(client):
+        response = await client.get("/stream", params={"events": "decision"})
+        assert response.headers["Content-Type"] == "text/event-stream"
+        assert (await read_frame(response))[0].startswith("retry:")
+        controller.publish("reading", {"zone": "a"})
+        event_id = controller.publish("decision", {"zone": "a", "water_amount": 3.5})
+        frame = await read_frame(response)
+        while frame[0].startswith(": keepalive"):
+            frame = await read_frame(response)
+        assert frame[:2] == [f"id: {event_id}", "event: decision"]
+        response.close()
+
+    asyncio.run(serve(stream, check))
+
+
+def test_clients_past_the_cap_get_503(db):
+    stream = EventBroker(db, max_clients=1)
+
+    async def check(client):
+        first = await client.get("/stream")
+        second = await client.get("/stream")
+        assert second.status == 503
+        first.close()
+        # The server notices the disconnect on its next heartbeat and frees the slot
+        for _ in range(20):
+            await asyncio.sleep(0.1)
+            if not stream._subscribers:
+                break
+        assert not stream._subscribers
+
+    asyncio.run(serve(stream, check))
@@ -13,6 +13,7 @@ import requests
 import time
 from datetime import datetime
 import os
+import sys
 import smtplib
 from email.message import EmailMessage
 import json
@@ -149,9 +150,9 @@ class ThingSpeakInterface:
 
 # Model training and management
 class IrrigationModel:
-    def __init__(self, model_path="water_prediction_model.pkl"):
+    def __init__(self, model_path="water_prediction_model.pkl", auto_load=True):
         self.model_path = model_path
-        self.model = self.load_or_train_model()
+        self.model = self.load_or_train_model() if auto_load else None
     
     def load_or_train_model(self):
         """Load existing model or train a new one if not available"""
@@ -162,7 +163,7 @@ class IrrigationModel:
             print("Training new irrigation model...")
             return self.train_new_model()
     
-    def train_new_model(self):
+    def train_new_model(self, verify=False):
         """Train a new RandomForest model for irrigation prediction"""
         np.random.seed(42)
         num_samples = 1000  # Increased sample size
@@ -193,7 +194,7 @@ class IrrigationModel:
         X = df[["soil_moisture", "temperature", "humidity", "rainfall_1d", "rainfall_3d", "raindrop"]]
         y = df["water_needed"]
         
-        model = RandomForestRegressor(n_estimators=100, random_state=42)
+        model = RandomForestRegressor(n_estimators=100, random_state=42, n_jobs=-1)
         model.fit(X, y)
         
         # Print feature importance
@@ -206,12 +207,14 @@ class IrrigationModel:
         try:
             joblib.dump(model, self.model_path, compress=3)
             print(f"✅ Model successfully saved to {self.model_path}")
-            # Verify the saved model
-            loaded_model = joblib.load(self.model_path)
-            print(f"✅ Model verification successful: {type(loaded_model)}")
+            if verify:
+                # Reload the saved model as a sanity check (opt-in; it doubles the I/O)
+                loaded_model = joblib.load(self.model_path)
+                print(f"✅ Model verification successful: {type(loaded_model)}")
         except Exception as e:
             print(f"❌ Error saving model: {e}")
         print(f"Model trained and saved to {self.model_path}")
+        self.model = model
         return model
     
     def predict(self, features):
@@ -542,10 +545,11 @@ class IrrigationController:
                 time.sleep(60)  # Wait before retrying
 
 if __name__ == "__main__":
-    # Force train a new model
-    model = IrrigationModel()
+    # Force train a new model (without loading or training one first)
+    # For training on logged decisions see train_pipeline.py
+    model = IrrigationModel(auto_load=False)
     print("Training new model...")
-    model.train_new_model()
+    model.train_new_model(verify="--verify" in sys.argv)
     print("Model training completed. Testing prediction...")
     
     # Test the model with sample data
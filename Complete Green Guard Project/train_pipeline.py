@@ -0,0 +1,234 @@
+import os
+import sys
+import glob
+import json
+import time
+import logging
+import argparse
+import resource
+
+import numpy as np
+import pandas as pd
+import joblib
+from sklearn.ensemble import RandomForestRegressor
+
+from log_index import log_segments
+from columnar_log import ColumnarLog
+from forest_compiler import COMPILED_MODEL_PATH, export_artifact
+from model_manager import ModelManager
+
+# Same order as irrigation_controller.FEATURE_COLUMNS
+FEATURE_COLUMNS = ["soil_moisture", "temperature", "humidity", "rainfall_1d", "rainfall_3d", "raindrop"]
+# The model predicts the need before the rainfall adjustment. Its logged value is only the
+# model's own output, so each automatic decision is labelled by the soil's response instead:
+# see outcome_labels()
+TARGET_COLUMN = "water_needed"
+# The next reading in the same log must follow a decision within this many seconds to label it
+LABEL_HORIZON = int(os.getenv("LABEL_HORIZON", "900"))
+LABEL_COLUMNS = ["timestamp"] + FEATURE_COLUMNS + [TARGET_COLUMN, "crop_type", "is_manual"]
+TRAIN_CHUNK_ROWS = 200_000
+# Rows beyond this are reservoir-sampled, so memory stays bounded however long the logs are
+TRAIN_MAX_ROWS = int(os.getenv("TRAIN_MAX_ROWS", "2000000"))
+MIN_TRAINING_ROWS = 50
+# Leaves this small still fit the data; fully grown trees on millions of rows bloat the model
+MIN_SAMPLES_LEAF = 5
+TRAINING_REPORT = "training_report.json"
+
+
+def default_logs():
+    logs = ["irrigation_log.csv"] + sorted(glob.glob(os.path.join(os.getenv("ZONE_LOG_DIR", "logs"), "*.csv")))
+    # Rotated segments are picked up through their active log, not listed twice
+    return [path for path in logs if os.path.splitext(os.path.splitext(path)[0])[1] == ""]
+
+
+def segment_columns(path):
+    with open(path) as f:
+        return f.readline().strip().split(",")
+
+
+def outcome_labels(frame, crop_profiles, horizon=LABEL_HORIZON):
+    """Label the automatic decisions of one time-ordered log by the soil's response.
+
+    The label is the logged water_needed plus (ideal_moisture - soil_moisture
+    at the next reading) * water_per_percent for the row's crop, clipped to
+    [0, max_water]: a decision that left the soil short is labelled higher,
+    one that overshot lower. Returns timestamp, features and the label as
+    TARGET_COLUMN. Manual requests, unknown crops, rows without water_needed
+    and decisions with no next reading within ``horizon`` seconds (including
+    the last row) are dropped.
+    """
+    timestamps = pd.to_datetime(frame["timestamp"])
+    gap = (timestamps.shift(-1) - timestamps).dt.total_seconds()
+    crops = frame["crop_type"].astype(str)
+    profile = {key: crops.map({crop: values[key] for crop, values in crop_profiles.items()})
+               for key in ("ideal_moisture", "water_per_percent", "max_water")}
+    shortfall = profile["ideal_moisture"] - frame["soil_moisture"].shift(-1)
+    target = (frame[TARGET_COLUMN] + shortfall * profile["water_per_percent"]).clip(lower=0,
+                                                                                    upper=profile["max_water"])
+    keep = (frame["is_manual"] == 0) & (gap <= horizon) & target.notna()
+    labelled = frame.loc[keep, FEATURE_COLUMNS].assign(**{TARGET_COLUMN: target[keep]})
+    labelled.insert(0, "timestamp", timestamps[keep])
+    return labelled
+
+
+def iter_log_frames(log_path, chunk_rows=TRAIN_CHUNK_ROWS):
+    """Yield LABEL_COLUMNS DataFrames of a log in time order, from the columnar copy when there is one."""
+    columnar = ColumnarLog(log_path)
+    if columnar.exists():
+        for records in columnar.records():
+            for start in range(0, len(records), chunk_rows):
+                part = records[start:start + chunk_rows]
+                frame = pd.DataFrame({name: part[name] for name in FEATURE_COLUMNS + [TARGET_COLUMN, "is_manual"]})
+                frame.insert(0, "timestamp", pd.to_datetime(part["timestamp"], unit="s"))
+                frame["crop_type"] = columnar.dictionary.categorical("crop_type", part["crop_type"])
+                yield frame[LABEL_COLUMNS]
+        return
+    dtypes = {name: np.float32 for name in FEATURE_COLUMNS + [TARGET_COLUMN]}
+    for segment in log_segments(log_path):
+        if TARGET_COLUMN not in segment_columns(segment):
+            logging.info(f"Skipping {segment}: logged before {TARGET_COLUMN} was recorded")
+            continue
+        yield from pd.read_csv(segment, usecols=LABEL_COLUMNS, dtype=dtypes, chunksize=chunk_rows)
+
+
+def iter_chunks(log_path, crop_profiles, chunk_rows=TRAIN_CHUNK_ROWS):
+    """Yield (X, y) float32 blocks of a log's automatic decisions and their outcome labels."""
+    previous = None
+    for frame in iter_log_frames(log_path, chunk_rows):
+        if previous is not None:
+            # The last row of the previous chunk is labelled by this chunk's first reading
+            frame = pd.concat([previous, frame], ignore_index=True)
+        previous = frame.tail(1)
+        labelled = outcome_labels(frame.reset_index(drop=True), crop_profiles)
+        yield (labelled[FEATURE_COLUMNS].to_numpy(dtype=np.float32),
+               labelled[TARGET_COLUMN].to_numpy(dtype=np.float32))
+
+
+class Reservoir:
+    """Fixed-size uniform sample over a stream of (X, y) blocks (Algorithm R, vectorised)."""
+
+    def __init__(self, capacity, n_features, seed=42):
+        self.capacity = capacity
+        self.X = np.empty((capacity, n_features), dtype=np.float32)
+        self.y = np.empty(capacity, dtype=np.float32)
+        self.seen = 0
+        self.rng = np.random.default_rng(seed)
+
+    def add(self, X, y):
+        n = len(y)
+        fill = min(n, max(0, self.capacity - self.seen))
+        if fill:
+            self.X[self.seen:self.seen + fill] = X[:fill]
+            self.y[self.seen:self.seen + fill] = y[:fill]
+        if fill < n:
+            # Row t (0-based, overall) replaces a random slot with probability capacity / (t + 1)
+            positions = np.arange(self.seen + fill, self.seen + n)
+            slots = (self.rng.random(n - fill) * (positions + 1)).astype(np.int64)
+            keep = slots < self.capacity
+            self.X[slots[keep]] = X[fill:][keep]
+            self.y[slots[keep]] = y[fill:][keep]
+        self.seen += n
+
+    def arrays(self):
+        size = min(self.seen, self.capacity)
+        return self.X[:size], self.y[:size]
+
+
+def peak_memory_mb():
+    # ru_maxrss is in KB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def train_from_logs(log_paths, crop_profiles, output_path="water_model.pkl", n_estimators=100,
+                    max_rows=TRAIN_MAX_ROWS,
+                    chunk_rows=TRAIN_CHUNK_ROWS, validation_fraction=0.1, n_jobs=-1, verify=False,
+                    min_samples_leaf=MIN_SAMPLES_LEAF, compiled_path=COMPILED_MODEL_PATH, register=True):
+    """Fit a forest on the logged decisions' outcome labels and save it; returns (model, report).
+
+    With ``register`` the model also becomes the current version in the model registry.
+    """
+    started = time.perf_counter()
+    reservoir = Reservoir(max_rows, len(FEATURE_COLUMNS))
+    for log_path in log_paths:
+        if not os.path.exists(log_path) and not ColumnarLog(log_path).exists():
+            logging.warning(f"Skipping missing log {log_path}")
+            continue
+        for X, y in iter_chunks(log_path, crop_profiles, chunk_rows):
+            reservoir.add(X, y)
+    X, y = reservoir.arrays()
+    if len(y) < MIN_TRAINING_ROWS:
+        raise ValueError(f"Only {len(y)} labelled decisions found; need at least {MIN_TRAINING_ROWS}")
+    load_seconds = time.perf_counter() - started
+
+    rng = np.random.default_rng(42)
+    validation = rng.random(len(y)) < validation_fraction
+    fit_started = time.perf_counter()
+    model = RandomForestRegressor(n_estimators=n_estimators, min_samples_leaf=min_samples_leaf, n_jobs=n_jobs,
+                                  random_state=42)
+    model.fit(pd.DataFrame(X[~validation], columns=FEATURE_COLUMNS), y[~validation])
+    fit_seconds = time.perf_counter() - fit_started
+
+    errors = model.predict(pd.DataFrame(X[validation], columns=FEATURE_COLUMNS)) - y[validation]
+    validation_mae = float(np.abs(errors).mean()) if len(errors) else None
+    validation_rmse = float(np.sqrt((errors ** 2).mean())) if len(errors) else None
+    joblib.dump(model, output_path, compress=3)
+    model_version = None
+    if register:
+        model_version = ModelManager().save_model(
+            model, metrics={"validation_mae": validation_mae, "validation_rmse": validation_rmse},
+            source="train_pipeline")
+    export_artifact(model, compiled_path, model_version=model_version)
+    if verify:
+        joblib.load(output_path)
+
+    report = {
+        "logs": list(log_paths),
+        "rows_seen": int(reservoir.seen),
+        "rows_used": int(len(y)),
+        "train_rows": int((~validation).sum()),
+        "validation_rows": int(validation.sum()),
+        "validation_mae": validation_mae,
+        "validation_rmse": validation_rmse,
+        "n_estimators": n_estimators,
+        "min_samples_leaf": min_samples_leaf,
+        "node_count": int(sum(tree.tree_.node_count for tree in model.estimators_)),
+        "n_jobs": n_jobs,
+        "load_seconds": round(load_seconds, 3),
+        "fit_seconds": round(fit_seconds, 3),
+        "wall_seconds": round(time.perf_counter() - started, 3),
+        "peak_memory_mb": round(peak_memory_mb(), 1),
+        "output": output_path,
+        "model_version": model_version,
+    }
+    logging.info(f"Trained on {report['train_rows']} rows in {report['fit_seconds']}s, "
+                 f"validation MAE {report['validation_mae']}")
+    return model, report
+
+
+if __name__ == "__main__":
+    from irrigation_controller import CROP_PROFILES
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    parser = argparse.ArgumentParser(description="Train the irrigation model on logged decisions")
+    parser.add_argument("logs", nargs="*", help="decision logs (default: irrigation_log.csv and logs/*.csv)")
+    parser.add_argument("--output", default="water_model.pkl")
+    parser.add_argument("--trees", type=int, default=100)
+    parser.add_argument("--min-samples-leaf", type=int, default=MIN_SAMPLES_LEAF)
+    parser.add_argument("--max-rows", type=int, default=TRAIN_MAX_ROWS)
+    parser.add_argument("--chunk-rows", type=int, default=TRAIN_CHUNK_ROWS)
+    parser.add_argument("--validation", type=float, default=0.1)
+    parser.add_argument("--jobs", type=int, default=-1)
+    parser.add_argument("--verify", action="store_true", help="reload the saved model as a check")
+    parser.add_argument("--report", default=TRAINING_REPORT)
+    parser.add_argument("--no-register", action="store_true", help="don't make the model the current version")
+    args = parser.parse_args()
+
+    _, report = train_from_logs(args.logs or default_logs(), CROP_PROFILES, output_path=args.output,
+                                n_estimators=args.trees,
+                                max_rows=args.max_rows, chunk_rows=args.chunk_rows,
+                                validation_fraction=args.validation, n_jobs=args.jobs, verify=args.verify,
+                                min_samples_leaf=args.min_samples_leaf, register=not args.no_register)
+    with open(args.report, "w") as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(report, indent=2))
@@ -0,0 +1,232 @@
+import os
+import atexit
+import sqlite3
+import threading
+from datetime import datetime
+
+HISTORY_DB = os.getenv("HISTORY_DB", "irrigation_history.db")
+DEFAULT_ZONE = "default"
+# Rows are buffered and written with one executemany per batch
+HISTORY_BATCH_SIZE = int(os.getenv("HISTORY_BATCH_SIZE", "100"))
+HISTORY_FLUSH_INTERVAL = float(os.getenv("HISTORY_FLUSH_INTERVAL", "0.5"))
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+# Development only: fill an empty database with the demo rows below
+HISTORY_SEED_SAMPLE = os.getenv("HISTORY_SEED_SAMPLE", "0") == "1"
+
+# Demo rows the dashboard showed before history was persisted
+SAMPLE_HISTORY = [
+    {"date": "2025-02-21", "actual_water": 55, "predicted_water": 52},
+    {"date": "2025-02-22", "actual_water": 42, "predicted_water": 40},
+    {"date": "2025-02-23", "actual_water": 38, "predicted_water": 35},
+    {"date": "2025-02-24", "actual_water": 50, "predicted_water": 48},
+    {"date": "2025-02-25", "actual_water": 45, "predicted_water": 42},
+]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS irrigation_history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    date TEXT NOT NULL,
+    zone TEXT NOT NULL DEFAULT 'default',
+    actual_water REAL NOT NULL,
+    predicted_water REAL NOT NULL,
+    created_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_history_date ON irrigation_history (date);
+CREATE INDEX IF NOT EXISTS idx_history_zone_date ON irrigation_history (zone, date);
+"""
+
+
+def encode_cursor(row):
+    return f"{row['date']}|{row['id']}"
+
+
+def decode_cursor(cursor):
+    """Split a 'date|id' cursor; raises ValueError if it is malformed."""
+    date, _, row_id = cursor.rpartition("|")
+    if not date:
+        raise ValueError(f"Invalid cursor: {cursor}")
+    return date, int(row_id)
+
+
+class HistoryStore:
+    """Irrigation history in an embedded SQLite database.
+
+    The database runs in WAL mode so every gunicorn worker can read while
+    another writes. Inserts are buffered and committed in batches by a
+    background thread; a query flushes this process's buffer first, so a
+    worker always sees its own writes. Pages are ordered newest first and
+    continued with a keyset cursor, so each page is one index range scan
+    regardless of table size.
+    """
+
+    def __init__(self, path=HISTORY_DB, batch_size=HISTORY_BATCH_SIZE,
+                 flush_interval=HISTORY_FLUSH_INTERVAL, seed=HISTORY_SEED_SAMPLE):
+        self.path = os.path.abspath(path)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._pending = []
+        self._wake = threading.Event()
+        self._closed = False
+        self._init_db(seed)
+        self._flusher = threading.Thread(target=self._flush_loop, name="history-flush", daemon=True)
+        self._flusher.start()
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _init_db(self, seed):
+        conn = self._connect()
+        conn.executescript(SCHEMA)
+        if not seed:
+            return
+        # Check and insert under one write lock, so workers starting together seed once
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if conn.execute("SELECT 1 FROM irrigation_history LIMIT 1").fetchone() is None:
+                self._insert(conn, [self._row(record) for record in SAMPLE_HISTORY])
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+
+    @staticmethod
+    def _row(record, zone=None):
+        return (
+            record.get("date") or datetime.now().strftime("%Y-%m-%d"),
+            str(zone or record.get("zone") or DEFAULT_ZONE),
+            float(record.get("actual_water", 0)),
+            float(record.get("predicted_water", record.get("actual_water", 0))),
+            datetime.now().isoformat(timespec="seconds"),
+        )
+
+    @staticmethod
+    def _insert(conn, rows):
+        conn.executemany(
+            "INSERT INTO irrigation_history (date, zone, actual_water, predicted_water, created_at) "
+            "VALUES (?, ?, ?, ?, ?)", rows)
+
+    def add(self, record, zone=None, commit=False):
+        """Queue one irrigation record for the next batch insert.
+
+        With ``commit=True`` the record is written, along with anything already
+        queued, before this returns; if that fails it is not kept for a retry.
+        """
+        row = self._row(record, zone)
+        with self._lock:
+            if self._closed:
+                raise ValueError(f"History store {self.path} is closed")
+            if commit:
+                self._flush_locked([row])
+                return
+            self._pending.append(row)
+            full = len(self._pending) >= self.batch_size
+        if full:
+            self._wake.set()
+
+    def flush(self):
+        """Write all queued records in one transaction."""
+        with self._lock:
+            return self._flush_locked()
+
+    def _flush_locked(self, extra=()):
+        queued, self._pending = self._pending, []
+        rows = queued + list(extra)
+        if not rows:
+            return 0
+        conn = self._connect()
+        try:
+            with conn:
+                self._insert(conn, rows)
+        except sqlite3.Error:
+            # Keep the queued rows so the next flush retries them
+            self._pending = queued + self._pending
+            raise
+        return len(rows)
+
+    def _flush_loop(self):
+        while not self._closed:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Error writing irrigation history: {e}")
+
+    def query(self, limit=DEFAULT_PAGE_SIZE, since=None, until=None, zone=None, cursor=None):
+        """Return (records, next_cursor) for one page, newest first.
+
+        ``since``/``until`` are inclusive YYYY-MM-DD bounds; ``cursor`` is the
+        ``next_cursor`` of the previous page.
+        """
+        self.flush()
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+        clauses = []
+        params = []
+        if zone is not None:
+            clauses.append("zone = ?")
+            params.append(str(zone))
+        if since is not None:
+            clauses.append("date >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("date <= ?")
+            params.append(until)
+        if cursor is not None:
+            cursor_date, cursor_id = decode_cursor(cursor)
+            clauses.append("(date, id) < (?, ?)")
+            params.extend([cursor_date, cursor_id])
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        # Fetch one extra row to know whether another page exists
+        sql = (f"SELECT id, date, zone, actual_water, predicted_water FROM irrigation_history {where} "
+               f"ORDER BY date DESC, id DESC LIMIT ?")
+        rows = self._connect().execute(sql, params + [limit + 1]).fetchall()
+        records = [dict(row) for row in rows[:limit]]
+        next_cursor = encode_cursor(records[-1]) if len(rows) > limit else None
+        return records, next_cursor
+
+    def count(self):
+        self.flush()
+        return self._connect().execute("SELECT COUNT(*) FROM irrigation_history").fetchone()[0]
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            self._closed = True
+            self._wake.set()
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def open_history_store(path=HISTORY_DB, **kwargs):
+    """Return the process-wide store for ``path``, creating it on first use."""
+    key = os.path.abspath(path)
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None or store._closed:
+            store = HistoryStore(path, **kwargs)
+            _stores[key] = store
+        return store
+
+
+@atexit.register
+def close_all():
+    with _stores_lock:
+        stores = list(_stores.values())
+    for store in stores:
+        try:
+            store.close()
+        except Exception as e:
+            print(f"Error closing history store {store.path}: {e}")
@@ -15,6 +15,8 @@ import numpy as np
 import joblib
 from datetime import datetime
 import os
+import math
+from history_store import HISTORY_DB, DEFAULT_PAGE_SIZE, open_history_store
 
 # Create Flask app and enable CORS
 app = Flask(__name__)
@@ -37,14 +39,17 @@ except Exception as e:
     print("Using mock responses for now.")
     model = None
 
-# Sample irrigation history data (replace with database in production)
-irrigation_history = [
-    {"date": "2025-02-25", "actual_water": 45, "predicted_water": 42},
-    {"date": "2025-02-24", "actual_water": 50, "predicted_water": 48},
-    {"date": "2025-02-23", "actual_water": 38, "predicted_water": 35},
-    {"date": "2025-02-22", "actual_water": 42, "predicted_water": 40},
-    {"date": "2025-02-21", "actual_water": 55, "predicted_water": 52},
-]
+# Irrigation history lives in SQLite so it survives restarts and is shared by all workers
+history = open_history_store(HISTORY_DB)
+
+# Upper bound on readings accepted by a single /predict-batch request
+MAX_BATCH_SIZE = 1000
+
+def make_decision(predicted_water, rainfall_forecast):
+    """Build the human-readable decision message for a prediction"""
+    if rainfall_forecast > 20:
+        return f"💧 Less Water Needed: {predicted_water:.2f} liters (Rain forecasted)"
+    return f"💧 Recommended Water: {predicted_water:.2f} liters"
 
 @app.route('/predict', methods=['POST'])
 def predict():
@@ -70,10 +75,7 @@ def predict():
             rainfall_forecast = 32.61  # Example value
             
             # Create decision message
-            if rainfall_forecast > 20:
-                decision = f"💧 Less Water Needed: {predicted_water:.2f} liters (Rain forecasted)"
-            else:
-                decision = f"💧 Recommended Water: {predicted_water:.2f} liters"
+            decision = make_decision(predicted_water, rainfall_forecast)
         else:
             # Mock response if model is not available
             predicted_water = 10.05
@@ -95,13 +97,79 @@ def predict():
             'decision': f"Error: {str(e)}"
         }), 500
 
+@app.route('/predict-batch', methods=['POST'])
+def predict_batch():
+    """Predict irrigation needs for many readings with a single model call"""
+    try:
+        data = request.json
+        readings = data.get('readings', []) if isinstance(data, dict) else data
+        if not isinstance(readings, list):
+            return jsonify({'error': "'readings' must be a list"}), 400
+        if len(readings) > MAX_BATCH_SIZE:
+            return jsonify({'error': f'Batch too large (max {MAX_BATCH_SIZE} readings)'}), 400
+        
+        print(f"Received batch prediction request: {len(readings)} readings")
+        
+        # Validate each reading on its own so one bad item doesn't fail the batch
+        results = [None] * len(readings)
+        rows = []
+        row_index = []
+        for i, reading in enumerate(readings):
+            try:
+                if not isinstance(reading, dict):
+                    raise ValueError("Reading must be a JSON object")
+                soil_moisture = float(reading.get('soil_moisture', 30))
+                temperature = float(reading.get('temperature', 28))
+                # float() accepts "nan" and "inf"; reject them per item
+                if not (math.isfinite(soil_moisture) and math.isfinite(temperature)):
+                    raise ValueError("Sensor values must be finite numbers")
+            except (ValueError, TypeError) as e:
+                results[i] = {'error': str(e)}
+                continue
+            rows.append([soil_moisture, temperature])
+            row_index.append(i)
+        
+        # Calculate rainfall forecast (mock for now, replace with actual API call)
+        rainfall_forecast = 32.61  # Example value
+        
+        if rows:
+            if model is not None:
+                # One feature matrix, one model call for the whole batch
+                predictions = model.predict(np.array(rows, dtype=float))
+            else:
+                # Mock response if model is not available
+                predictions = [10.05] * len(rows)
+            
+            for i, predicted_water in zip(row_index, predictions):
+                predicted_water = float(predicted_water)
+                results[i] = {
+                    'predicted_water': predicted_water,
+                    'rainfall_forecast': rainfall_forecast,
+                    'decision': make_decision(predicted_water, rainfall_forecast)
+                }
+        
+        return jsonify({'results': results})
+    except Exception as e:
+        print(f"Error in batch prediction: {e}")
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/history', methods=['GET'])
 def get_history():
-    """Return irrigation history"""
+    """Return one page of irrigation history, newest first"""
     try:
+        records, next_cursor = history.query(
+            limit=request.args.get('limit', DEFAULT_PAGE_SIZE, type=int),
+            since=request.args.get('since'),
+            until=request.args.get('until'),
+            zone=request.args.get('zone'),
+            cursor=request.args.get('cursor'),
+        )
         return jsonify({
-            'history': irrigation_history
+            'history': records,
+            'next_cursor': next_cursor
         })
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         print(f"Error getting history: {e}")
         return jsonify({'error': str(e)}), 500
@@ -124,8 +192,8 @@ def start_irrigation():
             "predicted_water": data.get('predicted_water', water_amount)
         }
         
-        # Add to history (in a real app, save to database)
-        irrigation_history.insert(0, new_record)
+        # Committed before replying, so a success response means the record is stored
+        history.add(new_record, zone=data.get('zone'), commit=True)
         
         return jsonify({
             'status': 'success',
@@ -176,6 +244,7 @@ if __name__ == '__main__':
     print(f"  - GET  http://127.0.0.1:{port}/history")
     print(f"  - GET  http://127.0.0.1:{port}/sensor-data")
     print(f"  - POST http://127.0.0.1:{port}/predict")
+    print(f"  - POST http://127.0.0.1:{port}/predict-batch")
     print(f"  - POST http://127.0.0.1:{port}/start-irrigation")
     print(f"  - POST http://127.0.0.1:{port}/stop-irrigation")
     app.run(host='0.0.0.0', port=port, debug=True)